@@ -0,0 +1,161 @@
+"""
+Benchmark the optionstable directive on a large table.
+
+A class with the given number of options is generated, about a third of them with choices, and with
+descriptions that mix plain text, inline markup and lists. The table is built once with the batched
+parsing of the directive and once parsing each cell on its own, as it used to, and both must give the
+same doctree. The time to build the table is reported apart from the total time of the directive, which
+also includes reading the YAML file.
+
+Usage: python benchmarks/bench_optionstable.py [number of options]
+"""
+
+# Standard Python modules
+import io
+import os
+import sys
+import tempfile
+import time
+
+# External modules
+from docutils import nodes
+from docutils.statemachine import ViewList
+from sphinx.application import Sphinx
+
+# First party modules
+from sphinx_mdolab_theme.ext.optionstable import OptionsTable
+
+MODULE = """
+class Solver:
+    @staticmethod
+    def _getDefaultOptions():
+        return {{
+{options}
+        }}
+"""
+
+DOCUMENT = """
+Options
+=======
+
+.. optionstable:: bench_options.Solver
+
+.. optionstable-per-cell:: bench_options.Solver
+"""
+
+# time spent building each table, by directive name
+build_times = {}
+
+
+class TimedOptionsTable(OptionsTable):
+    """The directive, timing how long it takes to build the table, apart from reading the YAML file."""
+
+    def build_table(self):
+        start = time.perf_counter()
+        table = super().build_table()
+        build_times[self.name] = time.perf_counter() - start
+        return table
+
+
+class PerCellOptionsTable(TimedOptionsTable):
+    """The reference implementation, which parses each cell on its own."""
+
+    @staticmethod
+    def is_simple_list(desc, items):
+        return False
+
+    def parse_cells(self, cells):
+        entries = []
+        for value in cells:
+            entry = nodes.entry()
+            self.state.nested_parse(ViewList(value.split("\n")), 0, entry)
+            entries.append(entry)
+        return entries
+
+
+def make_options(n_options):
+    """Return the default options, in the form of the module source, and their descriptions as YAML."""
+    # the type, as source code, and the default value of each option
+    options = {}
+    yaml_lines = []
+    for i in range(n_options):
+        name = "option%d" % i
+        kind = i % 6
+        if kind == 0:
+            options[name] = ("float", 1e-6 * i)
+            yaml_lines.append("%s:\n  desc: The tolerance of solver %d." % (name, i))
+        elif kind == 1:
+            options[name] = ("str", ["newton", "broyden", "nlbgs"])
+            yaml_lines.append("%s:\n  desc: |\n    The *method* used, see :py:data:`option0`." % name)
+            yaml_lines.append("  newton: Newton's method.")
+            yaml_lines.append("  broyden: Broyden's method, with ``restart``.")
+            yaml_lines.append("  nlbgs: Nonlinear block Gauss-Seidel.")
+        elif kind == 2:
+            options[name] = ("int", i)
+            yaml_lines.append("%s:\n  desc: plain words only" % name)
+        elif kind == 3:
+            options[name] = ("bool", True)
+            yaml_lines.append("%s:\n  desc: |\n    Whether to:\n\n    - do this\n    - and that" % name)
+        elif kind == 4:
+            options[name] = ("(int, float)", 2)
+            yaml_lines.append("%s:\n  desc: A number, **in** meters." % name)
+        else:
+            options[name] = ("str", "./output")
+            yaml_lines.append("%s:\n  desc: The ``output`` directory." % name)
+
+    module = MODULE.format(
+        options="\n".join(
+            "            %r: [%s, %r]," % (name, kind, default) for name, (kind, default) in options.items()
+        )
+    )
+    return module, "\n".join(yaml_lines) + "\n"
+
+
+def build(root):
+    """Build the project and return the two tables and the time spent in each directive."""
+    doc_dir = os.path.join(root, "doc")
+    out_dir = os.path.join(root, "build")
+    app = Sphinx(doc_dir, doc_dir, out_dir, os.path.join(out_dir, ".doctrees"), "html", status=io.StringIO())
+    app.add_directive("optionstable", TimedOptionsTable, override=True)
+    app.add_directive("optionstable-per-cell", PerCellOptionsTable)
+    app.build()
+
+    walls = {}
+    for record in app.env.mdolab_directive_timings["index"]:
+        walls[record["directive"]] = record["wall"]
+    tables = list(app.env.get_doctree("index").findall(nodes.table))
+    return tables, walls
+
+
+def main():
+    n_options = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    with tempfile.TemporaryDirectory(prefix="bench_optionstable_") as root:
+        doc_dir = os.path.join(root, "doc")
+        os.makedirs(doc_dir)
+        module, yaml = make_options(n_options)
+        with open(os.path.join(root, "bench_options.py"), "w") as f:
+            f.write(module)
+        with open(os.path.join(doc_dir, "options.yaml"), "w") as f:
+            f.write(yaml)
+        with open(os.path.join(doc_dir, "conf.py"), "w") as f:
+            f.write('extensions = ["sphinx_mdolab_theme.ext.optionstable"]\n')
+        with open(os.path.join(doc_dir, "index.rst"), "w") as f:
+            f.write(DOCUMENT)
+        sys.path.insert(0, root)
+
+        (batched, per_cell), walls = build(root)
+
+    print("%d options                table   directive" % n_options)
+    for label, name in [("batched", "optionstable"), ("per cell", "optionstable-per-cell")]:
+        print("  %-20s %8.3f s  %8.3f s" % (label, build_times[name], walls[name]))
+    print("  speedup              %8.1fx" % (build_times["optionstable-per-cell"] / build_times["optionstable"]))
+
+    # the ids of the tables are generated in the order they are parsed
+    batched["ids"] = per_cell["ids"] = []
+    if batched.pformat() != per_cell.pformat():
+        sys.exit("The batched table differs from the one parsed cell by cell.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark replace_asserts_with_prints on large test methods.
+
+The RedBaron based implementation that it replaced is timed as well when redbaron is installed,
+and its output is checked against the new implementation.
+
+Usage: python benchmarks/bench_replace_asserts.py [number of asserts ...]
+"""
+
+# Standard Python modules
+import sys
+import timeit
+
+# First party modules
+from sphinx_mdolab_theme.utils.docutil import replace_asserts_with_prints
+
+TEMPLATES = [
+    "prob.run_model()",
+    "self.assertEqual(prob['x%d'], 3.0)",
+    "self.assertTrue(prob['y%d'] > 0.0)",
+    "assert_near_equal(prob.get_val('z%d'), [1.0, 2.0], 1e-6)",
+    "assert_almost_equal(prob['w%d'], 4.0)",
+    "assert_rel_error(self, prob['v%d'], 5.0, 1e-8)",
+    "assert_near_equal(\n    prob.get_val('u%d'),\n    np.array([1.0, 2.0]),\n    1e-6,\n)",
+    "print(prob['t%d'])",
+]
+
+
+def make_test_method(n_asserts):
+    """Build the body of a test method with roughly n_asserts assert calls."""
+    lines = []
+    for i in range(n_asserts):
+        template = TEMPLATES[i % len(TEMPLATES)]
+        lines.append(template % i if "%d" in template else template)
+    return "\n".join(lines) + "\n"
+
+
+def redbaron_replace_asserts_with_prints(src):
+    """The original RedBaron based implementation, for reference."""
+    # External modules
+    from redbaron import RedBaron
+
+    def remove_redbaron_node(node, index):
+        try:
+            node.value.remove(node.value[index])
+        except Exception as e:
+            if not str(e).startswith("It appears that you have indentation in your CommaList"):
+                raise
+
+    rb = RedBaron(src)
+    base_assert = [
+        "assertAlmostEqual",
+        "assertLess",
+        "assertGreater",
+        "assertEqual",
+        "assert_equal_arrays",
+        "assertTrue",
+        "assertFalse",
+    ]
+    for assert_type in [item for item in base_assert if item in src]:
+        for assert_node in rb.findAll("NameNode", value=assert_type):
+            assert_node = assert_node.parent
+            remove_redbaron_node(assert_node, 0)
+            assert_node.value[0].replace("print")
+            if assert_type not in ["assertTrue", "assertFalse"]:
+                remove_redbaron_node(assert_node.value[1], 1)
+
+    for name, nargs in [("assert_rel_error", 4), ("assert_near_equal", 3), ("assert_almost_equal", 3)]:
+        if name not in src:
+            continue
+        for assert_node in rb.findAll("NameNode", value=name):
+            assert_node = assert_node.parent
+            if len(assert_node.value[1]) == nargs:
+                remove_redbaron_node(assert_node.value[1], -1)
+            remove_redbaron_node(assert_node.value[1], -1)
+            if name == "assert_rel_error":
+                remove_redbaron_node(assert_node.value[1], 0)
+            assert_node.value[0].replace("print")
+
+    return rb.dumps()
+
+
+def main(sizes):
+    try:
+        # External modules
+        import redbaron  # noqa: F401
+
+        have_redbaron = True
+    except ImportError:
+        have_redbaron = False
+        print("redbaron is not installed, only timing the new implementation")
+
+    print("%8s %12s %14s %9s" % ("asserts", "new (ms)", "redbaron (ms)", "speedup"))
+    for n in sizes:
+        src = make_test_method(n)
+        number = 5
+        t_new = timeit.timeit(lambda: replace_asserts_with_prints(src), number=number) / number
+
+        if have_redbaron:
+            expected = redbaron_replace_asserts_with_prints(src)
+            if replace_asserts_with_prints(src) != expected:
+                print("WARNING: outputs differ for %d asserts" % n)
+            t_old = timeit.timeit(lambda: redbaron_replace_asserts_with_prints(src), number=1)
+            print("%8d %12.2f %14.2f %8.0fx" % (n, t_new * 1e3, t_old * 1e3, t_old / t_new))
+        else:
+            print("%8d %12.2f %14s %9s" % (n, t_new * 1e3, "-", "-"))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10, 100, 500])
@@ -0,0 +1,194 @@
+"""
+Stress test parallel builds of the directives that run code.
+
+A synthetic project is generated in a temporary directory, with documents that embed code (output,
+interleaved output and plots), shell commands and comparisons. The snippets write and read back files
+with the same names in their working directory, so that runs which share a directory clash. The project
+is built serially and in parallel, with the execution cache off, and every HTML page and image of the
+two builds must be identical.
+
+Usage: python benchmarks/stress_parallel_build.py [number of documents] [number of parallel processes]
+"""
+
+# Standard Python modules
+import filecmp
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+
+TEST_MODULE = """
+import unittest
+
+
+class TestStress(unittest.TestCase):
+    def test_files(self):
+        import time
+
+        with open("stress_data.txt", "w") as f:
+            f.write("written by document {n}")
+        time.sleep(0.05)
+        with open("stress_data.txt") as f:
+            print(f.read())
+
+    def test_interleave(self):
+        import os
+
+        total = 0
+        for i in range({n} + 3):
+            total += i
+        print(total)
+        print(sorted(os.listdir(".")) == sorted(set(os.listdir("."))))
+        self.assertGreater(total, -1)
+
+    def test_plot(self):
+        import matplotlib
+
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+
+        plt.plot([0, 1, 2], [{n}, 0, {n}])
+        plt.figure()
+        plt.plot([0, 1, 2], [0, {n}, 0])
+        plt.show()
+"""
+
+DOCUMENT = """
+Document {n}
+============
+
+.. embed-code::
+    stress_pkg.test_doc{n}.TestStress.test_files
+    :layout: code, output
+
+.. embed-code::
+    stress_pkg.test_doc{n}.TestStress.test_interleave
+    :layout: interleave
+
+.. embed-code::
+    stress_pkg.test_doc{n}.TestStress.test_plot
+    :layout: code, plot
+
+.. embed-compare::
+    stress_pkg.test_doc{n}.TestStress.test_interleave
+    total
+    print(total)
+
+.. embed-shell-cmd::
+    :cmd: python -c print({n}*{n})
+    :dir: {pkg_dir}
+"""
+
+CONF = """
+extensions = [
+    "sphinx_mdolab_theme.ext.embed_code",
+    "sphinx_mdolab_theme.ext.embed_compare",
+    "sphinx_mdolab_theme.ext.embed_shell_cmd",
+]
+embed_code_cache = False
+"""
+
+
+def make_project(root, n_docs):
+    """Write the package with the embedded tests and the documents that use them."""
+    pkg_dir = os.path.join(root, "stress_pkg")
+    doc_dir = os.path.join(root, "doc")
+    os.makedirs(pkg_dir)
+    os.makedirs(doc_dir)
+
+    with open(os.path.join(pkg_dir, "__init__.py"), "w"):
+        pass
+    with open(os.path.join(doc_dir, "conf.py"), "w") as f:
+        f.write(CONF)
+
+    docnames = []
+    for n in range(n_docs):
+        with open(os.path.join(pkg_dir, "test_doc%d.py" % n), "w") as f:
+            f.write(TEST_MODULE.format(n=n))
+        with open(os.path.join(doc_dir, "doc%d.rst" % n), "w") as f:
+            f.write(DOCUMENT.format(n=n, pkg_dir=pkg_dir))
+        docnames.append("doc%d" % n)
+
+    with open(os.path.join(doc_dir, "index.rst"), "w") as f:
+        f.write("Stress test\n===========\n\n.. toctree::\n\n")
+        f.write(textwrap.indent("\n".join(docnames), "    "))
+        f.write("\n")
+
+    return doc_dir
+
+
+def build(root, doc_dir, name, jobs):
+    """Build the project into its own output and doctree directories, returning the output directory."""
+    out_dir = os.path.join(root, "build", name)
+    cmd = [
+        sys.executable,
+        "-m",
+        "sphinx",
+        "-b",
+        "html",
+        "-q",
+        "-j",
+        str(jobs),
+        "-d",
+        os.path.join(root, "build", name + "_doctrees"),
+        doc_dir,
+        out_dir,
+    ]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root, os.environ.get("PYTHONPATH", "")]))
+
+    start = time.perf_counter()
+    result = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    print("%-8s -j %-3d %8.2f s" % (name, jobs, time.perf_counter() - start))
+    if result.stdout.strip():
+        print(textwrap.indent(result.stdout.rstrip(), "    "))
+    if result.returncode:
+        sys.exit("The %s build failed." % name)
+
+    return out_dir
+
+
+def compare(serial_dir, parallel_dir):
+    """Return the files of the serial build that are missing from or differ in the parallel build."""
+    mismatches = []
+    for dirpath, _, fnames in os.walk(serial_dir):
+        rel_dir = os.path.relpath(dirpath, serial_dir)
+        # the build info and the search index don't depend on the directives
+        if rel_dir.startswith(("_static", "_sources")):
+            continue
+        for fname in fnames:
+            if not fname.endswith((".html", ".png")):
+                continue
+            rel_name = os.path.normpath(os.path.join(rel_dir, fname))
+            other = os.path.join(parallel_dir, rel_name)
+            if not os.path.isfile(other) or not filecmp.cmp(os.path.join(dirpath, fname), other, shallow=False):
+                mismatches.append(rel_name)
+    return sorted(mismatches)
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    with tempfile.TemporaryDirectory(prefix="stress_parallel_build_") as root:
+        doc_dir = make_project(root, n_docs)
+        serial_dir = build(root, doc_dir, "serial", 1)
+        parallel_dir = build(root, doc_dir, "parallel", jobs)
+
+        mismatches = compare(serial_dir, parallel_dir)
+        # the snippets must not leave files behind in the package they were run from
+        leftovers = sorted(set(os.listdir(os.path.join(root, "stress_pkg"))) - {"__init__.py", "__pycache__"})
+        leftovers = [fname for fname in leftovers if not fname.startswith("test_doc")]
+
+    for rel_name in mismatches:
+        print("differs: %s" % rel_name)
+    for fname in leftovers:
+        print("left behind: %s" % fname)
+    if mismatches or leftovers:
+        sys.exit(1)
+    print("%d documents identical in serial and parallel builds" % n_docs)
+
+
+if __name__ == "__main__":
+    main()
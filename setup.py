@@ -26,7 +26,11 @@ setup(
     entry_points={
         "sphinx.html_themes": [
             "sphinx_mdolab_theme = sphinx_mdolab_theme",
-        ]
+        ],
+        "console_scripts": [
+            "sphinx-mdolab-options = sphinx_mdolab_theme.utils.options_manifest:main",
+            "sphinx-mdolab-execd = sphinx_mdolab_theme.utils.execd:main",
+        ],
     },
     package_data={
         "sphinx_mdolab_theme": [
@@ -46,7 +50,6 @@ setup(
         "sphinxcontrib-autoprogram",
         "sphinxcontrib-bibtex",
         "sphinx-tabs",
-        "redbaron",
         "numpy",
     ],
     classifiers=[
@@ -1,8 +1,6 @@
 import os
 from datetime import datetime
 
-from .ext.optionslist import TEMP_FILE
-
 # -- Project information -----------------------------------------------------
 project_copyright = f"{datetime.now().year}, MDO Lab"  # noqa: A001
 author = "MDO Lab"
@@ -63,7 +61,9 @@ bibtex_bibfiles = []
 # directories to ignore when looking for source files.
 # This pattern also affects html_static_path and html_extra_path.
 exclude_patterns = [
-    TEMP_FILE,  # this is a temporary file used by the optionslist extension we exclude it here
+    # the optionslist extension no longer writes this temporary file, but doc trees built with earlier
+    # versions may still have it, and it must not be read as a document
+    "tmp.rst",
     "_build",
     "Thumbs.db",
     ".DS_Store",
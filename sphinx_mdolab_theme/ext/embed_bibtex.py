@@ -1,5 +1,5 @@
 # Standard Python modules
-import importlib
+import os
 
 # External modules
 from docutils import nodes
@@ -9,6 +9,15 @@ from sphinx.errors import SphinxError
 from sphinx.writers.html5 import HTML5Translator
 from sphinx.writers.html import HTMLTranslator
 
+# First party modules
+from ..utils.cache import ExecutionCache
+from ..utils.citation import get_cite
+from ..utils.instrument import instrumented
+from ..utils.source_index import find_local_dependencies
+
+# the persistent cache of citations, created when the builder is initialized
+_cite_cache = None
+
 
 class bibtex_node(nodes.Element):
     pass
@@ -37,6 +46,7 @@ def depart_bibtex_node(self, node):
     self.body.append(html)
 
 
+@instrumented
 class EmbedBibtexDirective(Directive):
     """
     EmbedBibtexDirective is a custom directive to allow a Bibtex citation to be embedded.
@@ -51,6 +61,9 @@ class EmbedBibtexDirective(Directive):
     What the above will do is replace the directive and its args with the Bibtex citation
     for the class.
 
+    The citation is found in the source of the class when possible, and otherwise by instantiating
+    the class in a new process. Either way, it is cached until the source of the module changes.
+
     """
 
     required_arguments = 2
@@ -59,18 +72,47 @@ class EmbedBibtexDirective(Directive):
 
     def run(self):
         module_path, class_name = self.arguments
-        mod = importlib.import_module(module_path)
-        obj = getattr(mod, class_name)()
-
-        if not hasattr(obj, "cite") or not obj.cite:
+        # the citation can come from the module or from the base classes and constants it imports, directly or not
+        for filename in find_local_dependencies(module_path):
+            self.state.document.settings.env.note_dependency(filename)
+        cite, error = get_cite(module_path, class_name, _cite_cache)
+
+        if error is not None:
+            raise SphinxError("Couldn't instantiate class '%s' to find its 'cite':\n%s" % (class_name, error))
+        if not cite:
             raise SphinxError("Couldn't find 'cite' in class '%s'" % class_name)
 
-        return [bibtex_node(text=obj.cite)]
+        return [bibtex_node(text=cite)]
+
+
+def init_cite_cache(app):
+    """Create the citation cache once the configuration is known."""
+    global _cite_cache
+
+    if app.config.embed_bibtex_cache:
+        cache_dir = app.config.embed_bibtex_cache_dir or os.path.join(app.doctreedir, "embed_bibtex_cache")
+        _cite_cache = ExecutionCache(os.path.join(app.confdir, cache_dir), app.config.embed_bibtex_cache_size)
+    else:
+        _cite_cache = None
+
+
+def prune_cite_cache(app, exception):
+    """Evict old entries from the citation cache."""
+    if _cite_cache is not None:
+        _cite_cache.prune()
 
 
 def setup(app):
     """add custom directive into Sphinx so that it is found during document parsing"""
+    app.setup_extension("sphinx_mdolab_theme.ext.timings")
     app.add_directive("embed-bibtex", EmbedBibtexDirective)
     app.add_node(bibtex_node, html=(visit_bibtex_node, depart_bibtex_node))
 
+    # persistent cache of citations
+    app.add_config_value("embed_bibtex_cache", True, "")
+    app.add_config_value("embed_bibtex_cache_dir", "", "")
+    app.add_config_value("embed_bibtex_cache_size", 16 * 1024**2, "")
+    app.connect("builder-inited", init_cite_cache)
+    app.connect("build-finished", prune_cite_cache)
+
     return {"version": sphinx.__display_version__, "parallel_read_safe": True}
@@ -1,7 +1,12 @@
 # Standard Python modules
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import glob
 import inspect
+import multiprocessing
 import os
 import re
+import tempfile
 import traceback
 import unittest
 
@@ -11,32 +16,71 @@ from docutils.parsers.rst import Directive
 from docutils.parsers.rst.directives import images, unchanged
 import sphinx
 from sphinx.errors import SphinxError
+from sphinx.util import logging
 
 # First party modules
+from ..utils.bounded_output import DEFAULT_LIMIT, DEFAULT_TAIL, configure_output_limit
+from ..utils.cache import ExecutionCache, execution_key, hash_text
+from ..utils.instrument import instrumented, note_cache
+from ..utils.source_index import begin_build, end_build, find_dependencies, find_local_dependencies, getsource
+from ..utils.execd import DEFAULT_IDLE_TIMEOUT, configure_execd
+from ..utils.general_utils import close_build_workdirs, configure_build_workdirs, in_build_workdir
+from ..utils.mpi_pool import close_mpi_jobs, configure_mpi_jobs
+from ..utils.plot_output import (
+    configure_plot_output,
+    depart_plot_image,
+    get_plot_output,
+    figure_files,
+    find_figures,
+    plot_image,
+    savefig_code,
+    visit_plot_image,
+    webp_supported,
+)
+from ..utils.worker_pool import DEFAULT_PRELOAD, close_pool, configure_pool
 from ..utils.docutil import (
     consolidate_input_blocks,
+    FunctionSource,
     dedent,
     extract_output_blocks,
+    failed_on_missing_dependency,
     get_interleaved_io_nodes,
     get_output_block_node,
     get_skip_output_node,
     get_source_code,
+    get_source_code_static,
     insert_output_start_stop_indicators,
+    mpi_procs,
     node_setup,
     remove_docstrings,
-    remove_initial_empty_lines,
-    replace_asserts_with_prints,
     run_code,
     split_source_into_input_blocks,
-    strip_decorators,
-    strip_header,
 )
 
-_plot_count = 0
+logger = logging.getLogger(__name__)
+
+# directory where the plot files are written, set when the builder is initialized
+_plot_dir = None
+
+# plot files are named after a hash of the code that draws them
+PLOT_FILE_PREFIX = "embed_code_plot_"
+
+# the persistent cache of execution results, created when the builder is initialized
+_execution_cache = None
+
+# results of the pre-execution pass, keyed on their execution key
+_preexecuted = {}
 
 plotting_functions = ["\.show\(", "partial_deriv_plot\("]
 
+# the pieces of code assembled for an embed-code directive
+PreparedCode = namedtuple(
+    "PreparedCode",
+    "source code_to_run module cls method is_test shows_plot self_code setup_code teardown_code mpl_import mpl_figure",
+)
+
 
+@instrumented
 class EmbedCodeDirective(Directive):
     """
     EmbedCodeDirective is a custom directive to allow blocks of
@@ -69,34 +113,23 @@ class EmbedCodeDirective(Directive):
     }
 
     def run(self):
-        global _plot_count
-
-        #
-        # error checking
-        #
-        allowed_layouts = set(["code", "output", "interleave", "plot"])
-
-        if "layout" in self.options:
-            layout = [s.strip() for s in self.options["layout"].split(",")]
-        else:
-            layout = ["code"]
-
-        if len(layout) > len(set(layout)):
-            raise SphinxError("No duplicate layout entries allowed.")
-
-        bad = [n for n in layout if n not in allowed_layouts]
-        if bad:
-            raise SphinxError("The following layout options are invalid: %s" % bad)
-
-        if "interleave" in layout and ("code" in layout or "output" in layout):
-            raise SphinxError("The interleave option is mutually exclusive to the code " "and output options.")
+        env = self.state.document.settings.env
+        layout = get_layout(self.options)
 
         #
-        # Get the source code
+        # Get the source code and the code to run
         #
         path = self.arguments[0]
+
         try:
-            source, indent, module, class_, method = get_source_code(path)
+            # code that is only shown doesn't need its module to be imported
+            static_info = None if needs_execution(layout) else get_source_code_static(path)
+            if static_info is None:
+                source_info = get_source_code(path)
+                is_test = None
+            else:
+                source, indent, is_test = static_info
+                source_info = (source, indent, None, None, None)
         except Exception as err:
             # Generally means the source couldn't be inspected or imported.
             # Raise as a Directive warning (level 2 in docutils).
@@ -104,124 +137,37 @@ class EmbedCodeDirective(Directive):
             # an environment where mpi or pyoptsparse are missing.
             raise self.directive_error(2, str(err))
 
-        #
-        # script, test and/or plot?
-        #
-        # is_script = path.endswith(".py")
-
-        is_test = class_ is not None and inspect.isclass(class_) and issubclass(class_, unittest.TestCase)
-
-        shows_plot = re.compile("|".join(plotting_functions)).search(source)
+        # rebuild the document when the code changes, or when the modules it imports from the project do if it
+        # is run. Only the direct imports are noted, since noting all the modules they import in turn would
+        # rebuild every page that runs code whenever any module of the project changes. The cache key covers
+        # them all, so that the code is run again whenever the page is.
+        dependencies = find_local_dependencies(path, transitive=False) if needs_execution(layout) else []
+        for filename in dependencies or find_dependencies(path, imports=False):
+            env.note_dependency(filename)
 
+        prepared = prepare_code(path, source_info, layout, self.options, is_test=is_test)
         if "plot" in layout:
-            plot_dir = os.getcwd()
-            plot_fname = "doc_plot_%d.png" % _plot_count
-            _plot_count += 1
-
-            plot_file_abs = os.path.join(os.path.abspath(plot_dir), plot_fname)
-            if os.path.isfile(plot_file_abs):
-                # remove any existing plot file
-                os.remove(plot_file_abs)
-
-        #
-        # Modify the source prior to running
-        #
-        if "strip-docstrings" in self.options:
-            source = remove_docstrings(source)
+            prepared, plot_base = prepare_plot(prepared, path, layout)
 
-        setup_code = ""
-        teardown_code = ""
-        mpl_import = ""
-        mpl_figure = ""
-
-        if is_test:
-            try:
-                source = dedent(source)
-                source = strip_decorators(source)
-                source = strip_header(source)
-                source = dedent(source)
-                source = replace_asserts_with_prints(source)
-                source = remove_initial_empty_lines(source)
-
-                class_name = class_.__name__
-                method_name = path.rsplit(".", 1)[1]
-
-                # make 'self' available to test code (as an instance of the test case)
-                self_code = "from %s import %s\nself = %s('%s')\n" % (
-                    module.__name__,
-                    class_name,
-                    class_name,
-                    method_name,
-                )
-
-                # get setUp and tearDown but don't duplicate if it is the method being tested
-                setup_code = (
-                    ""
-                    if method_name == "setUp"
-                    else dedent(strip_header(remove_docstrings(inspect.getsource(class_.setUp))))
-                )
-
-                teardown_code = (
-                    ""
-                    if method_name == "tearDown"
-                    else dedent(strip_header(remove_docstrings(inspect.getsource(class_.tearDown))))
-                )
-
-                # for interleaving, we need to mark input/output blocks
-                if "interleave" in layout:
-                    interleaved = insert_output_start_stop_indicators(source)
-                    code_to_run = "\n".join([self_code, setup_code, interleaved, teardown_code]).strip()
-                else:
-                    code_to_run = "\n".join([self_code, setup_code, source, teardown_code]).strip()
-            except Exception:
-                err = traceback.format_exc()
-                raise SphinxError("Problem with embed of " + path + ": \n" + str(err))
-        else:
-            if indent > 0:
-                source = dedent(source)
-            if "interleave" in layout:
-                source = insert_output_start_stop_indicators(source)
-            code_to_run = source[:]
+        source = prepared.source
+        code_to_run = prepared.code_to_run
 
         #
         # Run the code (if necessary)
         #
         skipped = failed = False
 
-        if "output" in layout or "interleave" in layout or "plot" in layout:
-            imports_not_required = "imports-not-required" in self.options
-
-            if shows_plot:
-                # NOTE: import matplotlib AFTER __future__ (if it's there)
-                # All use of __future__ has been removed from OpenMDAO with v3.x
-                # so the related code has been removed here as well.
-                mpl_import = "\n".join(
-                    [
-                        "import warnings",
-                        "import matplotlib",
-                        "warnings.filterwarnings('ignore')",
-                        "matplotlib.use('Agg')\n",
-                    ]
-                )
-                code_to_run = mpl_import + code_to_run
-
-                if "plot" in layout:
-                    mpl_figure = '\nmatplotlib.pyplot.savefig("%s")' % plot_file_abs
-                    code_to_run = code_to_run + mpl_figure
-
-            if is_test and getattr(method, "__unittest_skip__", False):
-                skipped = True
-                failed = False
-                run_outputs = method.__unittest_skip_why__
-            else:
-                skipped, failed, run_outputs = run_code(
-                    code_to_run,
-                    path,
-                    module=module,
-                    cls=class_,
-                    imports_not_required=imports_not_required,
-                    shows_plot=shows_plot,
-                )
+        if needs_execution(layout):
+            # an existing plot file only says that this code drew it, the cache entry also knows whether the
+            # files the code read have changed since
+            skipped, failed, run_outputs = execute_code(
+                env,
+                prepared,
+                path,
+                layout,
+                self.options,
+                files=[glob.escape(plot_base) + "*"] if "plot" in layout else [],
+            )
 
         #
         # Handle output
@@ -247,9 +193,9 @@ class EmbedCodeDirective(Directive):
                 output_blocks = run_outputs if isinstance(run_outputs, list) else [run_outputs]
 
             elif "interleave" in layout:
-                if is_test:
-                    start = len(self_code) + len(setup_code) + len(mpl_import)
-                    end = len(code_to_run) - len(teardown_code) - len(mpl_figure)
+                if prepared.is_test:
+                    start = len(prepared.self_code) + len(prepared.setup_code) + len(prepared.mpl_import)
+                    end = len(code_to_run) - len(prepared.teardown_code) - len(prepared.mpl_figure)
                     input_blocks = split_source_into_input_blocks(code_to_run[start:end])
                 else:
                     input_blocks = split_source_into_input_blocks(code_to_run)
@@ -261,27 +207,50 @@ class EmbedCodeDirective(Directive):
                 input_blocks = consolidate_input_blocks(input_blocks, output_blocks)
 
             if "plot" in layout:
-                if not os.path.isfile(plot_file_abs):
-                    raise SphinxError("Can't find plot file '%s'" % plot_file_abs)
-
-                directive_dir = os.path.relpath(os.getcwd(), os.path.dirname(self.state.document.settings._source))
-                # this filename must NOT contain an absolute path, else the Figure will not
-                # be able to find the image file in the generated html dir.
-                plot_file = os.path.join(directive_dir, plot_fname)
-
-                # create plot node
-                fig = images.Figure(
-                    self.name,
-                    [plot_file],
-                    self.options,
-                    self.content,
-                    self.lineno,
-                    self.content_offset,
-                    self.block_text,
-                    self.state,
-                    self.state_machine,
-                )
-                plot_nodes = fig.run()
+                figures = find_figures(plot_base)
+                if not figures:
+                    raise SphinxError("Can't find plot file '%s'" % figure_files(plot_base, 0)[0][0])
+
+                plot_nodes = []
+                for plot_outputs in figures:
+                    env.embed_code_plots.setdefault(env.docname, set()).update(
+                        os.path.basename(fname) for fname, _ in plot_outputs
+                    )
+
+                    # this filename must NOT contain an absolute path, else the Figure will not
+                    # be able to find the image file in the generated html dir.
+                    plot_file = os.path.relpath(
+                        plot_outputs[0][0], os.path.dirname(self.state.document.settings._source)
+                    )
+
+                    # create plot node
+                    fig = images.Figure(
+                        self.name,
+                        [plot_file],
+                        self.options,
+                        self.content,
+                        self.lineno,
+                        self.content_offset,
+                        self.block_text,
+                        self.state,
+                        self.state_machine,
+                    )
+                    fig_nodes = fig.run()
+
+                    if len(plot_outputs) > 1:
+                        # offer the other resolutions to browsers
+                        srcset = [(os.path.basename(fname), "%gx" % resolution) for fname, resolution in plot_outputs]
+                        for node in fig_nodes:
+                            for image in list(node.findall(nodes.image)):
+                                image.replace_self(plot_image(image.rawsource, srcset=srcset, **image.attributes))
+
+                    plot_nodes.extend(fig_nodes)
+
+                if len(figures) > 1:
+                    # show the figures of a snippet that draws several of them side by side
+                    gallery = nodes.container(classes=["embed-code-gallery"])
+                    gallery.extend(plot_nodes)
+                    plot_nodes = [gallery]
 
         #
         # create a list of document nodes to return based on layout
@@ -312,9 +281,724 @@ class EmbedCodeDirective(Directive):
         return doc_nodes
 
 
+def get_layout(options):
+    """
+    Get the list of layout entries from the directive options and check that it is valid.
+    """
+    allowed_layouts = set(["code", "output", "interleave", "plot"])
+
+    if "layout" in options:
+        layout = [s.strip() for s in options["layout"].split(",")]
+    else:
+        layout = ["code"]
+
+    if len(layout) > len(set(layout)):
+        raise SphinxError("No duplicate layout entries allowed.")
+
+    bad = [n for n in layout if n not in allowed_layouts]
+    if bad:
+        raise SphinxError("The following layout options are invalid: %s" % bad)
+
+    if "interleave" in layout and ("code" in layout or "output" in layout):
+        raise SphinxError("The interleave option is mutually exclusive to the code " "and output options.")
+
+    return layout
+
+
+def needs_execution(layout):
+    """Return True if the code has to be run to produce the given layout."""
+    return "output" in layout or "interleave" in layout or "plot" in layout
+
+
+def needs_output(layout):
+    """Return True if the given layout shows the output of the code."""
+    return "output" in layout or "interleave" in layout
+
+
+def prepare_code(path, source_info, layout, options, is_test=None):
+    """
+    Build the code to run for an embed-code path.
+
+    Parameters
+    ----------
+    path : str
+        Path to a file, module, function, class, or class method.
+    source_info : tuple
+        The source code, indentation level, module, class and method as returned by get_source_code.
+    layout : list of str
+        The layout options of the directive.
+    options : dict
+        The directive options.
+    is_test : bool or None
+        Whether the path is a TestCase method. If None, this is determined from the class in
+        `source_info`. The module and class may be None when the code is not going to be run.
+
+    Returns
+    -------
+    PreparedCode
+        The source to show, the code to run and the pieces it was assembled from.
+    """
+    source, indent, module, class_, method = source_info
+
+    #
+    # script, test and/or plot?
+    #
+    # is_script = path.endswith(".py")
+
+    if is_test is None:
+        is_test = class_ is not None and inspect.isclass(class_) and issubclass(class_, unittest.TestCase)
+
+    shows_plot = re.compile("|".join(plotting_functions)).search(source) is not None
+
+    #
+    # Modify the source prior to running
+    #
+    self_code = ""
+    setup_code = ""
+    teardown_code = ""
+    mpl_import = ""
+    mpl_figure = ""
+
+    if is_test:
+        try:
+            func_source = FunctionSource(source)
+            source = func_source.body(strip_docstrings="strip-docstrings" in options, asserts_to_prints=True)
+            source = source.rstrip("\n")
+
+            if not needs_execution(layout):
+                return PreparedCode(source, source, module, class_, method, is_test, shows_plot, "", "", "", "", "")
+
+            class_name = class_.__name__
+            method_name = path.rsplit(".", 1)[1]
+
+            # make 'self' available to test code (as an instance of the test case)
+            self_code = "from %s import %s\nself = %s('%s')\n" % (
+                module.__name__,
+                class_name,
+                class_name,
+                method_name,
+            )
+
+            # get setUp and tearDown but don't duplicate if it is the method being tested
+            setup_code = (
+                "" if method_name == "setUp" else FunctionSource(getsource(class_.setUp)).body(strip_docstrings=True)
+            )
+
+            teardown_code = (
+                ""
+                if method_name == "tearDown"
+                else FunctionSource(getsource(class_.tearDown)).body(strip_docstrings=True)
+            )
+
+            # for interleaving, we need to mark input/output blocks
+            if "interleave" in layout:
+                interleaved = insert_output_start_stop_indicators(source)
+                code_to_run = "\n".join([self_code, setup_code, interleaved, teardown_code]).strip()
+            else:
+                code_to_run = "\n".join([self_code, setup_code, source, teardown_code]).strip()
+        except Exception:
+            err = traceback.format_exc()
+            raise SphinxError("Problem with embed of " + path + ": \n" + str(err))
+    else:
+        if "strip-docstrings" in options:
+            source = remove_docstrings(source)
+        if indent > 0:
+            source = dedent(source)
+        if "interleave" in layout:
+            source = insert_output_start_stop_indicators(source)
+        code_to_run = source[:]
+
+    if needs_execution(layout) and shows_plot:
+        # NOTE: import matplotlib AFTER __future__ (if it's there)
+        # All use of __future__ has been removed from OpenMDAO with v3.x
+        # so the related code has been removed here as well.
+        mpl_import = "\n".join(
+            [
+                "import warnings",
+                "import matplotlib",
+                "warnings.filterwarnings('ignore')",
+                "matplotlib.use('Agg')\n",
+            ]
+        )
+        code_to_run = mpl_import + code_to_run
+
+    return PreparedCode(
+        source,
+        code_to_run,
+        module,
+        class_,
+        method,
+        is_test,
+        shows_plot,
+        self_code,
+        setup_code,
+        teardown_code,
+        mpl_import,
+        mpl_figure,
+    )
+
+
+def prepare_plot(prepared, path, layout):
+    """
+    Name the plot files of an embed-code directive and add the code that saves all its figures to them.
+
+    The files are named after a hash of the code and its inputs, so they only have to be drawn again when
+    one of them changes.
+
+    Parameters
+    ----------
+    prepared : PreparedCode
+        The code to run, as returned by prepare_code.
+    path : str
+        The path given to the directive.
+    layout : list of str
+        The layout options of the directive.
+
+    Returns
+    -------
+    PreparedCode
+        The prepared code, including the saving of the figures.
+    str
+        The absolute path of the plot files, without extension.
+    """
+    key = execution_key(prepared.code_to_run, path, layout, module=prepared.module, cls=prepared.cls)
+    key = hash_text(key, *get_plot_output())
+    base = os.path.join(_plot_dir or os.getcwd(), PLOT_FILE_PREFIX + key[:24])
+
+    if prepared.shows_plot:
+        mpl_figure = savefig_code(base)
+        prepared = prepared._replace(code_to_run=prepared.code_to_run + mpl_figure, mpl_figure=mpl_figure)
+
+    return prepared, base
+
+
+def execute_code(env, prepared, path, layout, options, files=()):
+    """
+    Run prepared code, reusing a pre-executed or cached result if there is one.
+
+    Parameters
+    ----------
+    env : BuildEnvironment
+        The Sphinx build environment, used to keep track of cache statistics.
+    prepared : PreparedCode
+        The code to run, as returned by prepare_code.
+    path : str
+        The path given to the directive.
+    layout : list of str
+        The layout options of the directive.
+    options : dict
+        The directive options.
+    files : list of str
+        Absolute paths or glob patterns of files generated by the code that must be cached along with the
+        output.
+
+    Returns
+    -------
+    tuple
+        (skipped, failed, output) as returned by run_code.
+    """
+    if prepared.is_test and getattr(prepared.method, "__unittest_skip__", False):
+        return True, False, prepared.method.__unittest_skip_why__
+
+    return run_code_cached(
+        env,
+        layout,
+        prepared.code_to_run,
+        path,
+        module=prepared.module,
+        cls=prepared.cls,
+        imports_not_required="imports-not-required" in options,
+        shows_plot=prepared.shows_plot,
+        files=files,
+    )
+
+
+def run_code_cached(env, layout, code_to_run, path, files=(), **kwargs):
+    """
+    Run the given code chunk through run_code, reusing a cached result if there is one.
+
+    Parameters
+    ----------
+    env : BuildEnvironment
+        The Sphinx build environment, used to keep track of cache statistics.
+    layout : list of str
+        The layout options of the directive.
+    code_to_run : str
+        The code to run.
+    path : str
+        The path given to the directive.
+    files : list of str
+        Absolute paths or glob patterns of files generated by the code that must be cached along with the
+        output.
+    **kwargs : dict
+        Additional arguments for run_code.
+
+    Returns
+    -------
+    tuple
+        (skipped, failed, output) as returned by run_code.
+    """
+    if _execution_cache is None and not _preexecuted:
+        return run_code(code_to_run, path, **kwargs)
+
+    key = execution_key(code_to_run, path, layout, module=kwargs.get("module"), cls=kwargs.get("cls"))
+    if key in _preexecuted:
+        note_cache("preexecuted")
+        return _preexecuted[key]
+
+    if _execution_cache is None:
+        return run_code(code_to_run, path, **kwargs)
+
+    result = _execution_cache.get(key, files)
+    if result is not None:
+        env.embed_code_cache_stats["hits"] += 1
+        note_cache("hit")
+        return result
+
+    env.embed_code_cache_stats["misses"] += 1
+    note_cache("miss")
+    reads = []
+    writes = []
+    skipped, failed, output = run_code(code_to_run, path, reads=reads, writes=writes, **kwargs)
+
+    # failures are not cached since they may well be fixed by the next build, except for the ones caused by
+    # a missing dependency, which like skips are replayed until something else gets installed
+    missing_dependency = failed and failed_on_missing_dependency(output, path)
+    if (not failed or missing_dependency) and not shares_files(reads, writes):
+        _execution_cache.put(
+            key, skipped, failed, output, files, reads, depends_on_environment=skipped or missing_dependency
+        )
+
+    return skipped, failed, output
+
+
+def shares_files(reads, writes):
+    """
+    Return whether code read files left in its working directory by earlier snippets or left files there
+    for later ones.
+
+    The result of such code can't be replayed from the cache, since the files only exist while the snippets
+    that write them actually run during the build.
+    """
+    return any(in_build_workdir(path) for path in reads + writes)
+
+
+def find_embed_code_directives(text):
+    """
+    Find the embed-code directives in reST source text.
+
+    Parameters
+    ----------
+    text : str
+        The reST source.
+
+    Returns
+    -------
+    list of tuple
+        The path argument and the dict of options of each directive found.
+    """
+    directive_re = re.compile(r"^(?P<indent>[ \t]*)\.\.[ \t]+embed-code::(?P<args>.*)$")
+    option_re = re.compile(r"^:(?P<name>[\w-]+):(?P<value>.*)$")
+
+    found = []
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        match = directive_re.match(lines[i])
+        i += 1
+        if match is None:
+            continue
+
+        indent = len(match.group("indent"))
+        args = match.group("args").split()
+        options = {}
+
+        # the arguments and options are the following lines that are indented further than the directive,
+        # up to the first blank line after the arguments
+        while i < len(lines):
+            line = lines[i]
+            stripped = line.strip()
+            if not stripped:
+                if args:
+                    break
+                i += 1
+                continue
+            if len(line) - len(line.lstrip()) <= indent:
+                break
+            i += 1
+            option = option_re.match(stripped)
+            if option is not None:
+                options[option.group("name")] = option.group("value").strip()
+            elif not options:
+                args.extend(stripped.split())
+
+        if args:
+            found.append((args[0], options))
+
+    return found
+
+
+def _preexecute(path, layout, options):
+    """
+    Run the code for a single embed-code directive in a pre-execution process.
+
+    Returns the (skipped, failed, output) of run_code and the files read and written by the code.
+    """
+    prepared = prepare_code(path, get_source_code(path), layout, options)
+    if "plot" in layout:
+        prepared, _ = prepare_plot(prepared, path, layout)
+    reads = []
+    writes = []
+    result = run_code(
+        prepared.code_to_run,
+        path,
+        module=prepared.module,
+        cls=prepared.cls,
+        imports_not_required="imports-not-required" in options,
+        shows_plot=prepared.shows_plot,
+        reads=reads,
+        writes=writes,
+    )
+    return result, reads, writes
+
+
+def preexecute_embed_code(app, env, docnames):
+    """
+    Run the code of all embed-code directives in the documents about to be read, concurrently.
+
+    The results are stored so that the directives only have to look them up while the documents are read.
+    Directives whose code fails here are simply run again while reading, so that concurrency related
+    failures are not reported.
+    """
+    _preexecuted.clear()
+
+    if not app.config.embed_code_preexecute or not docnames:
+        return
+
+    try:
+        mp_context = multiprocessing.get_context("fork")
+    except ValueError:
+        # the pre-execution processes need the state of this process
+        return
+
+    jobs = {}
+    isolated_jobs = {}
+    mpi_jobs = {}
+    job_files = {}
+    for docname in docnames:
+        try:
+            with open(env.doc2path(docname), encoding=app.config.source_encoding) as f:
+                text = f.read()
+        except OSError:
+            continue
+
+        for path, options in find_embed_code_directives(text):
+            try:
+                layout = get_layout(options)
+                if not needs_execution(layout):
+                    continue
+                prepared = prepare_code(path, get_source_code(path), layout, options)
+                if "plot" in layout:
+                    prepared, plot_base = prepare_plot(prepared, path, layout)
+                    files = [glob.escape(plot_base) + "*"]
+                else:
+                    files = []
+            except Exception:
+                # any problems are reported when the directive itself runs
+                continue
+
+            if prepared.is_test and getattr(prepared.method, "__unittest_skip__", False):
+                continue
+
+            key = execution_key(prepared.code_to_run, path, layout, module=prepared.module, cls=prepared.cls)
+            if key in jobs or key in isolated_jobs or key in mpi_jobs:
+                continue
+            if _execution_cache is not None and _execution_cache.get(key, files) is not None:
+                continue
+            if files:
+                job_files[key] = files
+
+            n_mpi_procs = mpi_procs(prepared.cls)
+            if n_mpi_procs > 1:
+                mpi_jobs[key] = (n_mpi_procs, (path, layout, options))
+            elif prepared.shows_plot:
+                isolated_jobs[key] = (path, layout, options)
+            else:
+                jobs[key] = (path, layout, options)
+
+    if not jobs and not isolated_jobs and not mpi_jobs:
+        return
+
+    n_procs = max(1, min(app.config.embed_code_jobs or os.cpu_count() or 1, len(jobs)))
+    n_threads = max(1, min(app.config.embed_code_workers or 1, len(isolated_jobs)))
+    logger.info(
+        "pre-executing %d embed-code snippets using %d processes, %d isolated snippets using %d threads and "
+        "%d MPI snippets",
+        len(jobs),
+        n_procs,
+        len(isolated_jobs),
+        n_threads,
+        len(mpi_jobs),
+    )
+
+    def store(key, result):
+        (skipped, failed, output), reads, writes = result
+        if failed:
+            return
+        _preexecuted[key] = (skipped, failed, output)
+        if _execution_cache is not None and not shares_files(reads, writes):
+            env.embed_code_cache_stats["misses"] += 1
+            _execution_cache.put(
+                key, skipped, failed, output, job_files.get(key, ()), reads, depends_on_environment=skipped
+            )
+
+    with ProcessPoolExecutor(max_workers=n_procs, mp_context=mp_context) as executor, ThreadPoolExecutor(
+        max_workers=n_threads
+    ) as threads:
+        # the processes are forked on the first submit, before any thread starts and could hold a lock
+        futures = {executor.submit(_preexecute, *job): key for key, job in jobs.items()}
+
+        # snippets that run isolated anyway are sent from threads of this process, so that they share its
+        # warm worker pool, which is shut down at the end of the build, instead of each forked process
+        # starting a pool of its own that is never shut down
+        futures.update({threads.submit(_preexecute, *job): key for key, job in isolated_jobs.items()})
+
+        # while the pool works, run the MPI snippets from here, grouped by their number of processes so
+        # that each group shares one mpirun job
+        for key, (_, job) in sorted(mpi_jobs.items(), key=lambda item: item[1][0]):
+            try:
+                store(key, _preexecute(*job))
+            except Exception:
+                continue
+
+        for future in as_completed(futures):
+            try:
+                store(futures[future], future.result())
+            except Exception:
+                continue
+
+
+def init_source_stamps(app):
+    """Only stat each source file once during the build, however many directives depend on it."""
+    begin_build()
+
+
+def reset_source_stamps(app, exception):
+    """Check the stamps of the source files each time again after the build."""
+    end_build()
+
+
+def init_execution_cache(app):
+    """Create the execution cache once the configuration is known."""
+    global _execution_cache
+
+    app.env.embed_code_cache_stats = {"hits": 0, "misses": 0}
+
+    if app.config.embed_code_cache:
+        cache_dir = app.config.embed_code_cache_dir or os.path.join(app.doctreedir, "embed_code_cache")
+        _execution_cache = ExecutionCache(os.path.join(app.confdir, cache_dir), app.config.embed_code_cache_size)
+    else:
+        _execution_cache = None
+
+
+def init_plot_dir(app):
+    """Create the directory the plot files are written to."""
+    global _plot_dir
+
+    plot_dir = app.config.embed_code_plot_dir or os.path.join(app.doctreedir, "embed_code_plots")
+    _plot_dir = os.path.abspath(os.path.join(app.confdir, plot_dir))
+    os.makedirs(_plot_dir, exist_ok=True)
+
+    if not hasattr(app.env, "embed_code_plots"):
+        app.env.embed_code_plots = {}
+
+
+def init_workdirs(app):
+    """Keep the private working directories of the snippets for the whole build."""
+    # the docs and the plots are written to, not read by the code, and would be slow to mirror
+    linked = [app.outdir, app.doctreedir]
+    if _plot_dir is not None:
+        linked.append(_plot_dir)
+    configure_build_workdirs(tempfile.mkdtemp(prefix="embed_code_"), linked)
+
+
+def close_workdirs(app, exception):
+    """Remove the private working directories of the snippets at the end of the build."""
+    close_build_workdirs()
+
+
+def init_plot_output(app):
+    """Set how plots are saved."""
+    fmt = app.config.embed_code_plot_format
+    if fmt == "webp" and not webp_supported():
+        logger.warning("WebP plots need Pillow with WebP support, saving plots as PNG instead")
+        fmt = "png"
+    # values given on the command line with -D are strings
+    dpi = app.config.embed_code_plot_dpi
+    configure_plot_output(
+        fmt,
+        None if dpi is None else float(dpi),
+        [float(resolution) for resolution in app.config.embed_code_plot_resolutions],
+        int(app.config.embed_code_plot_quantize),
+        bool(app.config.embed_code_plot_optimize),
+    )
+
+
+def register_plot_images(app, doctree):
+    """Add the other resolutions of the plots in a document to the images of the document."""
+    for node in doctree.findall(plot_image):
+        image_dir = os.path.dirname(node["candidates"]["*"])
+        node["srcset"] = [(os.path.join(image_dir, fname), descriptor) for fname, descriptor in node["srcset"]]
+        for fname, _ in node["srcset"]:
+            app.env.images.add_file(app.env.docname, fname)
+
+
+def copy_plot_images(app, doctree, docname):
+    """Have the HTML builder copy the other resolutions of the plots in a document."""
+    if app.builder.format != "html":
+        return
+    for node in doctree.findall(plot_image):
+        for fname, _ in node["srcset"]:
+            if fname in app.env.images:
+                app.builder.images[fname] = app.env.images[fname][1]
+
+
+def purge_plots(app, env, docname):
+    """Forget the plots of a document that is about to be read again."""
+    getattr(env, "embed_code_plots", {}).pop(docname, None)
+
+
+def merge_plots(app, env, docnames, other):
+    """Add the plots of the documents read by parallel reader processes."""
+    for docname in docnames:
+        if docname in other.embed_code_plots:
+            env.embed_code_plots[docname] = other.embed_code_plots[docname]
+
+
+def clean_plot_dir(app, exception):
+    """Delete the plot files that are no longer used by any document."""
+    if exception is not None or _plot_dir is None:
+        return
+
+    used = set().union(*app.env.embed_code_plots.values())
+    for fname in os.listdir(_plot_dir):
+        if fname.startswith(PLOT_FILE_PREFIX) and fname not in used:
+            try:
+                os.remove(os.path.join(_plot_dir, fname))
+            except OSError:
+                pass
+
+
+def init_output_limit(app):
+    """Set how much of the output of each snippet is kept."""
+    configure_output_limit(app.config.embed_code_output_limit, app.config.embed_code_output_tail)
+
+
+def init_worker_pool(app):
+    """Configure the pool of warm worker processes and the MPI jobs used to run isolated code."""
+    configure_pool(app.config.embed_code_workers, app.config.embed_code_worker_preload)
+    configure_mpi_jobs(app.config.embed_code_mpi_persistent)
+    usable = configure_execd(
+        app.config.embed_code_execd,
+        app.config.embed_code_execd_socket,
+        app.config.embed_code_execd_timeout,
+        app.config.embed_code_worker_preload,
+    )
+    if not usable:
+        logger.warning(
+            "embed_code_execd is set but the execution server can't be used here: it needs fork and a socket "
+            "directory that only the current user can write to"
+        )
+
+
+def shutdown_worker_pool(app, exception):
+    """Stop the worker processes and the MPI jobs at the end of the build."""
+    close_pool()
+    close_mpi_jobs()
+
+
+def merge_cache_stats(app, env, docnames, other):
+    """Add up the cache statistics gathered by parallel reader processes."""
+    for stat, count in other.embed_code_cache_stats.items():
+        env.embed_code_cache_stats[stat] += count
+
+
+def report_cache_stats(app, exception):
+    """Evict old cache entries and print the cache hit/miss statistics."""
+    if _execution_cache is None:
+        return
+
+    evicted = _execution_cache.prune()
+    stats = app.env.embed_code_cache_stats
+    if not (stats["hits"] or stats["misses"] or evicted):
+        return
+    logger.info(
+        "embed-code cache: %d hits, %d misses, %d entries evicted (%s)",
+        stats["hits"],
+        stats["misses"],
+        evicted,
+        _execution_cache.cache_dir,
+    )
+
+
 def setup(app):
     """add custom directive into Sphinx so that it is found during document parsing"""
+    app.setup_extension("sphinx_mdolab_theme.ext.timings")
     app.add_directive("embed-code", EmbedCodeDirective)
     node_setup(app)
 
+    # persistent cache of execution results, off unless asked for since results then come from the cache
+    # instead of from running the code
+    app.add_config_value("embed_code_cache", False, "")
+    app.add_config_value("embed_code_cache_dir", "", "")
+    app.add_config_value("embed_code_cache_size", 512 * 1024**2, "")
+    app.connect("builder-inited", init_source_stamps)
+    app.connect("build-finished", reset_source_stamps)
+    app.connect("builder-inited", init_execution_cache)
+    app.connect("env-merge-info", merge_cache_stats)
+    app.connect("build-finished", report_cache_stats)
+
+    # warm worker processes for code that can't run in the Sphinx process
+    app.add_config_value("embed_code_workers", 1, "")
+    app.add_config_value("embed_code_worker_preload", DEFAULT_PRELOAD, "")
+    app.add_config_value("embed_code_mpi_persistent", True, "")
+    # a server kept running between builds, see the sphinx-mdolab-execd command
+    app.add_config_value("embed_code_execd", False, "")
+    app.add_config_value("embed_code_execd_socket", "", "")
+    app.add_config_value("embed_code_execd_timeout", DEFAULT_IDLE_TIMEOUT, "")
+    app.connect("builder-inited", init_worker_pool)
+    app.connect("build-finished", shutdown_worker_pool)
+
+    # plot files named after the code that draws them
+    app.add_config_value("embed_code_plot_dir", "", "env")
+    app.connect("builder-inited", init_plot_dir)
+
+    # private working directories of the snippets, kept until the end of the build
+    app.connect("builder-inited", init_workdirs)
+    app.connect("build-finished", close_workdirs)
+
+    # how plots are saved
+    app.add_config_value("embed_code_plot_format", "png", "env")
+    app.add_config_value("embed_code_plot_dpi", None, "env")
+    app.add_config_value("embed_code_plot_resolutions", [1], "env")
+    app.add_config_value("embed_code_plot_quantize", 0, "env")
+    app.add_config_value("embed_code_plot_optimize", False, "env")
+    app.add_node(plot_image, html=(visit_plot_image, depart_plot_image))
+    app.connect("builder-inited", init_plot_output)
+    app.connect("doctree-read", register_plot_images)
+    app.connect("doctree-resolved", copy_plot_images)
+    app.connect("env-purge-doc", purge_plots)
+    app.connect("env-merge-info", merge_plots)
+    app.connect("build-finished", clean_plot_dir)
+
+    # how much of the output of each snippet is kept
+    app.add_config_value("embed_code_output_limit", DEFAULT_LIMIT, "env")
+    app.add_config_value("embed_code_output_tail", DEFAULT_TAIL, "env")
+    app.connect("builder-inited", init_output_limit)
+
+    # run all the code concurrently before the documents are read
+    app.add_config_value("embed_code_preexecute", False, "")
+    app.add_config_value("embed_code_jobs", None, "")
+    app.connect("env-before-read-docs", preexecute_embed_code)
+
     return {"version": sphinx.__display_version__, "parallel_read_safe": True}
@@ -6,7 +6,9 @@ from docutils.parsers.rst import Directive
 import sphinx
 
 # First party modules
-from ..utils.docutil import get_source_code
+from ..utils.docutil import get_source_code, get_source_code_static
+from ..utils.instrument import instrumented
+from ..utils.source_index import find_dependencies
 
 
 class ContentContainerDirective(Directive):
@@ -33,6 +35,7 @@ class ContentContainerDirective(Directive):
         return [node]
 
 
+@instrumented
 class EmbedCompareDirective(Directive):
     """
     EmbedCompareDirective is a custom directive to allow blocks of
@@ -88,7 +91,14 @@ class EmbedCompareDirective(Directive):
 
         # for RIGHT side, get the code block, and reduce it if requested
         right_method = arg[0]
-        text, _, _, _, _ = get_source_code(right_method)
+        for filename in find_dependencies(right_method, imports=False):
+            self.state.document.settings.env.note_dependency(filename)
+        # the code is only shown, so avoid importing its module if possible
+        static_info = get_source_code_static(right_method)
+        if static_info is not None:
+            text = static_info[0]
+        else:
+            text, _, _, _, _ = get_source_code(right_method)
         if len(arg) >= 3:
             start_txt = arg[1]
             end_txt = arg[2]
@@ -136,6 +146,7 @@ class EmbedCompareDirective(Directive):
 
 def setup(app):
     """add custom directive into Sphinx so that it is found during document parsing"""
+    app.setup_extension("sphinx_mdolab_theme.ext.timings")
     app.add_directive("content-container", ContentContainerDirective)
     app.add_directive("embed-compare", EmbedCompareDirective)
 
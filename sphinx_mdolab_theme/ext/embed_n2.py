@@ -1,6 +1,8 @@
 # Standard Python modules
 import os.path
+import shutil
 import subprocess
+import tempfile
 
 # External modules
 from docutils import nodes
@@ -9,7 +11,13 @@ from docutils.statemachine import ViewList
 import sphinx
 from sphinx.util.nodes import nested_parse_with_titles
 
+# First party modules
+from ..utils.general_utils import private_workdir
+from ..utils.instrument import instrumented, note_subprocess, trace_span
+from ..utils.source_index import find_dependencies
 
+
+@instrumented
 class EmbedN2Directive(Directive):
     """
     EmbedN2Directive is a custom directive to build and embed an N2 diagram into docs
@@ -58,6 +66,10 @@ class EmbedN2Directive(Directive):
         if not os.path.isfile(np):
             raise IOError("File does not exist({0})".format(np))
 
+        # rebuild the document when the model or what it imports from its directory changes
+        for filename in find_dependencies(np):
+            self.state.document.settings.env.note_dependency(filename)
+
         # Generate N2 files into the target_dir. Those files are later copied
         # into the top of the HTML hierarchy, so the HTML doc file needs a
         # relative path to them.
@@ -70,8 +82,26 @@ class EmbedN2Directive(Directive):
         if show_toolbar:
             html_rel_name += "#toolbar"
 
-        cmd = subprocess.Popen(["openmdao", "n2", np, "--no_browser", "--embed", "-o" + html_name])
-        cmd_out, cmd_err = cmd.communicate()
+        # Run the model in a private mirror of the working directory, so that it finds the files it reads with
+        # the same relative paths while the files it writes (reports, recordings) don't clash with other
+        # diagrams generated in parallel. The diagram is written to a private directory next to its final
+        # place and moved there once complete.
+        os.makedirs(target_dir, exist_ok=True)
+        out_dir = tempfile.mkdtemp(prefix="embed_n2_", dir=target_dir)
+        build_dirs = [os.path.join(os.getcwd(), "_build"), self.state.document.settings.env.doctreedir]
+        try:
+            tmp_name = os.path.join(out_dir, html_base_name)
+            with private_workdir(os.getcwd(), linked=build_dirs) as workdir:
+                with trace_span("openmdao n2", path=np):
+                    cmd = subprocess.Popen(
+                        ["openmdao", "n2", np, "--no_browser", "--embed", "-o" + tmp_name], cwd=workdir
+                    )
+                    cmd_out, cmd_err = cmd.communicate()
+            if os.path.isfile(tmp_name):
+                os.replace(tmp_name, html_name)
+        finally:
+            note_subprocess()
+            shutil.rmtree(out_dir, ignore_errors=True)
 
         rst = ViewList()
 
@@ -104,6 +134,7 @@ class EmbedN2Directive(Directive):
 
 def setup(app):
     """add custom directive into Sphinx so that it is found during document parsing"""
+    app.setup_extension("sphinx_mdolab_theme.ext.timings")
     app.add_directive("embed-n2", EmbedN2Directive)
 
     return {"version": sphinx.__display_version__, "parallel_read_safe": True}
@@ -18,6 +18,10 @@ from sphinx.errors import SphinxError
 from sphinx.writers.html5 import HTML5Translator
 from sphinx.writers.html import HTMLTranslator
 
+# First party modules
+from ..utils.instrument import instrumented, note_subprocess, trace_span
+from ..utils.source_index import find_dependencies
+
 
 class failed_node(nodes.Element):
     pass
@@ -72,6 +76,7 @@ def depart_cmd_node(self, node):
     self.body.append(html)
 
 
+@instrumented
 class EmbedShellCmdDirective(Directive):
     """
     EmbedShellCmdDirective is a custom directive to allow a shell command and the result
@@ -108,22 +113,30 @@ class EmbedShellCmdDirective(Directive):
         else:
             raise SphinxError("'cmd' is not defined for embed-shell-cmd.")
 
-        startdir = os.getcwd()
-
         if "dir" in self.options:
             workdir = os.path.abspath(os.path.expandvars(os.path.expanduser(self.options["dir"])))
         else:
             workdir = os.getcwd()
 
+        # rebuild the document when a file the command is given, e.g. a script, changes
+        for arg in cmd:
+            arg_path = os.path.join(workdir, arg)
+            if not os.path.isfile(arg_path):
+                continue
+            for filename in find_dependencies(arg_path) if arg_path.endswith(".py") else [arg_path]:
+                self.state.document.settings.env.note_dependency(filename)
+
         if "stderr" in self.options:
             stderr = subprocess.STDOUT
         else:
             stderr = None  # noqa
 
-        os.chdir(workdir)
-
         try:
-            output = subprocess.check_output(cmd, stderr=subprocess.STDOUT, env=os.environ).decode("utf-8", "ignore")
+            # pass the working directory to the command rather than changing the one of the build,
+            # which documents read in parallel would share
+            with trace_span("shell command", cmd=cmdstr):
+                output = subprocess.check_output(cmd, cwd=workdir, stderr=subprocess.STDOUT, env=os.environ)
+            output = output.decode("utf-8", "ignore")
         except subprocess.CalledProcessError as err:
             # Failed cases raised as a Directive warning (level 2 in docutils).
             # This way, the sphinx build does not terminate if, for example, you are building on
@@ -136,7 +149,7 @@ class EmbedShellCmdDirective(Directive):
             msg = "Running of embedded shell command '{}' in docs failed. Output was: \n{}".format(cmdstr, err)
             raise self.directive_error(2, msg)
         finally:
-            os.chdir(startdir)
+            note_subprocess()
 
         output = cgiesc.escape(output)
 
@@ -158,6 +171,7 @@ class EmbedShellCmdDirective(Directive):
 
 def setup(app):
     """add custom directive into Sphinx so that it is found during document parsing"""
+    app.setup_extension("sphinx_mdolab_theme.ext.timings")
     app.add_directive("embed-shell-cmd", EmbedShellCmdDirective)
     app.add_node(failed_node, html=(visit_failed_node, depart_failed_node))
     app.add_node(cmd_node, html=(visit_cmd_node, depart_cmd_node))
@@ -1,24 +1,27 @@
 from importlib import import_module
-from docutils.parsers.rst.directives.misc import Include
-import yaml
+from docutils import nodes
+from docutils.parsers.rst import Directive
+from docutils.statemachine import StringList
 import os
+from ..utils.instrument import instrumented
+from ..utils.options_manifest import find_manifest, get_class_entry
+from ..utils.source_index import find_dependencies
+from ..utils.yaml_cache import load_yaml
 
-# this is here in the file scope rather than class
-# because we can import it in the config.py file for consistency
-TEMP_FILE = "tmp.rst"
 
-
-class OptionsList(Include):
+@instrumented
+class OptionsList(Directive):
     """
-    This is an include directive, but with an extra step of generating a temporary options file
-    which gets included.
-    The idea to inherit from Include came from sphinx.directives.other.Include which just wraps
-    super().run()
+    This directive generates a ``data`` directive for each default option of a class, with the
+    descriptions from a YAML file, and parses them straight into the document.
     """
 
+    required_arguments = 1
     optional_arguments = 1
+    final_argument_whitespace = True
     option_spec = {
         "filename": str,
+        "manifest": str,
     }
 
     # default file name
@@ -38,72 +41,73 @@ class OptionsList(Include):
         self.get_options_from_yaml()
         # read the descriptions
         self.get_descriptions()
-        # generate the temp file
-        self.generate_temp_file()
-        # reset the self.arguments to just the temp file name for the inherited include directive
-        self.arguments = [TEMP_FILE]
-        # actually run the include directive
-        return super().run()
+        # generate the reST and parse it in place of the directive
+        node = nodes.Element()
+        self.state.nested_parse(self.generate_rst(), self.content_offset, node)
+        return node.children
 
-    def generate_temp_file(self):
-        with open(TEMP_FILE, "w") as f:
-            for key, value in self.defaultOptions.items():
-                txt = []
-                # first add the name column, with text = key
-                # this is the name of the option, wrapped in double backticks
-                txt.append(f".. data:: {key}")
-                # this is the type of the option
-                # __name__ extracts the name of the datatype (e.g. str, float etc.)
-                # otherwise this will display <class 'str'> etc
-                defaultType = value[0]
-                if isinstance(defaultType, tuple):
-                    types = [str(t.__name__) for t in defaultType]
-                    txt.append(self.TYPE_PREFIX + " or ".join(types))
-                else:
-                    txt.append(self.TYPE_PREFIX + str(defaultType.__name__))
-                # this is the default value
-                # here we do some type checking if we get a list of possible choices
-                # TODO: could potentially import baseclasses and use existing code there
-                defaultValue = value[1]
-                if isinstance(defaultValue, list) and defaultType != list:
-                    defaultValue = value[1][0]
-                    choices = True  # we have a choice
-                else:
-                    choices = False
-                txt.append(self.VALUE_PREFIX + str(defaultValue))
-                f.writelines("\n".join(txt))
-                f.write("\n")
-                # this is the description from the yaml file
-                # for choices, we expect a field called desc containing general description
-                # plus one field for each possible choice
-                # TODO: can add better error message when yaml file does not match
-                try:
-                    desc = self.yaml[key]["desc"]
-                except KeyError as e:
-                    raise KeyError(
-                        f"The description for option '{key}' is missing from the YAML file {self.filename}"
-                    ) from e
-                # because this part needs to be indented in the RST file, we have to split it first
-                if "\n" in desc:
-                    base_desc = desc.splitlines()
-                else:
-                    base_desc = [desc]
-                # write the base description
-                f.write(f"\n{self.INDENT}")
-                f.writelines(f"\n{self.INDENT}".join(base_desc))
-                # now handle the choices
-                if choices:
-                    f.write("\n")
-                    for choice in value[1]:
-                        choice_desc = f"-  ``{choice}``: {self.yaml[key][choice]}"
-                        f.writelines(f"\n{self.INDENT}" + choice_desc)
-                # newline before the next data directive
-                f.write("\n\n")
+    def generate_rst(self):
+        # the generated lines are attributed to the directive in warnings
+        source, _ = self.state_machine.get_source_and_line(self.lineno)
+        lines = []
+        for key, value in self.defaultOptions.items():
+            # first add the name column, with text = key
+            # this is the name of the option, wrapped in double backticks
+            lines.append(f".. data:: {key}")
+            # this is the type of the option
+            # __name__ extracts the name of the datatype (e.g. str, float etc.)
+            # otherwise this will display <class 'str'> etc
+            defaultType = value[0]
+            if isinstance(defaultType, tuple):
+                types = [str(t.__name__) for t in defaultType]
+                lines.append(self.TYPE_PREFIX + " or ".join(types))
+            else:
+                lines.append(self.TYPE_PREFIX + str(defaultType.__name__))
+            # this is the default value
+            # here we do some type checking if we get a list of possible choices
+            # TODO: could potentially import baseclasses and use existing code there
+            defaultValue = value[1]
+            if isinstance(defaultValue, list) and defaultType != list:
+                defaultValue = value[1][0]
+                choices = True  # we have a choice
+            else:
+                choices = False
+            lines.append(self.VALUE_PREFIX + str(defaultValue))
+            lines.append("")
+            # this is the description from the yaml file
+            # for choices, we expect a field called desc containing general description
+            # plus one field for each possible choice
+            # TODO: can add better error message when yaml file does not match
+            try:
+                desc = self.yaml[key]["desc"]
+            except KeyError as e:
+                raise KeyError(
+                    f"The description for option '{key}' is missing from the YAML file {self.filename}"
+                ) from e
+            # because this part needs to be indented in the RST file, we have to split it first
+            lines.extend(self.INDENT + line for line in desc.splitlines() or [""])
+            # now handle the choices
+            if choices:
+                lines.append("")
+                for choice in value[1]:
+                    choice_desc = f"-  ``{choice}``: {self.yaml[key][choice]}"
+                    lines.extend((self.INDENT + choice_desc).splitlines())
+            # blank line before the next data directive
+            lines.append("")
+        return StringList(lines, items=[(source, self.lineno - 1)] * len(lines))
 
     def get_options_from_yaml(self):
         # access the class name
         self.module_path, self.member_name = self.arguments[0].rsplit(".", 1)
-        # import the class
+        # read the default options from the manifest if there is one
+        manifest = find_manifest(self.state.document, self.options.get("manifest"))
+        if manifest is not None:
+            self.state.document.settings.env.note_dependency(manifest)
+            self.defaultOptions = get_class_entry(manifest, self.arguments[0], "options")
+            return
+        # import the class, and rebuild the documents that use it when its source changes
+        for filename in find_dependencies(self.arguments[0]):
+            self.state.document.settings.env.note_dependency(filename)
         cls = getattr(import_module(self.module_path), self.member_name)
         # call the private function to get the default options
         self.defaultOptions = cls._getDefaultOptions()
@@ -116,9 +120,14 @@ class OptionsList(Include):
         if not os.path.isfile(self.filename):
             raise FileNotFoundError(f"The file {self.filename} must exist! Failed module is {self.member_name}.")
 
-        with open(self.filename) as f:
-            self.yaml = yaml.load(f, Loader=yaml.FullLoader)
+        # rebuild the documents that use the descriptions when they change
+        self.state.document.settings.env.note_dependency(self.filename)
+        self.yaml = load_yaml(self.filename)
 
 
 def setup(app):
+    app.setup_extension("sphinx_mdolab_theme.ext.timings")
     app.add_directive("optionslist", OptionsList)
+    # shared with optionstable
+    if "mdolab_options_manifest" not in app.config:
+        app.add_config_value("mdolab_options_manifest", "", "env")
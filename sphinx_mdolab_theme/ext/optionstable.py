@@ -1,12 +1,25 @@
 from importlib import import_module
 from docutils.parsers.rst import directives
 from docutils.parsers.rst.directives.tables import Table
-from docutils.statemachine import ViewList
+from docutils.statemachine import StringList
 from docutils import nodes
-import yaml
 import os
+import re
+from ..utils.instrument import instrumented
+from ..utils.options_manifest import find_manifest, get_class_entry
+from ..utils.source_index import find_dependencies
+from ..utils.yaml_cache import load_yaml
 
+# cells that are just an inline literal, e.g. an option name, or plain words, e.g. a type name or a number,
+# are turned into nodes directly instead of being parsed
+LITERAL_CELL = re.compile(r"``([^`\\\s]|[^`\\\s][^`\\\n]*[^`\\\s])``")
+PLAIN_CELL = re.compile(r"[A-Za-z0-9]+([._+-][A-Za-z0-9]+)*( [A-Za-z0-9]+([._+-][A-Za-z0-9]+)*)*")
 
+# the paragraph that separates the cells parsed together, which is the cheapest element to parse
+CELL_SEPARATOR = "sphinx-mdolab-theme-optionstable-cell-separator"
+
+
+@instrumented
 class OptionsTable(Table):
     """
     This Table directive formats the defaultOptions dictionary in a nice table
@@ -22,6 +35,7 @@ class OptionsTable(Table):
         "filename": str,
         "widths": directives.positive_int_list,
         "type": directives.uri,
+        "manifest": str,
     }
 
     # default options
@@ -56,7 +70,18 @@ class OptionsTable(Table):
     def get_options_informs(self):
         # access the class name
         self.module_path, self.member_name = self.arguments[0].rsplit(".", 1)
-        # import the class
+        # read the default options or informs from the manifest if there is one
+        manifest = find_manifest(self.state.document, self.options.get("manifest"))
+        if manifest is not None:
+            self.state.document.settings.env.note_dependency(manifest)
+            if self.options["type"] == "options":
+                self.defaultOptions = get_class_entry(manifest, self.arguments[0], "options")
+            elif self.options["type"] == "informs":
+                self.informs = get_class_entry(manifest, self.arguments[0], "informs")
+            return
+        # import the class, and rebuild the documents that use it when its source changes
+        for filename in find_dependencies(self.arguments[0]):
+            self.state.document.settings.env.note_dependency(filename)
         cls = getattr(import_module(self.module_path), self.member_name)
         # call the private function to get the default options or informs
         if self.options["type"] == "options":
@@ -72,8 +97,9 @@ class OptionsTable(Table):
         if not os.path.isfile(self.filename):
             raise FileNotFoundError(f"The file {self.filename} must exist! Failed module is {self.member_name}.")
 
-        with open(self.filename) as f:
-            self.yaml = yaml.load(f, Loader=yaml.FullLoader)
+        # rebuild the documents that use the descriptions when they change
+        self.state.document.settings.env.note_dependency(self.filename)
+        self.yaml = load_yaml(self.filename)
 
     def set_width(self):
         # sets the self.col_widths
@@ -112,35 +138,106 @@ class OptionsTable(Table):
         table_node.insert(0, title)
         return [table_node] + messages
 
-    def collect_rows(self):
-        # Add a column for a field. In order to have the RST inside
-        # these fields get rendered, we need to use the
-        # ViewList. Note, ViewList expects a list of lines, so chunk
-        # up our content as a list to make it happy.
-        def add_col(value):
+    def parse_cells(self, cells):
+        """
+        Turn the reST of each cell into a table entry.
+
+        Plain cells are turned into nodes directly. The other ones are parsed together in a single pass,
+        separated by paragraphs, and their nodes are then split back into entries. This gives the same nodes
+        as parsing each cell on its own, which is much slower for tables with hundreds of options.
+
+        Parameters
+        ----------
+        cells : list of str
+            The reST of each cell.
+
+        Returns
+        -------
+        list of nodes.entry
+            The entries, in the same order as the cells.
+        """
+        settings = self.state.document.settings
+        plain_text = not (getattr(settings, "pep_references", None) or getattr(settings, "rfc_references", None))
+
+        entries = []
+        batch = []
+        batched = []
+        for value in cells:
             entry = nodes.entry()
-            result = ViewList(value.split("\n"))
-            self.state.nested_parse(result, 0, entry)
-            return entry
+            entries.append(entry)
+            if LITERAL_CELL.fullmatch(value):
+                entry += nodes.paragraph(value, "", nodes.literal(value, value[2:-2]))
+            elif plain_text and PLAIN_CELL.fullmatch(value):
+                entry += nodes.paragraph(value, value)
+            else:
+                # the lines keep their offset within the cell, like when the cell is parsed on its own
+                batch.extend((line, offset) for offset, line in enumerate(value.split("\n")))
+                batch.extend([("", 0), (CELL_SEPARATOR, 0), ("", 0)])
+                batched.append(entry)
+
+        if batched:
+            parsed = nodes.Element()
+            lines = StringList([line for line, _ in batch], items=[(None, offset) for _, offset in batch])
+            self.state.nested_parse(lines, 0, parsed)
+            cell = iter(batched)
+            entry = next(cell)
+            for node in parsed.children[:]:
+                if isinstance(node, nodes.paragraph) and node.astext() == CELL_SEPARATOR:
+                    entry = next(cell, None)
+                else:
+                    entry += node
+
+        return entries
+
+    @staticmethod
+    def is_simple_list(desc, items):
+        """
+        Return True if a bulleted list of the given items, after the description, can be built with make_list
+        instead of being parsed with the description. Each item must be a single line that only contains
+        inline markup, and the description must not end with a bulleted list that the items would continue,
+        or with "::", which would turn them into a literal block.
+        """
+        lines = [line.strip() for line in desc.splitlines() if line.strip()]
+        if lines and (lines[-1].startswith("-") or lines[-1].endswith("::")):
+            return False
+        return not any("\n" in item or "\r" in item or item.rstrip().endswith("::") for item in items)
+
+    def make_list(self, items):
+        """
+        Return the bulleted list that parsing the items would give, only parsing their inline markup.
+        """
+        bullet_list = nodes.bullet_list(bullet="-")
+        for item in items:
+            text = item.rstrip()
+            text_nodes, messages = self.state.inline_text(text, self.lineno)
+            bullet_list += nodes.list_item(item, nodes.paragraph(text, "", *text_nodes), *messages)
+        return bullet_list
+
+    def collect_rows(self):
+        # The RST inside the cells gets rendered by parse_cells. The cells of
+        # all rows are collected first so that they can be parsed together.
+        cells = []
+        add_col = cells.append
+        # the lists of choices that are built directly, by the index of their cell
+        choice_lists = {}
 
         rows = []
         groups = []
         # options
         if self.options["type"] == "options":
             for key, value in self.defaultOptions.items():
-                trow = nodes.row()
                 # first add the name column, with text = key
                 # this is the name of the option, wrapped in double backticks
-                trow += add_col("``" + key + "``")
+                add_col("``" + key + "``")
                 # this is the type of the option
                 # __name__ extracts the name of the datatype (e.g. str, float etc.)
                 # otherwise this will display <class 'str'> etc
                 defaultType = value[0]
                 if isinstance(defaultType, tuple):
                     types = [str(t.__name__) for t in defaultType]
-                    trow += add_col(" or ".join(types))
+                    add_col(" or ".join(types))
                 else:
-                    trow += add_col(str(defaultType.__name__))
+                    add_col(str(defaultType.__name__))
                 # this is the default value
                 # here we do some type checking if we get a list of possible choices
                 # TODO: could potentially import baseclasses and use existing code there
@@ -153,7 +250,7 @@ class OptionsTable(Table):
                 # wrap default value in verbatim if str
                 if defaultType == str:
                     defaultValue = f"``{defaultValue}``"
-                trow += add_col(str(defaultValue))
+                add_col(str(defaultValue))
                 # this is the description from the yaml file
                 # for choices, we expect a field called desc containing general description
                 # plus one field for each possible choice
@@ -165,20 +262,27 @@ class OptionsTable(Table):
                         f"The description for option '{key}' is missing from the YAML file {self.filename}"
                     ) from e
                 if choices:
-                    for choice in value[1]:
-                        desc += f"\n\n-  ``{choice}``: \t{self.yaml[key][choice]}"
+                    items = [f"``{choice}``: \t{self.yaml[key][choice]}" for choice in value[1]]
+                    if self.is_simple_list(desc, items):
+                        choice_lists[len(cells)] = items
+                    else:
+                        for item in items:
+                            desc += f"\n\n-  {item}"
                 # if there are no choices, we just pick out the entry from yaml
-                trow += add_col(desc)
-                rows.append(trow)
+                add_col(desc)
         # informs
         elif self.options["type"] == "informs":
             for key, value in self.informs.items():
-                trow = nodes.row()
                 # first add the name column, with text = key
-                trow += add_col("``" + str(key) + "``")
+                add_col("``" + str(key) + "``")
                 # add inform description
-                trow += add_col(value)
-                rows.append(trow)
+                add_col(value)
+
+        entries = self.parse_cells(cells)
+        for idx, items in choice_lists.items():
+            entries[idx] += self.make_list(items)
+        for i in range(0, len(entries), self.N_COLS):
+            rows.append(nodes.row("", *entries[i : i + self.N_COLS]))
 
         return rows, groups
 
@@ -209,4 +313,8 @@ class OptionsTable(Table):
 
 
 def setup(app):
+    app.setup_extension("sphinx_mdolab_theme.ext.timings")
     app.add_directive("optionstable", OptionsTable)
+    # shared with optionslist
+    if "mdolab_options_manifest" not in app.config:
+        app.add_config_value("mdolab_options_manifest", "", "env")
@@ -0,0 +1,89 @@
+"""
+Sphinx extension that reports the cost of the custom directives at the end of the build.
+
+It is set up automatically by the extensions whose directives are instrumented. The measurements are
+written to a JSON report, and the slowest directives are printed.
+"""
+
+# Standard Python modules
+import json
+import os
+
+# External modules
+import sphinx
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+
+def purge_timings(app, env, docname):
+    """Forget the measurements of a document that is about to be read again."""
+    getattr(env, "mdolab_directive_timings", {}).pop(docname, None)
+
+
+def merge_timings(app, env, docnames, other):
+    """Add the measurements gathered by parallel reader processes."""
+    if not hasattr(env, "mdolab_directive_timings"):
+        env.mdolab_directive_timings = {}
+    timings = getattr(other, "mdolab_directive_timings", {})
+    for docname in docnames:
+        if docname in timings:
+            env.mdolab_directive_timings[docname] = timings[docname]
+
+
+def write_report(app, exception):
+    """Write the JSON report and print the slowest directives."""
+    if exception is not None:
+        return
+
+    records = [record for docs in getattr(app.env, "mdolab_directive_timings", {}).values() for record in docs]
+    if not records:
+        return
+    records.sort(key=lambda record: record["wall"], reverse=True)
+
+    report_file = app.config.mdolab_directive_report or os.path.join(app.doctreedir, "directive_timings.json")
+    report_file = os.path.join(app.confdir, report_file)
+    os.makedirs(os.path.dirname(report_file), exist_ok=True)
+    with open(report_file, "w") as f:
+        json.dump(
+            {
+                "total_wall": sum(record["wall"] for record in records),
+                "directives": records,
+            },
+            f,
+            indent=1,
+        )
+
+    # values given on the command line with -D are strings
+    top = records[: int(app.config.mdolab_directive_top)]
+    if not top:
+        return
+
+    logger.info("slowest directives (full report in %s):", report_file)
+    logger.info("%8s %8s %8s %6s %10s %-12s  %s", "wall", "cpu", "childcpu", "procs", "rss(MB)", "cache", "location")
+    for record in top:
+        logger.info(
+            "%8.2f %8.2f %8.2f %6d %10.1f %-12s  %s:%d (%s)",
+            record["wall"],
+            record["cpu"],
+            record["child_cpu"],
+            record["subprocesses"],
+            record["peak_child_rss_kb"] / 1024,
+            record["cache"] or "-",
+            record["docname"],
+            record["line"],
+            record["directive"],
+        )
+
+
+def setup(app):
+    """Register the configuration values and the event handlers."""
+    app.add_config_value("mdolab_directive_budget", None, "")
+    app.add_config_value("mdolab_directive_report", "", "")
+    app.add_config_value("mdolab_directive_top", 10, "")
+
+    app.connect("env-purge-doc", purge_timings)
+    app.connect("env-merge-info", merge_timings)
+    app.connect("build-finished", write_report)
+
+    return {"version": sphinx.__display_version__, "parallel_read_safe": True}
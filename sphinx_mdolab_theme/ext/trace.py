@@ -0,0 +1,129 @@
+"""
+Sphinx extension that records a timeline of the build in the Chrome trace format.
+
+Add ``sphinx_mdolab_theme.ext.trace`` to the extensions to turn it on. The trace shows the reading of
+each document in the process that read it, the custom directives, and the subprocesses they wait on
+(``mpirun``, ``openmdao n2``, shell commands, the embedded code workers). Open it in
+https://ui.perfetto.dev or chrome://tracing.
+"""
+
+# Standard Python modules
+import glob
+import json
+import os
+import shutil
+import tempfile
+
+# External modules
+import sphinx
+from sphinx.util import logging
+
+# First party modules
+from ..utils.instrument import configure_trace, trace_clock, trace_event
+
+logger = logging.getLogger(__name__)
+
+# the Sphinx process, and when it loaded this extension
+_main_pid = None
+_start = None
+_trace_dir = None
+
+# when the documents started being written, if they have
+_write_start = None
+
+
+def on_builder_inited(app):
+    trace_event("builder-inited", "sphinx", "i", builder=app.builder.name)
+
+
+def on_env_before_read_docs(app, env, docnames):
+    trace_event("read", "phase", "B", documents=len(docnames))
+
+
+def on_source_read(app, docname, source):
+    trace_event(docname, "read", "B")
+
+
+def on_doctree_read(app, doctree):
+    trace_event(app.env.docname, "read", "E")
+
+
+def on_env_updated(app, env):
+    trace_event("read", "phase", "E")
+
+
+def on_doctree_resolved(app, doctree, docname):
+    global _write_start
+
+    if _write_start is None:
+        _write_start = trace_clock()
+    trace_event("doctree-resolved", "write", "i", docname=docname)
+
+
+def on_html_page_context(app, pagename, templatename, context, doctree):
+    trace_event("html-page-context", "write", "i", pagename=pagename, template=templatename)
+
+
+def write_trace(app, exception):
+    """Combine the events written by each process into the trace file."""
+    global _trace_dir, _write_start
+
+    if _trace_dir is None or os.getpid() != _main_pid:
+        return
+
+    now = trace_clock()
+    if _write_start is not None:
+        trace_event("write", "phase", "X", ts=_write_start, dur=now - _write_start)
+    trace_event("build", "phase", "X", ts=_start, dur=now - _start, failed=exception is not None)
+    configure_trace(None)
+
+    events = []
+    pids = set()
+    for filename in sorted(glob.glob(os.path.join(_trace_dir, "*.jsonl"))):
+        with open(filename) as f:
+            for line in f:
+                # a process killed while writing leaves a partial last line
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                events.append(event)
+                pids.add(event["pid"])
+    for pid in sorted(pids):
+        name = "sphinx-build" if pid == _main_pid else "sphinx worker %d" % pid
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": name}})
+
+    shutil.rmtree(_trace_dir, ignore_errors=True)
+    _trace_dir = None
+    _write_start = None
+
+    trace_file = app.config.mdolab_trace_file or os.path.join(app.doctreedir, "build_trace.json")
+    trace_file = os.path.join(app.confdir, trace_file)
+    os.makedirs(os.path.dirname(trace_file), exist_ok=True)
+    with open(trace_file, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    logger.info("build trace written to %s", trace_file)
+
+
+def setup(app):
+    """Start tracing and register the event handlers."""
+    global _main_pid, _start, _trace_dir
+
+    app.add_config_value("mdolab_trace_file", "", "")
+
+    # start right away so that the build span also covers loading the extensions and the configuration
+    _main_pid = os.getpid()
+    _start = trace_clock()
+    _trace_dir = tempfile.mkdtemp(prefix="sphinx-trace-")
+    configure_trace(_trace_dir)
+
+    app.connect("builder-inited", on_builder_inited)
+    app.connect("env-before-read-docs", on_env_before_read_docs)
+    app.connect("source-read", on_source_read)
+    app.connect("doctree-read", on_doctree_read)
+    app.connect("env-updated", on_env_updated)
+    app.connect("doctree-resolved", on_doctree_resolved)
+    app.connect("html-page-context", on_html_page_context)
+    app.connect("build-finished", write_trace)
+
+    return {"version": sphinx.__display_version__, "parallel_read_safe": True, "parallel_write_safe": True}
@@ -0,0 +1,167 @@
+"""
+Bounded capture of the output of embedded code.
+
+Only the beginning and the end of a long output are kept, with a marker in between saying how much was
+left out, so that a snippet that prints a huge array or a verbose optimizer log can't use up the memory
+of the build or bloat the generated HTML. The indicator lines that separate the outputs of interleaved
+blocks are kept even when they fall in the part left out, so that each output stays with its block.
+"""
+
+# Standard Python modules
+import io
+
+# default maximum number of bytes kept from the output of a snippet, and how many of those come from its end
+DEFAULT_LIMIT = 1024**2
+DEFAULT_TAIL = 64 * 1024
+
+ELISION_MARKER = "\n\n... [%d bytes of output omitted] ...\n\n"
+
+# start of the lines printed between the outputs of interleaved blocks, see
+# docutil.insert_output_start_stop_indicators, and the longest of those lines that is looked for
+OUTPUT_INDICATOR = b">>>>>"
+MAX_INDICATOR_LENGTH = 32
+
+_limit = DEFAULT_LIMIT
+_tail = DEFAULT_TAIL
+
+
+def _could_be_indicator(line):
+    return len(line) <= MAX_INDICATOR_LENGTH and OUTPUT_INDICATOR.startswith(line[: len(OUTPUT_INDICATOR)])
+
+
+class BoundedOutput(io.TextIOBase):
+    """
+    A text stream that keeps at most `limit` bytes of what is written to it: the first ``limit - tail``
+    bytes and the last `tail` bytes, plus the output indicator lines found in the bytes in between.
+
+    Parameters
+    ----------
+    limit : int or None
+        Maximum number of bytes kept. None keeps everything.
+    tail : int
+        Number of bytes kept from the end of the output.
+    """
+
+    def __init__(self, limit=None, tail=0):
+        super().__init__()
+        self.limit = limit
+        self.tail_size = 0 if limit is None else min(tail, limit)
+        self.dropped = 0
+        self._head = bytearray()
+        self._head_full = False
+        self._tail = bytearray()
+
+        # the indicator lines found in the dropped bytes, with the number of bytes dropped before each of them,
+        # the number of bytes dropped since the last one, and the dropped start of the current line while it
+        # could still be an indicator
+        self._indicators = []
+        self._omitted = 0
+        self._line = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        """Write a string, returning its length."""
+        self.feed(s.encode("utf-8", "surrogateescape"))
+        return len(s)
+
+    def feed(self, data):
+        """
+        Write raw bytes.
+
+        Parameters
+        ----------
+        data : bytes
+            The bytes to write.
+        """
+        if self.limit is None:
+            self._head += data
+            return
+
+        if not self._head_full:
+            room = self.limit - self.tail_size - len(self._head)
+            self._head += data[:room]
+            data = data[room:]
+            if not data:
+                return
+
+            # the head is full: an indicator it would cut goes on with the rest of the output, in one piece
+            start = self._head.rfind(b"\n") + 1
+            if start < len(self._head) and _could_be_indicator(self._head[start:]):
+                data = bytes(self._head[start:]) + data
+                del self._head[start:]
+            self._head_full = True
+            if self._head and not self._head.endswith(b"\n"):
+                self._line = None
+
+        self._tail += data
+        excess = len(self._tail) - self.tail_size
+        if excess > 0:
+            self._drop(self._tail[:excess])
+            del self._tail[:excess]
+
+    def _drop(self, data):
+        """Drop bytes from the middle of the output, except for the indicator lines among them."""
+        self.dropped += len(data)
+        *lines, rest = data.split(b"\n")
+        for line in lines:
+            self._drop_partial(line)
+            if self._line is not None and self._line.startswith(OUTPUT_INDICATOR):
+                self._indicators.append((self._omitted, bytes(self._line)))
+                self._omitted = 0
+                self.dropped -= len(self._line) + 1
+            else:
+                self._omitted += len(self._line or b"") + 1
+            self._line = bytearray()
+        self._drop_partial(rest)
+
+    def _drop_partial(self, data):
+        """Drop bytes that don't end a line, holding on to them while they could start an indicator."""
+        if self._line is not None:
+            self._line += data
+            if _could_be_indicator(self._line):
+                return
+            data = self._line
+            self._line = None
+        self._omitted += len(data)
+
+    def getvalue(self):
+        """
+        Return the kept output, with an elision marker where bytes were dropped.
+        """
+        tail = bytes(self._tail)
+        omitted = self._omitted
+        if self._line:
+            # the start of an indicator that the tail finishes
+            if (self._line + tail).startswith(OUTPUT_INDICATOR):
+                tail = bytes(self._line) + tail
+            else:
+                omitted += len(self._line)
+
+        parts = [self._head]
+        for before, indicator in self._indicators:
+            if before:
+                parts.append((ELISION_MARKER % before).encode())
+            parts.append(indicator + b"\n")
+        if omitted:
+            parts.append((ELISION_MARKER % omitted).encode())
+        parts.append(tail)
+        return b"".join(parts).decode("utf-8", "ignore")
+
+
+def configure_output_limit(limit=DEFAULT_LIMIT, tail=DEFAULT_TAIL):
+    """
+    Set the limits used for the output of embedded code. A limit of 0 or None keeps everything.
+    """
+    global _limit, _tail
+
+    _limit = limit or None
+    _tail = tail
+
+
+def get_output_limit():
+    """
+    Return the (limit, tail) used for the output of embedded code.
+    """
+    return _limit, _tail
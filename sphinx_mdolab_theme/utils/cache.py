@@ -0,0 +1,352 @@
+"""
+A persistent, content-addressed cache for the results of running code embedded in the docs.
+"""
+
+# Standard Python modules
+import fnmatch
+import functools
+import glob
+import hashlib
+import importlib.machinery
+import importlib.metadata
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+# First party modules
+from .bounded_output import get_output_limit
+from .source_index import build_file_stamp, find_local_dependencies, find_spec_static, getsource
+
+# packages whose versions can change the output of embedded code
+FINGERPRINT_PACKAGES = ["numpy", "scipy", "matplotlib", "openmdao", "mpi4py", "petsc4py", "sphinx_mdolab_theme"]
+
+# packages whose compiled extensions tell which of their optional features are available, e.g. the
+# optimizers of pyoptsparse
+OPTIONAL_PACKAGES = ["mpi4py", "petsc4py", "pyoptsparse"]
+
+MPI_LAUNCHERS = ["mpirun", "mpiexec"]
+
+RESULT_FILE = "result.json"
+
+# the contents hash of each file hashed into a cache key, with the stamp of the file it was computed for
+_file_hashes = {}
+
+
+def hash_text(*parts):
+    """
+    Return the sha256 hex digest of the given strings.
+
+    Parameters
+    ----------
+    *parts : str
+        The strings to hash. Each one is separated from the next by a null byte so that
+        ("ab", "c") and ("a", "bc") hash differently.
+
+    Returns
+    -------
+    str
+        The hex digest.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8", "surrogateescape"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def hash_file(path):
+    """
+    Return the sha256 hex digest of the contents of a file, or an empty string if it can't be read.
+    """
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    except OSError:
+        return ""
+    return h.hexdigest()
+
+
+def hash_source_file(path):
+    """
+    Return the sha256 hex digest of a source file, hashing it again only if it changed since the last call.
+    """
+    stamp = build_file_stamp(path)
+    cached = _file_hashes.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    digest = hash_file(path)
+    _file_hashes[path] = (stamp, digest)
+    return digest
+
+
+@functools.lru_cache(maxsize=None)
+def interpreter_fingerprint():
+    """
+    Return a string identifying the interpreter and the versions of the packages that
+    embedded code typically depends on.
+    """
+    versions = []
+    for pkg in FINGERPRINT_PACKAGES:
+        try:
+            versions.append("%s=%s" % (pkg, importlib.metadata.version(pkg)))
+        except importlib.metadata.PackageNotFoundError:
+            versions.append("%s=" % pkg)
+    return hash_text(sys.executable, sys.version, *versions)
+
+
+def _extension_modules(pkg):
+    try:
+        spec = find_spec_static(pkg)
+    except (ImportError, ValueError):
+        spec = None
+    if spec is None:
+        return ["%s:missing" % pkg]
+    if spec.submodule_search_locations is None:
+        return ["%s:%s" % (pkg, os.path.basename(spec.origin or ""))]
+
+    found = []
+    for location in spec.submodule_search_locations:
+        for root, dirs, fnames in os.walk(location):
+            dirs.sort()
+            found.extend(
+                "%s:%s" % (pkg, os.path.relpath(os.path.join(root, fname), location))
+                for fname in sorted(fnames)
+                if fname.endswith(tuple(importlib.machinery.EXTENSION_SUFFIXES))
+            )
+    return found
+
+
+@functools.lru_cache(maxsize=None)
+def environment_fingerprint():
+    """
+    Return a string identifying everything installed in the environment: the interpreter, the versions of
+    all the distributions, the compiled extensions of the OPTIONAL_PACKAGES and the MPI launchers.
+
+    Results that depend on what is installed, e.g. skips, are only reused while this stays the same.
+    """
+    parts = [interpreter_fingerprint()]
+    parts.extend(sorted("%s=%s" % (dist.metadata["Name"], dist.version) for dist in importlib.metadata.distributions()))
+    for pkg in OPTIONAL_PACKAGES:
+        parts.extend(_extension_modules(pkg))
+    for launcher in MPI_LAUNCHERS:
+        parts.append("%s=%s" % (launcher, shutil.which(launcher) or ""))
+    return hash_text(*parts)
+
+
+def execution_key(code_to_run, path, layout, module=None, cls=None):
+    """
+    Compute the cache key for running a chunk of embedded code.
+
+    Parameters
+    ----------
+    code_to_run : str
+        The transformed code that will actually be executed.
+    path : str
+        The path given to the directive (a file or a dotted module path).
+    layout : list of str
+        The layout options of the directive.
+    module : module or None
+        The module containing the code.
+    cls : class or None
+        The class containing the code.
+
+    Returns
+    -------
+    str
+        The cache key.
+    """
+    # the file of the code and everything it imports from the project, since the output changes with them
+    files = find_local_dependencies(path)
+    if not files and module is not None and getattr(module, "__file__", None):
+        files = [module.__file__]
+    module_hash = hash_text(*(hash_source_file(filename) for filename in files))
+
+    if cls is not None:
+        try:
+            class_hash = hash_text(getsource(cls))
+        except (OSError, TypeError):
+            class_hash = ""
+        n_procs = getattr(cls, "N_PROCS", 1)
+    else:
+        class_hash = ""
+        n_procs = 1
+
+    return hash_text(
+        code_to_run,
+        module_hash,
+        class_hash,
+        n_procs,
+        ",".join(layout),
+        get_output_limit(),
+        interpreter_fingerprint(),
+    )
+
+
+class ExecutionCache(object):
+    """
+    An on-disk cache of (skipped, failed, output) results plus any files generated by the run.
+
+    An entry can also record the files the run read, with their contents hash, in which case it is only
+    used while none of them has changed. Entries whose result depends on what is installed, such as
+    skips, are only used while the environment_fingerprint stays the same.
+
+    Each entry lives in its own directory named after its key. The modification time of the entry's
+    result file is bumped whenever the entry is read, so entries can be evicted in least recently used
+    order once the cache grows beyond its size limit.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory where the cache entries are stored.
+    max_size : int
+        Maximum total size of the cache in bytes.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key, files=()):
+        """
+        Look up a cached result.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+        files : list of str
+            Absolute paths or glob patterns where any files stored with the entry should be restored to.
+            Files are matched up by their base name, and each path or pattern must match at least one.
+
+        Returns
+        -------
+        tuple or None
+            The cached (skipped, failed, output), or None if there is no usable entry.
+        """
+        entry_dir = self._entry_dir(key)
+        result_file = os.path.join(entry_dir, RESULT_FILE)
+        try:
+            with open(result_file, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not all(self._unchanged(*read) for read in entry.get("reads", [])):
+            return None
+        if entry.get("environment") not in (None, environment_fingerprint()):
+            return None
+
+        # restore the generated files, treating a missing one as a miss
+        stored = entry.get("files", [])
+        for pattern in files:
+            matches = fnmatch.filter(stored, os.path.basename(pattern))
+            if not matches:
+                return None
+            for base in matches:
+                try:
+                    shutil.copyfile(os.path.join(entry_dir, base), os.path.join(os.path.dirname(pattern), base))
+                except OSError:
+                    return None
+
+        # mark the entry as recently used
+        try:
+            os.utime(result_file)
+        except OSError:
+            pass
+
+        return entry["skipped"], entry["failed"], entry["output"]
+
+    @staticmethod
+    def _unchanged(path, stamp, digest):
+        current = build_file_stamp(path)
+        if current is not None and list(current) == stamp:
+            return True
+        # touched but possibly not changed, or removed
+        return hash_source_file(path) == digest
+
+    def put(self, key, skipped, failed, output, files=(), reads=(), depends_on_environment=False):
+        """
+        Store a result in the cache.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+        skipped : bool
+            True if the code was skipped.
+        failed : bool
+            True if the code failed.
+        output : str or list of str
+            The output of the run (one string per proc for MPI runs).
+        files : list of str
+            Absolute paths or glob patterns of files generated by the run to store alongside the result.
+        reads : list of str
+            Absolute paths of the files read by the run. The entry is only used while none of them
+            changes, or while they keep not existing.
+        depends_on_environment : bool
+            Only use the entry while the environment_fingerprint stays the same.
+        """
+        entry_dir = self._entry_dir(key)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+
+        # write into a private directory and rename it into place so that concurrent
+        # builds never see a partially written entry
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp", dir=os.path.dirname(entry_dir))
+        try:
+            stored = []
+            for pattern in files:
+                for fname in glob.glob(pattern):
+                    if os.path.isfile(fname):
+                        shutil.copyfile(fname, os.path.join(tmp_dir, os.path.basename(fname)))
+                        stored.append(os.path.basename(fname))
+            entry = {
+                "skipped": skipped,
+                "failed": failed,
+                "output": output,
+                "files": stored,
+                "reads": [(path, build_file_stamp(path), hash_source_file(path)) for path in sorted(set(reads))],
+                "environment": environment_fingerprint() if depends_on_environment else None,
+            }
+            with open(os.path.join(tmp_dir, RESULT_FILE), "w") as f:
+                json.dump(entry, f)
+
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def prune(self):
+        """
+        Evict least recently used entries until the cache fits within its size limit.
+
+        Returns
+        -------
+        int
+            The number of evicted entries.
+        """
+        entries = []
+        total = 0
+        for root, dirs, fnames in os.walk(self.cache_dir):
+            if RESULT_FILE not in fnames:
+                continue
+            size = sum(os.path.getsize(os.path.join(root, fname)) for fname in fnames)
+            entries.append((os.path.getmtime(os.path.join(root, RESULT_FILE)), size, root))
+            total += size
+            dirs[:] = []
+
+        evicted = 0
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            evicted += 1
+
+        return evicted
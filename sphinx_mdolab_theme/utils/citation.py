@@ -0,0 +1,340 @@
+"""
+Finding the citation of a class for the embed-bibtex directive without importing the class.
+
+The ``cite`` attribute is looked up in the source of the class and of its base classes, where it is
+usually assigned a string literal, or a module level constant holding one, in the class body or in
+``__init__``. When the source isn't enough to tell what an instance would have, the class is
+instantiated in a new Python process instead, so that its constructor can't affect the Sphinx process.
+
+When run as a script, this module is that process: it reads a request from stdin and writes the
+result to stdout using the messages of the protocol module.
+"""
+
+# Standard Python modules
+import ast
+import importlib
+import os
+import subprocess
+import sys
+import traceback
+
+# First party modules
+from .cache import environment_fingerprint, hash_source_file, hash_text
+from .instrument import note_cache, trace_span
+from .protocol import read_message, write_message
+from .source_index import find_bases_static, find_class_static, find_local_dependencies
+
+# the syntax tree of each indexed file, with the index it was parsed from
+_trees = {}
+
+# how many base classes to follow before giving up
+_MAX_DEPTH = 20
+
+
+class _Unknown(Exception):
+    """Raised when the source isn't enough to tell the citation of a class."""
+
+
+def _get_tree(index):
+    cached = _trees.get(index.filename)
+    if cached is not None and cached[0] is index:
+        return cached[1]
+    tree = ast.parse(index.text)
+    _trees[index.filename] = (index, tree)
+    return tree
+
+
+def _find_classdef(tree, qualname):
+    node = tree
+    for name in qualname.split("."):
+        for child in node.body:
+            if isinstance(child, ast.ClassDef) and child.name == name:
+                node = child
+                break
+        else:
+            # e.g. defined in an if block
+            raise _Unknown()
+    return node
+
+
+def _stores(node, match):
+    """Return True if anything matching `match` is assigned to in a statement."""
+    return any(isinstance(getattr(n, "ctx", None), ast.Store) and match(n) for n in ast.walk(node))
+
+
+def _simple_assignment(stmt, match):
+    """
+    Return the value of a statement that assigns to a target matching `match`, or None if it doesn't.
+
+    Raises _Unknown if the statement assigns to a matching target in any other way.
+    """
+    if isinstance(stmt, ast.Assign):
+        targets = stmt.targets
+    elif isinstance(stmt, ast.AnnAssign) and stmt.value is not None:
+        targets = [stmt.target]
+    else:
+        targets = []
+
+    if any(match(target) for target in targets):
+        return stmt.value
+    if _stores(stmt, match):
+        raise _Unknown()
+    return None
+
+
+def _calls_init(function):
+    return any(
+        isinstance(n, ast.Call) and isinstance(n.func, ast.Attribute) and n.func.attr == "__init__"
+        for n in ast.walk(function)
+    )
+
+
+def _class_assignments(classdef):
+    """
+    Return the values assigned to cite in the body of a class and in its __init__, and the __init__.
+    """
+    body_value = init = None
+
+    def is_cite(n):
+        return isinstance(n, ast.Name) and n.id == "cite"
+
+    for stmt in classdef.body:
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if stmt.name == "__init__":
+                init = stmt
+            continue
+        value = _simple_assignment(stmt, is_cite)
+        if value is not None:
+            body_value = value
+
+    if init is None or not init.args.args:
+        return body_value, None, init
+
+    self_name = init.args.args[0].arg
+
+    def is_self_cite(n):
+        return (
+            isinstance(n, ast.Attribute)
+            and n.attr == "cite"
+            and isinstance(n.value, ast.Name)
+            and n.value.id == self_name
+        )
+
+    init_value = None
+    for i, stmt in enumerate(init.body):
+        value = _simple_assignment(stmt, is_self_cite)
+        if value is not None:
+            init_value = value
+            # the constructor of the base class could assign it again
+            if any(_calls_init(later) for later in init.body[i + 1 :]):
+                raise _Unknown()
+
+    return body_value, init_value, init
+
+
+def _cite_assignments(found, inits_run, depth=0):
+    """
+    Yield the ("init" or "class", value, SourceIndex) of the assignments to cite in a class and its bases,
+    most derived first.
+    """
+    if depth > _MAX_DEPTH:
+        raise _Unknown()
+
+    modname, index, is_package, qualname = found
+    body_value, init_value, init = _class_assignments(_find_classdef(_get_tree(index), qualname))
+    if inits_run and init_value is not None:
+        yield "init", init_value, index
+    if body_value is not None:
+        yield "class", body_value, index
+
+    bases = find_bases_static(*found)
+    if bases is None:
+        raise _Unknown()
+
+    # a constructor that doesn't call the one of its base class keeps the base from assigning cite
+    inits_run = inits_run and (init is None or _calls_init(init))
+    for base in bases:
+        yield from _cite_assignments(base, inits_run, depth + 1)
+
+
+def _module_constant(index, name):
+    """
+    Return the value of a name assigned exactly once at module level.
+    """
+
+    def is_name(n):
+        return isinstance(n, ast.Name) and n.id == name
+
+    tree = _get_tree(index)
+    values = [
+        stmt.value
+        for stmt in tree.body
+        if isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and is_name(stmt.targets[0])
+    ]
+    if len(values) != 1 or sum(_stores(stmt, is_name) for stmt in tree.body) != 1:
+        raise _Unknown()
+    return values[0]
+
+
+def _evaluate(node, index):
+    if isinstance(node, ast.Name):
+        node = _module_constant(index, node.id)
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError):
+        raise _Unknown()
+
+
+def find_cite_static(module_path, class_name):
+    """
+    Find the citation of a class from its source, without importing it.
+
+    Parameters
+    ----------
+    module_path : str
+        The dotted path of the module.
+    class_name : str
+        The name of the class.
+
+    Returns
+    -------
+    str or None
+        The citation an instance of the class would have, or None if it can't be told from the source.
+    """
+    found = find_class_static(module_path + "." + class_name)
+    if found is None:
+        return None
+
+    assignment = None
+    try:
+        for kind, value, index in _cite_assignments(found, True):
+            if assignment is None or kind == "init":
+                assignment = value, index
+            if kind == "init":
+                break
+        if assignment is None:
+            return None
+        cite = _evaluate(*assignment)
+    except (_Unknown, SyntaxError):
+        return None
+
+    if not isinstance(cite, str) or not cite:
+        # leave the error for a missing citation to the import
+        return None
+    return cite
+
+
+def find_cite_isolated(module_path, class_name):
+    """
+    Find the citation of a class by instantiating it in a new Python process.
+
+    Parameters
+    ----------
+    module_path : str
+        The dotted path of the module.
+    class_name : str
+        The name of the class.
+
+    Returns
+    -------
+    dict
+        The "cite" of the instance, or None if it has none, and the formatted traceback "error" if the
+        class couldn't be instantiated, else None.
+    """
+    request = {"module": module_path, "class": class_name, "cwd": os.getcwd(), "sys_path": list(sys.path)}
+    with trace_span("cite", module=module_path):
+        p = subprocess.Popen([sys.executable, "-m", __name__], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            write_message(p.stdin, request)
+            p.stdin.close()
+            result = read_message(p.stdout)
+        except (EOFError, OSError):
+            result = None
+        p.stdout.close()
+        returncode = p.wait()
+
+    if result is None:
+        result = {"cite": None, "error": "Citation process died with exit code %d." % returncode}
+    return result
+
+
+def cite_key(module_path, class_name):
+    """
+    Return the cache key of the citation of a class, or None if the source of its module can't be found.
+
+    The citation can come from a base class or a constant of another module, so the key covers every source
+    file of the project that the module imports, and what is installed for the ones outside the project.
+    """
+    files = find_local_dependencies(module_path)
+    if not files:
+        return None
+    return hash_text("cite", module_path, class_name, *(hash_source_file(f) for f in files), environment_fingerprint())
+
+
+def get_cite(module_path, class_name, cache=None):
+    """
+    Return the citation of a class, from the cache, from its source, or from an instance in a new process.
+
+    Parameters
+    ----------
+    module_path : str
+        The dotted path of the module.
+    class_name : str
+        The name of the class.
+    cache : ExecutionCache or None
+        The cache of citations, keyed on the source of the module.
+
+    Returns
+    -------
+    str or None
+        The citation, or None if the class has none.
+    str or None
+        The formatted traceback if the class couldn't be instantiated, else None.
+    """
+    key = cite_key(module_path, class_name) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            note_cache("hit")
+            return cached[2], None
+
+    cite = find_cite_static(module_path, class_name)
+    if cite is not None:
+        note_cache("static")
+    else:
+        note_cache("miss")
+        result = find_cite_isolated(module_path, class_name)
+        if result["error"] is not None:
+            return None, result["error"]
+        cite = result["cite"]
+
+    if key is not None and cite:
+        cache.put(key, False, False, cite)
+    return cite, None
+
+
+def _instantiate(request):
+    os.chdir(request["cwd"])
+    sys.path[:] = request["sys_path"]
+    obj = getattr(importlib.import_module(request["module"]), request["class"])()
+    cite = getattr(obj, "cite", None)
+    return str(cite) if cite else None
+
+
+def main():
+    """
+    Instantiate the class of the request read from stdin and write its citation to stdout.
+    """
+    # keep the real stdout for the result and send anything printed by the class to stderr
+    with os.fdopen(os.dup(1), "wb") as channel:
+        os.dup2(2, 1)
+        request = read_message(sys.stdin.buffer)
+        try:
+            result = {"cite": _instantiate(request), "error": None}
+        except BaseException:
+            result = {"cite": None, "error": traceback.format_exc()}
+        write_message(channel, result)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ A collection of functions for modifying source code that is embeded into the Sph
 # Standard Python modules
 import ast
 from collections import namedtuple
+from contextlib import ExitStack
 import html as cgiesc
 import importlib
 import inspect
@@ -13,25 +14,43 @@ import os
 import re
 import subprocess
 import sys
-import tempfile
 import tokenize
 import traceback
 import unittest
 
 # External modules
 from docutils import nodes
-from redbaron import RedBaron
 from sphinx.errors import SphinxError
 from sphinx.writers.html5 import HTML5Translator
 from sphinx.writers.html import HTMLTranslator
 
 # First party modules
-from .general_utils import printoptions
+from .bounded_output import BoundedOutput, get_output_limit
+from .execd import run_in_execd
+from .general_utils import build_workdir, printoptions, private_workdir, working_directory
+from .instrument import note_subprocess, trace_span
+from .mpi_pool import MPIJob, get_mpi_job
+from .protocol import read_message, write_message
+from .read_set import dependency_reads, track_reads
+from .run_sub import error_result, make_request
+from .source_index import file_stamp, getsource, getsource_static, is_local_module
+from .source_tree import SourceTree
+from .worker_pool import get_pool
 
 sqlite_file = "feature_docs_unit_test_db.sqlite"  # name of the sqlite database file
 table_name = "feature_unit_tests"  # name of the table to be queried
 
-_sub_runner = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_sub.py")
+# module run by the processes that execute embedded code in isolation
+_sub_runner = __name__.rpartition(".")[0] + ".run_sub"
+
+# memoized results of get_source_code, keyed on the path given to it
+_resolved_sources = {}
+
+# a traceback, up to the line of the exception it ends with
+TRACEBACK_RE = re.compile(r"^Traceback \(most recent call last\):\n(?:[ \t].*\n)*(?P<exception>\S.*)$", re.MULTILINE)
+
+# the exception of code that failed because a module can't be found
+MISSING_DEPENDENCY_RE = re.compile(r"^ModuleNotFoundError: No module named '(?P<module>[\w.]+)'")
 
 
 # an input block consists of a block of code and a tag that marks the end of any
@@ -104,7 +123,7 @@ def remove_docstrings(source):
         Source with docstrings removed.
     """
     io_obj = StringIO(source)
-    out = ""
+    out = []
     prev_toktype = tokenize.INDENT
     last_lineno = -1
     last_col = 0
@@ -121,7 +140,7 @@ def remove_docstrings(source):
         if start_line > last_lineno:
             last_col = 0
         if start_col > last_col:
-            out += " " * (start_col - last_col)
+            out.append(" " * (start_col - last_col))
         # This series of conditionals removes docstrings:
         if token_type == tokenize.STRING:
             if prev_toktype != tokenize.INDENT:
@@ -135,7 +154,7 @@ def remove_docstrings(source):
                     # Catch whole-module docstrings:
                     if start_col > 0:
                         # Unlabelled indentation means we're inside an operator
-                        out += token_string
+                        out.append(token_string)
                     # Note regarding the INDENT token: The tokenize module does
                     # not label indentation inside of an operator (parens,
                     # brackets, and curly braces) as actual indentation.
@@ -146,41 +165,131 @@ def remove_docstrings(source):
                     #         "The spaces before this string do not get a token"
                     #     ]
         else:
-            out += token_string
+            out.append(token_string)
         prev_toktype = token_type
         last_col = end_col
         last_lineno = end_line
-    return out
+    return "".join(out)
+
+
+# asserts that become a print of their first argument, with the expected value (second argument) removed
+_method_asserts = [
+    "assertAlmostEqual",
+    "assertLess",
+    "assertGreater",
+    "assertEqual",
+    "assert_equal_arrays",
+    "assertTrue",
+    "assertFalse",
+]
 
+# assert functions that become a print of the actual value
+_function_asserts = ["assert_rel_error", "assert_near_equal", "assert_almost_equal"]
 
-def remove_redbaron_node(node, index):
+
+def _kept_assert_args(name, nargs):
+    """
+    Return the indices of the arguments of an assert call that are kept in the print statement.
     """
-    Utility function for removing a node using RedBaron.
+    keep = list(range(nargs))
+
+    if name in _method_asserts:
+        if name not in ["assertTrue", "assertFalse"] and nargs > 1:
+            # remove the expected value argument
+            keep.pop(1)
+    elif name == "assert_rel_error":
+        # If relative error tolerance is specified, there are 4 arguments
+        if nargs == 4:
+            # remove the relative error tolerance
+            keep.pop()
+        if keep:
+            keep.pop()  # remove the expected value
+        if keep:
+            # remove the first argument which is the TestCase
+            keep.pop(0)
+    else:
+        # If relative error tolerance is specified, there are 3 arguments
+        if nargs == 3:
+            # remove the relative error tolerance
+            keep.pop()
+        if keep:
+            keep.pop()  # remove the expected value
 
-    RedBaron has some problems with modifying code lines that run across
-    multiple lines. ( It is mentioned somewhere online but cannot seem to
-    find it now. )
+    return keep
 
-    RedBaron throws an Exception but when you check, it seems like it does
-    what you asked it to do. So, for now, we ignore the Exception.
+
+def _assert_print_edits(tree):
     """
+    Compute the edits that replace the assert calls in a SourceTree with print calls.
 
-    try:
-        node.value.remove(node.value[index])
-    except Exception as e:  # no choice but to catch the general Exception
-        if str(e).startswith("It appears that you have indentation in your CommaList"):
-            pass
+    Parameters
+    ----------
+    tree : SourceTree
+        The parsed source.
+
+    Returns
+    -------
+    list of tuple
+        The (start, end, text) replacements.
+    """
+    src = tree.source
+    edits = []
+
+    for node in ast.walk(tree.tree):
+        if not isinstance(node, ast.Call):
+            continue
+
+        func = node.func
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) and func.attr in _method_asserts:
+            # self.assertEqual(...)
+            name = func.attr
+        elif isinstance(func, ast.Name) and func.id in _function_asserts:
+            # assert_near_equal(...)
+            name = func.id
         else:
-            raise
+            continue
+
+        _, args, close_paren = tree.call_arguments(node)
+        if not args:
+            continue
+        keep = _kept_assert_args(name, len(args))
+
+        # keep the original text before the first argument, between each kept argument and its
+        # successor, and after the last argument
+        start, func_end = tree.node_span(func)
+        pieces = ["print", src[func_end : args[0][0]]]
+        for j, i in enumerate(keep):
+            pieces.append(src[args[i][0] : args[i][1]])
+            if j < len(keep) - 1:
+                pieces.append(src[args[i][1] : args[i + 1][0]])
+        pieces.append(src[args[-1][1] : close_paren])
+
+        edits.append((start, close_paren, "".join(pieces)))
+
+    return edits
+
+
+def _docstring_edits(tree, root):
+    """
+    Compute the edits that remove all string expression statements (i.e. docstrings) under an ast node.
+
+    Like remove_docstrings, only the string itself is removed, leaving an empty line behind.
+    """
+    edits = []
+    for node in ast.walk(root):
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            start, end = tree.node_span(node)
+            edits.append((start, end, ""))
+    return edits
 
 
 def replace_asserts_with_prints(src):
     """
     Replace asserts with print statements.
 
-    Using RedBaron, replace some assert calls with print statements that print the actual
-    value given in the asserts. Depending on the calls, the actual value can be the first or second
-    argument.
+    Replace some assert calls with print statements that print the actual value given in the asserts.
+    Depending on the calls, the actual value can be the first or second argument. Only the removed
+    arguments are touched, so the formatting of the remaining source is preserved.
 
     Parameters
     ----------
@@ -192,73 +301,63 @@ def replace_asserts_with_prints(src):
     str
         String containing source with asserts replaced by prints.
     """
-    rb = RedBaron(src)  # convert to RedBaron internal structure
-
-    # findAll is slow, so only check the ones that are present.
-    base_assert = [
-        "assertAlmostEqual",
-        "assertLess",
-        "assertGreater",
-        "assertEqual",
-        "assert_equal_arrays",
-        "assertTrue",
-        "assertFalse",
-    ]
-    used_assert = [item for item in base_assert if item in src]
-
-    for assert_type in used_assert:
-        assert_nodes = rb.findAll("NameNode", value=assert_type)
-        for assert_node in assert_nodes:
-            assert_node = assert_node.parent
-            remove_redbaron_node(assert_node, 0)  # remove 'self' from the call
-            assert_node.value[0].replace("print")
-            if assert_type not in ["assertTrue", "assertFalse"]:
-                # remove the expected value argument
-                remove_redbaron_node(assert_node.value[1], 1)
-
-    if "assert_rel_error" in src:
-        assert_nodes = rb.findAll("NameNode", value="assert_rel_error")
-        for assert_node in assert_nodes:
-            assert_node = assert_node.parent
-            # If relative error tolerance is specified, there are 4 arguments
-            if len(assert_node.value[1]) == 4:
-                # remove the relative error tolerance
-                remove_redbaron_node(assert_node.value[1], -1)
-            remove_redbaron_node(assert_node.value[1], -1)  # remove the expected value
-            # remove the first argument which is the TestCase
-            remove_redbaron_node(assert_node.value[1], 0)
-            #
-            assert_node.value[0].replace("print")
-
-    if "assert_near_equal" in src:
-        assert_nodes = rb.findAll("NameNode", value="assert_near_equal")
-        for assert_node in assert_nodes:
-            assert_node = assert_node.parent
-            # If relative error tolerance is specified, there are 3 arguments
-            if len(assert_node.value[1]) == 3:
-                # remove the relative error tolerance
-                remove_redbaron_node(assert_node.value[1], -1)
-            remove_redbaron_node(assert_node.value[1], -1)  # remove the expected value
-            assert_node.value[0].replace("print")
-
-    if "assert_almost_equal" in src:
-        assert_nodes = rb.findAll("NameNode", value="assert_almost_equal")
-        for assert_node in assert_nodes:
-            assert_node = assert_node.parent
-            # If relative error tolerance is specified, there are 3 arguments
-            if len(assert_node.value[1]) == 3:
-                # remove the relative error tolerance
-                remove_redbaron_node(assert_node.value[1], -1)
-            remove_redbaron_node(assert_node.value[1], -1)  # remove the expected value
-            assert_node.value[0].replace("print")
-
-    return rb.dumps()
+    # parsing is the expensive part, so only do it if an assert is present.
+    if not any(item in src for item in _method_asserts + _function_asserts):
+        return src
+
+    tree = SourceTree(src)
+    return tree.dumps(_assert_print_edits(tree))
+
+
+class FunctionSource(object):
+    """
+    The source of a single function or method, parsed once and turned into the code embedded in the docs.
+
+    This does the work of dedent, strip_decorators, strip_header, remove_docstrings,
+    replace_asserts_with_prints and remove_initial_empty_lines with a single parse, and emits the
+    resulting text once.
+
+    Parameters
+    ----------
+    source : str
+        The source of the function as returned by inspect.getsource. It may be indented and decorated.
+    """
+
+    def __init__(self, source):
+        self.tree = SourceTree(dedent(source))
+        self.func = next(
+            node for node in self.tree.tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+        )
+        self._body_start = self.tree.body_start(self.func)
+
+    def body(self, strip_docstrings=False, asserts_to_prints=False):
+        """
+        Return the dedented body of the function, without its decorators and header.
+
+        Parameters
+        ----------
+        strip_docstrings : bool
+            Remove the docstrings.
+        asserts_to_prints : bool
+            Replace asserts with print statements.
+
+        Returns
+        -------
+        str
+            The body of the function.
+        """
+        edits = []
+        if strip_docstrings:
+            edits.extend(_docstring_edits(self.tree, self.func))
+        if asserts_to_prints and any(item in self.tree.source for item in _method_asserts + _function_asserts):
+            edits.extend(_assert_print_edits(self.tree))
+
+        return dedent(self.tree.dumps(edits, start=self._body_start))
 
 
 def remove_initial_empty_lines(source):
     """
-    Some initial empty lines were added to keep RedBaron happy.
-    Need to strip these out before we pass the source code to the
+    Strip any initial empty lines before we pass the source code to the
     directive for including source code into feature doc files.
     """
 
@@ -270,6 +369,8 @@ def get_source_code(path):
     """
     Return source code as a text string.
 
+    Results are memoized on the path, and reused until the file containing the source changes.
+
     Parameters
     ----------
     path : str
@@ -289,6 +390,28 @@ def get_source_code(path):
         The class method specified by path.
     """
 
+    cached = _resolved_sources.get(path)
+    if cached is not None:
+        filename, stamp, result = cached
+        if file_stamp(filename) == stamp:
+            return result
+
+    result = _get_source_code(path)
+
+    if path.endswith(".py"):
+        filename = path
+    else:
+        _, _, module, class_obj, method_obj = result
+        try:
+            filename = inspect.getsourcefile(method_obj or class_obj or module)
+        except TypeError:
+            filename = None
+    _resolved_sources[path] = (filename, file_stamp(filename), result)
+
+    return result
+
+
+def _get_source_code(path):
     indent = 0
     class_obj = None
     method_obj = None
@@ -303,7 +426,7 @@ def get_source_code(path):
         # First, assume module path since we want to support loading a full module as well.
         try:
             module = importlib.import_module(path)
-            source = inspect.getsource(module)
+            source = getsource(module)
 
         except ImportError:
             # Second, assume class and see if it works
@@ -314,7 +437,7 @@ def get_source_code(path):
                 module = importlib.import_module(module_path)
                 class_name = parts[-1]
                 class_obj = getattr(module, class_name)
-                source = inspect.getsource(class_obj)
+                source = getsource(class_obj)
                 indent = 1
 
             except ImportError:
@@ -325,24 +448,90 @@ def get_source_code(path):
                 method_name = parts[-1]
                 class_obj = getattr(module, class_name)
                 method_obj = getattr(class_obj, method_name)
-                source = inspect.getsource(method_obj)
+                source = getsource(method_obj)
                 indent = 2
 
     return remove_leading_trailing_whitespace_lines(source), indent, module, class_obj, method_obj
 
 
+def get_source_code_static(path):
+    """
+    Return source code as a text string without importing the module it comes from.
+
+    This is enough when the code is only shown, not run.
+
+    Parameters
+    ----------
+    path : str
+        Path to a file, module, function, class, or class method.
+
+    Returns
+    -------
+    tuple or None
+        The source code, the indentation level and whether the path is a TestCase class or a method
+        of one, or None if the source can't be found without importing the module.
+    """
+    if path.endswith(".py"):
+        source, indent, _, _, _ = get_source_code(path)
+        return source, indent, False
+
+    found = getsource_static(path)
+    if found is None:
+        return None
+
+    source, indent, is_test = found
+    return remove_leading_trailing_whitespace_lines(source), indent, is_test
+
+
+def _is_raise_skip_test(node):
+    """
+    Return True if the node is a 'raise unittest.SkipTest' statement.
+    """
+    if not isinstance(node, ast.Raise) or node.exc is None:
+        return False
+    exc = node.exc.func if isinstance(node.exc, ast.Call) else node.exc
+    return (
+        isinstance(exc, ast.Attribute)
+        and exc.attr == "SkipTest"
+        and isinstance(exc.value, ast.Name)
+        and exc.value.id == "unittest"
+    )
+
+
 def remove_raise_skip_tests(src):
     """
     Remove from the code any raise unittest.SkipTest lines since we don't want those in
     what the user sees.
+
+    A block that is left empty gets a 'pass' statement so that the code remains valid.
     """
-    rb = RedBaron(src)
-    raise_nodes = rb.findAll("RaiseNode")
-    for rn in raise_nodes:
-        # only the raise for SkipTest
-        if rn.value[:2].dumps() == "unittestSkipTest":
-            rn.parent.value.remove(rn)
-    return rb.dumps()
+    if "SkipTest" not in src:
+        return src
+
+    tree = SourceTree(src)
+
+    for node in ast.walk(tree.tree):
+        for field in ("body", "orelse", "finalbody"):
+            block = getattr(node, field, None)
+            if not isinstance(block, list):
+                continue
+
+            raise_nodes = [stmt for stmt in block if _is_raise_skip_test(stmt)]
+            for stmt in raise_nodes:
+                # only remove whole lines, leaving statements that share a line with other code alone
+                start = tree.offset(stmt.lineno, 0)
+                end = tree.offset(stmt.end_lineno + 1, 0)
+                stmt_start, stmt_end = tree.node_span(stmt)
+                after = src[stmt_end:end].strip()
+                if src[start:stmt_start].strip() or (after and not after.startswith("#")):
+                    continue
+                if len(raise_nodes) == len(block) and stmt is block[0]:
+                    indent = src[start:stmt_start]
+                    tree.replace(start, end, indent + "pass\n")
+                else:
+                    tree.replace(start, end, "")
+
+    return tree.dumps()
 
 
 def remove_leading_trailing_whitespace_lines(src):
@@ -371,47 +560,6 @@ def remove_leading_trailing_whitespace_lines(src):
     return "\n".join(lines[imin : imax + 1])
 
 
-def is_output_node(node):
-    """
-    Determine whether a RedBaron node may be expected to generate output.
-
-    Parameters
-    ----------
-    node : <Node>
-        a RedBaron Node.
-
-    Returns
-    -------
-    bool
-        True if node may be expected to generate output, otherwise False.
-    """
-    if node.type == "print":
-        return True
-
-    # lines with the following signatures and function names may generate output
-    output_signatures = [("name", "name", "call"), ("name", "name", "name", "call")]
-    output_functions = [
-        "setup",
-        "run_model",
-        "run_driver",
-        "check_partials",
-        "check_totals",
-        "list_inputs",
-        "list_outputs",
-        "list_problem_vars",
-    ]
-
-    if node.type == "atomtrailers" and len(node.value) in (3, 4):
-        sig = []
-        for val in node.value:
-            sig.append(val.type)
-        func_name = node.value[-2].value
-        if tuple(sig) in output_signatures and func_name in output_functions:
-            return True
-
-    return False
-
-
 def split_source_into_input_blocks(src):
     """
     Split source into blocks; the splits occur at inserted prints.
@@ -733,98 +881,172 @@ def sync_multi_output_blocks(run_output):
         return {}
 
 
-def run_code(code_to_run, path, module=None, cls=None, shows_plot=False, imports_not_required=False):
+def _run_isolated(request):
     """
-    Run the given code chunk and collect the output.
+    Run a request in a new Python process.
     """
+    with trace_span("run_sub", path=request["path"]):
+        p = subprocess.Popen([sys.executable, "-m", _sub_runner], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            write_message(p.stdin, request)
+            p.stdin.close()
+            result = read_message(p.stdout)
+        except (EOFError, OSError):
+            result = None
+        p.stdout.close()
+        returncode = p.wait()
 
-    skipped = False
-    failed = False
+    if result is None:
+        result = error_result("Embedded code process died with exit code %d." % returncode)
+    return result
 
-    if cls is None:
-        use_mpi = False
-    else:
-        try:
-            # External modules
-            import mpi4py  # noqa
-        except ImportError:
-            use_mpi = False
-        else:
-            N_PROCS = getattr(cls, "N_PROCS", 1)
-            use_mpi = N_PROCS > 1
 
+def _run_mpi(request, n_procs):
+    """
+    Run a request on n_procs MPI ranks and return the result of each rank.
+    """
+    job = get_mpi_job(n_procs)
+    if job is not None:
+        return job.run(request)
+
+    # a job just for this request
+    job = MPIJob(n_procs)
     try:
-        # use subprocess to run code to avoid any nasty interactions between codes
+        return job.run(request)
+    finally:
+        job.close()
 
-        # Move to the test directory in case there are files to read.
-        save_dir = os.getcwd()
 
-        if module is None:
-            code_dir = os.path.dirname(os.path.abspath(path))
-        else:
-            code_dir = os.path.dirname(os.path.abspath(module.__file__))
+def mpi_procs(cls):
+    """
+    Return the number of MPI processes the code of a test class runs on, which is 1 if MPI isn't available.
+    """
+    if cls is None:
+        return 1
+    try:
+        # External modules
+        import mpi4py  # noqa
+    except ImportError:
+        return 1
+    return getattr(cls, "N_PROCS", 1)
+
+
+def failed_on_missing_dependency(output, path=None):
+    """
+    Return True if the output of code that failed shows that it failed because a module isn't installed.
 
-        os.chdir(code_dir)
+    Only the exception the last traceback ends with counts. A module missing from a package of the project
+    itself, e.g. after it was renamed, is a bug in the project rather than a missing dependency, and so is
+    an ImportError for a name that a module doesn't define.
 
-        if use_mpi:
-            env = os.environ.copy()
+    Parameters
+    ----------
+    output : str or list of str
+        The output of the code.
+    path : str or None
+        The path given to the directive, whose top level package is part of the project if it is a dotted
+        path.
+    """
+    if not isinstance(output, str):
+        return False
 
-            # output will be written to one file per process
-            env["USE_PROC_FILES"] = "1"
+    tracebacks = list(TRACEBACK_RE.finditer(output))
+    if not tracebacks:
+        return False
+    match = MISSING_DEPENDENCY_RE.match(tracebacks[-1].group("exception"))
+    if match is None:
+        return False
 
-            env["OPENMDAO_CURRENT_MODULE"] = module.__name__
-            env["OPENMDAO_CODE_TO_RUN"] = code_to_run
+    package = match.group("module").split(".")[0]
+    if path is not None and not path.endswith(".py") and path.split(".")[0] == package:
+        return False
+    return not is_local_module(package)
 
-            p = subprocess.Popen(["mpirun", "-n", str(N_PROCS), sys.executable, _sub_runner], env=env)
-            p.wait()
 
-            # extract output blocks from all output files & merge them
-            output = []
-            for i in range(N_PROCS):
-                with open("%d.out" % i) as f:
-                    output.append(f.read())
-                os.remove("%d.out" % i)
+def run_code(
+    code_to_run, path, module=None, cls=None, shows_plot=False, imports_not_required=False, reads=None, writes=None
+):
+    """
+    Run the given code chunk and collect the output.
 
-        elif shows_plot:
-            if module is None:
-                # write code to a file so we can run it.
-                fd, code_to_run_path = tempfile.mkstemp()
-                with os.fdopen(fd, "w") as tmp:
-                    tmp.write(code_to_run)
-                try:
-                    p = subprocess.Popen(
-                        [sys.executable, code_to_run_path],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                        env=os.environ,
-                    )
-                    output, _ = p.communicate()
-                    if p.returncode != 0:
-                        failed = True
+    If a list is given as `reads`, the real paths of the files read by the code are added to it, including the
+    source files of the project that the code imports. If a list is given as `writes`, the real paths of the
+    files written by the code are added to it.
+    """
 
-                finally:
-                    os.remove(code_to_run_path)
-            else:
-                env = os.environ.copy()
+    skipped = False
+    failed = False
+
+    if reads is not None:
+        reads.extend(dependency_reads(path))
+
+    N_PROCS = mpi_procs(cls)
+    use_mpi = N_PROCS > 1
 
-                env["OPENMDAO_CURRENT_MODULE"] = module.__name__
-                env["OPENMDAO_CODE_TO_RUN"] = code_to_run
+    workdirs = ExitStack()
+    try:
+        # use subprocess to run code to avoid any nasty interactions between codes
 
-                p = subprocess.Popen(
-                    [sys.executable, _sub_runner], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env
+        # Run in the test directory in case there are files to read, through a private mirror of it so
+        # that snippets run concurrently by parallel builds don't share the files they write. During a build
+        # the snippets of a test file share one mirror, so that they can read the files written by earlier
+        # ones, e.g. a case recorder file.
+        code_file = os.path.abspath(path if module is None else module.__file__)
+        code_dir = os.path.dirname(code_file)
+        workdir = build_workdir(code_dir, code_file)
+        if workdir is None:
+            workdir = workdirs.enter_context(private_workdir(code_dir))
+
+        if use_mpi or shows_plot:
+            request = make_request(
+                code_to_run,
+                module_name=None if module is None else module.__name__,
+                path=os.path.abspath(path),
+                cwd=workdir,
+            )
+
+            if use_mpi:
+                results = _run_mpi(request, N_PROCS)
+                output = [result["output"] for result in results]
+            else:
+                # run in a fresh fork of the execution server or of a warm worker process if we can
+                result = run_in_execd(request)
+                if result is None:
+                    pool = get_pool()
+                    result = pool.run(request) if pool is not None else _run_isolated(request)
+                results = [result]
+                output = result["output"]
+
+            for result in results:
+                note_subprocess(result["maxrss"])
+                if reads is not None:
+                    reads.extend(result["reads"])
+                if writes is not None:
+                    writes.extend(result["writes"])
+
+            errors = [result for result in results if result["error"] is not None]
+            skips = [result for result in results if result["skip"] is not None]
+            if errors:
+                output = "Running of embedded code {} in docs failed due to: \n\n{}".format(
+                    path, "\n".join(result["output"] for result in errors)
                 )
-                output, _ = p.communicate()
-                if p.returncode != 0:
-                    failed = True
+                failed = True
+            elif skips:
+                output = skips[0]["skip"]
+                skipped = True
 
-            output = output.decode("utf-8", "ignore")
         else:
             # just exec() the code for serial tests.
+            # exec() has no cwd argument, so unlike the isolated runs above this changes the working directory
+            # of the Sphinx process, until the end of the run. That is still safe with -j: parallel reads run
+            # in forked processes of their own, and the pre-execution pass runs in-process code in worker
+            # processes as well, so no other code runs in this process meanwhile.
+            workdirs.enter_context(working_directory(workdir))
 
             # capture all output
             stdout = sys.stdout
             stderr = sys.stderr
-            strout = StringIO()
+            strout = BoundedOutput(*get_output_limit())
             sys.stdout = strout
             sys.stderr = strout
 
@@ -846,7 +1068,8 @@ def run_code(code_to_run, path, module=None, cls=None, shows_plot=False, imports
                         globals_dict = {}
 
                 try:
-                    exec(code_to_run, globals_dict)
+                    with track_reads() as tracked:
+                        exec(code_to_run, globals_dict)
                 except Exception as err:
                     # for actual errors, print code (with line numbers) to facilitate debugging
                     if not isinstance(err, unittest.SkipTest):
@@ -856,19 +1079,13 @@ def run_code(code_to_run, path, module=None, cls=None, shows_plot=False, imports
                 finally:
                     sys.stdout = stdout
                     sys.stderr = stderr
+                    if reads is not None:
+                        reads.extend(tracked.files)
+                    if writes is not None:
+                        writes.extend(tracked.outputs)
 
             output = strout.getvalue()
 
-    except subprocess.CalledProcessError as e:
-        output = e.output.decode("utf-8", "ignore")
-        # Get a traceback.
-        if "raise unittest.SkipTest" in output:
-            reason_for_skip = output.splitlines()[-1][len("unittest.case.SkipTest: ") :]
-            output = reason_for_skip
-            skipped = True
-        else:
-            output = "Running of embedded code {} in docs failed due to: \n\n{}".format(path, output)
-            failed = True
     except unittest.SkipTest as skip:
         output = str(skip)
         skipped = True
@@ -876,7 +1093,7 @@ def run_code(code_to_run, path, module=None, cls=None, shows_plot=False, imports
         output = "Running of embedded code {} in docs failed due to: \n\n{}".format(path, traceback.format_exc())
         failed = True
     finally:
-        os.chdir(save_dir)
+        workdirs.close()
 
     return skipped, failed, output
 
@@ -0,0 +1,484 @@
+"""
+A server that keeps the heavy modules used by embedded code (numpy, matplotlib, openmdao, ...) imported
+between builds, so that repeated builds don't pay for importing them again.
+
+The ``sphinx-mdolab-execd`` command listens on a Unix socket and forks a fresh child for every request
+it receives, which runs the code and sends the result back over the connection. The requests and results
+are the ones described in the run_sub module.
+
+The server exits once it has been idle for a while, and when a request arrives after the source file of a
+module it imported changed, since its children would otherwise run code against outdated modules. The
+build starts it again when it is needed, and runs code the usual way whenever it can't be reached.
+
+Whoever answers on the socket gets their reply unpickled by the build, and whoever connects to it gets
+their code run by the server, so both sides only talk to processes of the same user. The socket lives in
+a directory that only the user can write to, by default in $XDG_RUNTIME_DIR, and the user id of the
+process at the other end of each connection is checked where the platform reports it.
+"""
+
+# Standard Python modules
+import argparse
+import importlib
+import os
+import select
+import signal
+import socket
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    # Standard Python modules
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# First party modules
+from .cache import hash_text
+from .instrument import trace_span
+from .protocol import read_message, write_message
+from .run_sub import execute
+from .source_index import file_stamp
+from .worker_pool import DEFAULT_PRELOAD
+
+# how long the server waits for a request before it exits, in seconds
+DEFAULT_IDLE_TIMEOUT = 30 * 60
+
+# how often the server checks whether its running children are done, in seconds
+CHECK_INTERVAL = 1.0
+
+_socket_path = None
+
+
+def _is_private_dir(path, mask=0o022):
+    """
+    Return True if a path is a directory, and not a link to one, owned by the user and without any of the
+    permission bits in `mask`, so that no other user can put their own socket in it.
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and st.st_mode & mask == 0
+
+
+def default_socket_path():
+    """
+    Return the socket of the server for this user and Python interpreter.
+
+    The socket is in a directory of $XDG_RUNTIME_DIR, or else of the temporary directory named after the
+    user, that is created with access for the user only.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and _is_private_dir(runtime_dir, 0o077):
+        socket_dir = os.path.join(runtime_dir, "sphinx-mdolab")
+    else:
+        socket_dir = os.path.join(tempfile.gettempdir(), "sphinx-mdolab-%d" % os.getuid())
+    return os.path.join(socket_dir, "execd-%s.sock" % hash_text(sys.executable)[:12])
+
+
+def _socket_dir_ready(socket_path):
+    """
+    Create the directory of a socket if it doesn't exist, and return True if only the user can write to it.
+
+    Where the user of a peer can't be checked, other users must not be able to reach the socket at all.
+    """
+    socket_dir = os.path.dirname(os.path.abspath(socket_path))
+    try:
+        os.mkdir(socket_dir, 0o700)
+    except FileExistsError:
+        pass
+    except OSError:
+        return False
+    return _is_private_dir(socket_dir, 0o022 if hasattr(socket, "SO_PEERCRED") else 0o077)
+
+
+def _peer_uid(sock):
+    """
+    Return the user id of the process at the other end of a Unix socket, or None if the platform can't tell.
+    """
+    if hasattr(socket, "SO_PEERCRED"):
+        # Linux: struct ucred
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        return struct.unpack("3i", creds)[1]
+    return None
+
+
+def _trusted_peer(sock):
+    uid = _peer_uid(sock)
+    return uid is None or uid == os.getuid()
+
+
+def _open_lock(lock_path, create=True):
+    """
+    Open the lock file of a socket for reading and writing, without following a link planted in its place.
+    """
+    flags = os.O_RDWR | getattr(os, "O_NOFOLLOW", 0) | (os.O_CREAT if create else 0)
+    fd = os.open(lock_path, flags, 0o600)
+    st = os.fstat(fd)
+    if not stat.S_ISREG(st.st_mode) or st.st_uid != os.getuid():
+        os.close(fd)
+        raise PermissionError("The lock file %s doesn't belong to the user." % lock_path)
+    return os.fdopen(fd, "r+")
+
+
+class ExecServer(object):
+    """
+    The server, which runs requests in forked children of a process that imported the heavy modules once.
+
+    Parameters
+    ----------
+    socket_path : str
+        The Unix socket to listen on.
+    idle_timeout : float
+        How long to wait for a request before exiting, in seconds.
+    preload : list of str
+        Modules to import before accepting requests.
+    """
+
+    def __init__(self, socket_path, idle_timeout=DEFAULT_IDLE_TIMEOUT, preload=DEFAULT_PRELOAD):
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.preload = list(preload)
+        self._stamps = {}
+        self._children = set()
+        self._lock = None
+        self._wakeup = None
+        self._stopping = False
+
+    def stop(self):
+        """
+        Make the server exit at its next turn, e.g. from a signal handler, where raising could go unnoticed.
+        """
+        self._stopping = True
+
+    def _module_files(self):
+        files = set()
+        for module in list(sys.modules.values()):
+            filename = getattr(module, "__file__", None)
+            if filename:
+                files.add(filename)
+        return files
+
+    def _changed(self):
+        """Return True if the file of a module imported by the server changed since it was imported."""
+        return any(file_stamp(filename) != stamp for filename, stamp in self._stamps.items())
+
+    def _reap(self):
+        for pid in list(self._children):
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done:
+                self._children.discard(pid)
+
+    def _serve_connection(self, listener, conn):
+        if not _trusted_peer(conn):
+            conn.close()
+            return
+
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            listener.close()
+            self._lock.close()
+            if self._wakeup is not None:
+                signal.set_wakeup_fd(-1)
+                for fd in self._wakeup:
+                    os.close(fd)
+            try:
+                with conn, conn.makefile("rwb") as channel:
+                    write_message(channel, execute(read_message(channel)))
+            finally:
+                os._exit(0)
+
+        conn.close()
+        self._children.add(pid)
+
+    def serve(self):
+        """
+        Import the modules and serve requests until the server is idle for too long or its modules change.
+
+        Returns
+        -------
+        bool
+            False if another server already listens on the socket.
+
+        Raises
+        ------
+        PermissionError
+            If other users can write to the directory of the socket.
+        """
+        if not _socket_dir_ready(self.socket_path):
+            raise PermissionError(
+                "The directory of %s must belong to the user and only be writable by them." % self.socket_path
+            )
+
+        # only one server per socket, and the one holding the lock owns the socket file
+        lock_path = self.socket_path + ".lock"
+        while True:
+            self._lock = _open_lock(lock_path)
+            try:
+                fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock.close()
+                return False
+            # a server that was exiting may have removed the file after it was opened here
+            locked = os.fstat(self._lock.fileno())
+            try:
+                current = os.lstat(lock_path)
+            except OSError:
+                current = None
+            if current is not None and (current.st_dev, current.st_ino) == (locked.st_dev, locked.st_ino):
+                break
+            self._lock.close()
+        self._lock.truncate(0)
+        self._lock.write("%d\n" % os.getpid())
+        self._lock.flush()
+
+        for name in self.preload:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                pass
+        self._stamps = {filename: file_stamp(filename) for filename in self._module_files()}
+
+        if os.path.lexists(self.socket_path):
+            os.unlink(self.socket_path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o077)
+        try:
+            listener.bind(self.socket_path)
+        finally:
+            os.umask(umask)
+        listener.listen(64)
+
+        # signals wake the server up through a pipe, so that it stops right away
+        self._wakeup = os.pipe()
+        for fd in self._wakeup:
+            os.set_blocking(fd, False)
+        try:
+            previous_wakeup = signal.set_wakeup_fd(self._wakeup[1])
+        except ValueError:
+            # not the main thread, stop requests are then noticed at the next turn
+            previous_wakeup = None
+
+        last_request = time.monotonic()
+        try:
+            while not self._stopping:
+                # nothing is checked while idle, except whether children are left to wait for
+                now = time.monotonic()
+                timeout = max(0.0, last_request + self.idle_timeout - now)
+                if self._children or previous_wakeup is None:
+                    timeout = min(timeout, CHECK_INTERVAL)
+                readable, _, _ = select.select([listener, self._wakeup[0]], [], [], timeout)
+                self._reap()
+
+                if self._wakeup[0] in readable:
+                    while True:
+                        try:
+                            if not os.read(self._wakeup[0], 512):
+                                break
+                        except BlockingIOError:
+                            break
+                if self._stopping:
+                    break
+
+                now = time.monotonic()
+                if listener in readable:
+                    conn, _ = listener.accept()
+                    if self._changed():
+                        # the client sees the connection closed and runs the code the usual way
+                        conn.close()
+                        break
+                    self._serve_connection(listener, conn)
+                    last_request = now
+                elif not self._children and now - last_request > self.idle_timeout:
+                    break
+        finally:
+            # stop accepting requests right away, the running children finish on their own
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+            listener.close()
+            if previous_wakeup is not None:
+                signal.set_wakeup_fd(previous_wakeup)
+            for fd in self._wakeup:
+                os.close(fd)
+            self._wakeup = None
+            # removed while it is still locked, so that the next server creates a new one
+            try:
+                os.unlink(lock_path)
+            except OSError:
+                pass
+            self._lock.close()
+
+        return True
+
+
+def configure_execd(enabled, socket_path="", idle_timeout=DEFAULT_IDLE_TIMEOUT, preload=DEFAULT_PRELOAD):
+    """
+    Set whether embedded code is run by the server, and start the server if it isn't running yet.
+
+    Parameters
+    ----------
+    enabled : bool
+        Whether to use the server.
+    socket_path : str
+        The socket of the server, or an empty string for the default one.
+    idle_timeout : float
+        How long a server started here waits for a request before exiting, in seconds.
+    preload : list of str
+        Modules a server started here imports before accepting requests.
+
+    Returns
+    -------
+    bool
+        False if the server is enabled but can't be used, because the platform can't fork or because other
+        users can write to the directory of the socket.
+    """
+    global _socket_path
+
+    _socket_path = None
+    if not enabled:
+        return True
+    if not hasattr(os, "fork") or fcntl is None:
+        return False
+
+    socket_path = socket_path or default_socket_path()
+    if not _socket_dir_ready(socket_path):
+        return False
+
+    _socket_path = socket_path
+    sock = _connect(_socket_path)
+    if sock is not None:
+        sock.close()
+    else:
+        # the server needs a few seconds to import its modules, meanwhile code is run the usual way
+        cmd = [sys.executable, "-m", __name__, "--socket", _socket_path, "--idle-timeout", str(idle_timeout)]
+        subprocess.Popen(
+            cmd + ["--preload"] + list(preload),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    return True
+
+
+def _connect(socket_path):
+    """
+    Connect to the server on a socket, or return None if no server of the user listens on it.
+    """
+    try:
+        st = os.lstat(socket_path)
+    except OSError:
+        return None
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    if not _trusted_peer(sock):
+        sock.close()
+        return None
+    return sock
+
+
+def run_in_execd(request):
+    """
+    Run a chunk of code in a fresh child of the server.
+
+    Parameters
+    ----------
+    request : dict
+        The request, as built by run_sub.make_request.
+
+    Returns
+    -------
+    dict or None
+        The result, or None if the server isn't used, can't be reached or closed the connection.
+    """
+    sock = _connect(_socket_path) if _socket_path is not None else None
+    if sock is None:
+        return None
+
+    with trace_span("execd run", path=request["path"]):
+        try:
+            with sock, sock.makefile("rwb") as channel:
+                write_message(channel, request)
+                return read_message(channel)
+        except (EOFError, OSError):
+            return None
+
+
+def stop_execd(socket_path):
+    """
+    Stop the server listening on a socket.
+
+    Returns
+    -------
+    bool
+        False if no server was running.
+    """
+    try:
+        with _open_lock(socket_path + ".lock", create=False) as f:
+            pid = int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return False
+    sock = _connect(socket_path)
+    if not pid or sock is None:
+        return False
+    sock.close()
+    os.kill(pid, signal.SIGTERM)
+    return True
+
+
+def main(argv=None):
+    """Entry point of the sphinx-mdolab-execd command."""
+    parser = argparse.ArgumentParser(
+        prog="sphinx-mdolab-execd",
+        description="Serve the embedded code of repeated doc builds from a process that keeps the heavy "
+        "modules imported. Builds use it when embed_code_execd is set in conf.py, and start it themselves.",
+    )
+    parser.add_argument("--socket", default=default_socket_path(), help="the Unix socket (default: %(default)s)")
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=DEFAULT_IDLE_TIMEOUT,
+        help="exit after this many seconds without a request (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--preload", nargs="*", default=DEFAULT_PRELOAD, help="modules to import (default: %(default)s)"
+    )
+    parser.add_argument("--stop", action="store_true", help="stop the server listening on the socket")
+    args = parser.parse_args(argv)
+
+    if args.stop:
+        if not stop_execd(args.socket):
+            print("no server is listening on %s" % args.socket)
+        return
+
+    # like the worker pool, never show plots on screen
+    os.environ["MPLBACKEND"] = "Agg"
+    # exit through the cleanup of the server
+    server = ExecServer(args.socket, args.idle_timeout, args.preload)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+    try:
+        if not server.serve():
+            print("a server is already listening on %s" % args.socket)
+    except PermissionError as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
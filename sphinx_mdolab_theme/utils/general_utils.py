@@ -1,9 +1,18 @@
 # Standard Python modules
 from contextlib import contextmanager
+import hashlib
+import os
+import shutil
+import tempfile
 
 # External modules
 import numpy as np
 
+# the directory that holds the private working directories kept for the whole build, and the directories that
+# are linked as a whole in them, see configure_build_workdirs
+_build_workdir_root = None
+_build_workdir_linked = set()
+
 
 @contextmanager
 def printoptions(*args, **kwds):
@@ -44,3 +53,152 @@ def printoptions(*args, **kwds):
         yield np.get_printoptions()
     finally:
         np.set_printoptions(**opts)
+
+
+def _mirror(directory, workdir, linked):
+    """
+    Recreate the directories under `directory` in `workdir`, with symbolic links to the files in them.
+    """
+    for entry in os.scandir(directory):
+        target = os.path.join(workdir, entry.name)
+        if (
+            entry.is_dir(follow_symlinks=False)
+            and entry.name != "__pycache__"
+            and os.path.realpath(entry.path) not in linked
+        ):
+            os.mkdir(target)
+            _mirror(entry.path, target, linked)
+        else:
+            os.symlink(entry.path, target)
+
+
+@contextmanager
+def private_workdir(directory, linked=()):
+    """
+    Context manager for a temporary directory that mirrors `directory` through symbolic links.
+
+    Code run in it can read the files next to it with relative paths, as if it ran in `directory`,
+    while the files it creates stay private, so that concurrent runs of code from the same directory
+    don't overwrite each other's files. The subdirectories are real directories of the mirror, with
+    links to the files in them, so that this holds for the files created in e.g. an ``outputs``
+    subdirectory too. Only existing files that the code opens for writing are written through their
+    links. The temporary directory is removed at the end of the `with` block. If symbolic links can't
+    be created, e.g. on Windows without the right privileges, `directory` itself is used.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to mirror.
+    linked : list of str
+        Subdirectories that are linked as a whole instead of mirrored, e.g. the build directory of the
+        docs, which code doesn't write to and which would be slow to mirror.
+
+    Yields
+    ------
+    str
+        The directory to run the code in.
+    """
+    workdir = tempfile.mkdtemp(prefix="embed_code_")
+    try:
+        try:
+            _mirror(directory, workdir, {os.path.realpath(path) for path in linked})
+        except OSError:
+            yield directory
+        else:
+            yield workdir
+    finally:
+        # the links are removed, not what they point to
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def configure_build_workdirs(root, linked=()):
+    """
+    Keep the private working directories given by build_workdir in `root` until close_build_workdirs is called.
+
+    Parameters
+    ----------
+    root : str
+        An empty directory, created before any parallel reader process is forked so that they all share it.
+    linked : list of str
+        Directories that are linked as a whole instead of mirrored, see private_workdir.
+    """
+    global _build_workdir_root, _build_workdir_linked
+
+    _build_workdir_root = os.path.realpath(root)
+    _build_workdir_linked = {os.path.realpath(path) for path in linked}
+
+
+def close_build_workdirs():
+    """
+    Remove the private working directories kept for the build.
+    """
+    global _build_workdir_root
+
+    if _build_workdir_root is not None:
+        # the links are removed, not what they point to
+        shutil.rmtree(_build_workdir_root, ignore_errors=True)
+        _build_workdir_root = None
+
+
+def build_workdir(directory, key):
+    """
+    Return the private working directory that mirrors `directory` for `key` during the whole build.
+
+    Unlike with private_workdir, the files created in it are kept until the end of the build, so that e.g. a
+    snippet can read the recorder file written by an earlier snippet of the same test file, while they stay
+    apart from the files created for other keys.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to mirror.
+    key : str
+        What the directory is kept for, e.g. the path of a test file.
+
+    Returns
+    -------
+    str or None
+        The directory to run the code in, or None if configure_build_workdirs wasn't called.
+    """
+    if _build_workdir_root is None:
+        return None
+
+    workdir = os.path.join(_build_workdir_root, hashlib.sha256(("%s\0%s" % (directory, key)).encode()).hexdigest()[:24])
+    if os.path.isdir(workdir):
+        return workdir
+
+    # the mirror is made under another name and renamed, so that code run by another process never sees it
+    # half made
+    staging = tempfile.mkdtemp(dir=_build_workdir_root)
+    try:
+        _mirror(directory, staging, _build_workdir_linked)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        return directory
+    try:
+        os.rename(staging, workdir)
+    except OSError:
+        # another process made it first
+        shutil.rmtree(staging, ignore_errors=True)
+    return workdir if os.path.isdir(workdir) else directory
+
+
+def in_build_workdir(path):
+    """
+    Return whether a real path is in one of the private working directories kept for the build, e.g. a file
+    left there by a snippet for the ones that run after it.
+    """
+    return _build_workdir_root is not None and path.startswith(_build_workdir_root + os.sep)
+
+
+@contextmanager
+def working_directory(directory):
+    """
+    Context manager that changes the working directory of the process for the scope of the `with` block.
+    """
+    save_dir = os.getcwd()
+    os.chdir(directory)
+    try:
+        yield directory
+    finally:
+        os.chdir(save_dir)
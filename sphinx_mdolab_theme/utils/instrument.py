@@ -0,0 +1,245 @@
+"""
+Timing and resource instrumentation for the custom directives.
+
+Directive classes decorated with `instrumented` record, for each use of the directive, the wall and CPU
+time it took, how many subprocesses it ran, the peak memory of those subprocesses and whether its
+result came from a cache. The records are stored in the build environment, keyed by document, and
+reported at the end of the build by the ``sphinx_mdolab_theme.ext.timings`` extension.
+
+When tracing is turned on by the ``sphinx_mdolab_theme.ext.trace`` extension, the directives and the
+subprocesses they launch are also recorded as spans of a Chrome trace. Each process, including the
+forked parallel readers and writers, appends its own events to a file in the trace directory, and the
+files are combined at the end of the build.
+"""
+
+# Standard Python modules
+from contextlib import contextmanager
+import functools
+import json
+import os
+import threading
+import time
+
+try:
+    # Standard Python modules
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# External modules
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+# the records of the directives currently running in this process, innermost last
+_active = []
+
+# where each process writes its trace events, or None when not tracing
+_trace_dir = None
+_trace_file = None
+_trace_pid = None
+_trace_lock = threading.Lock()
+
+
+def _reset_trace_lock():
+    # the lock may have been held by another thread of the parent when it forked
+    global _trace_lock
+    _trace_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_trace_lock)
+
+
+def _children_maxrss():
+    """Return the peak RSS in kB of all the waited-for children of this process."""
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+
+def note_subprocess(maxrss=None):
+    """
+    Count a subprocess launched by the directive currently running.
+
+    Parameters
+    ----------
+    maxrss : int or None
+        The peak RSS of the subprocess in kB, if known. It is needed for processes that are not
+        children of this one, e.g. the forks of the warm workers.
+    """
+    if _active:
+        record = _active[-1]
+        record["subprocesses"] += 1
+        if maxrss:
+            record["peak_child_rss_kb"] = max(record["peak_child_rss_kb"], maxrss)
+
+
+def note_cache(status):
+    """
+    Record where the result of the directive currently running came from.
+
+    Parameters
+    ----------
+    status : str
+        E.g. "hit", "miss" or "preexecuted".
+    """
+    if _active:
+        _active[-1]["cache"] = status
+
+
+def configure_trace(trace_dir):
+    """
+    Start or stop writing trace events.
+
+    Parameters
+    ----------
+    trace_dir : str or None
+        The directory the events of each process are written to, or None to stop tracing.
+    """
+    global _trace_dir, _trace_file, _trace_pid
+
+    with _trace_lock:
+        if _trace_file is not None and _trace_pid == os.getpid():
+            _trace_file.close()
+        _trace_dir = trace_dir
+        _trace_file = None
+        _trace_pid = None
+
+
+def trace_clock():
+    """Return the time used for trace events, in microseconds. It is the same for all processes."""
+    return time.monotonic_ns() / 1000
+
+
+def trace_event(name, category, phase, ts=None, dur=None, **args):
+    """
+    Write an event of the Chrome trace format, if tracing.
+
+    Parameters
+    ----------
+    name : str
+        The name shown for the event.
+    category : str
+        The category of the event, e.g. "directive" or "subprocess".
+    phase : str
+        The event type: "B" and "E" for the beginning and end of a span, "X" for a complete span, "i"
+        for an instant.
+    ts : float or None
+        The time of the event from trace_clock, or None for now.
+    dur : float or None
+        The duration of a complete span in microseconds.
+    **args : dict
+        Details shown with the event.
+    """
+    global _trace_file, _trace_pid
+
+    if _trace_dir is None:
+        return
+
+    pid = os.getpid()
+    event = {
+        "name": name,
+        "cat": category,
+        "ph": phase,
+        "ts": trace_clock() if ts is None else ts,
+        "pid": pid,
+        "tid": threading.get_native_id(),
+    }
+    if dur is not None:
+        event["dur"] = dur
+    if phase == "i":
+        event["s"] = "t"
+    if args:
+        event["args"] = args
+    line = json.dumps(event, default=str) + "\n"
+
+    with _trace_lock:
+        if _trace_pid != pid:
+            # forked processes can exit without running any cleanup, so every event is written right away
+            _trace_file = open(os.path.join(_trace_dir, "%d.jsonl" % pid), "a", buffering=1)
+            _trace_pid = pid
+        _trace_file.write(line)
+
+
+@contextmanager
+def trace_span(name, category="subprocess", **args):
+    """
+    Record the `with` block as a complete span of the trace, if tracing.
+
+    Parameters
+    ----------
+    name : str
+        The name shown for the span.
+    category : str
+        The category of the span.
+    **args : dict
+        Details shown with the span.
+    """
+    if _trace_dir is None:
+        yield
+        return
+
+    start = trace_clock()
+    try:
+        yield
+    finally:
+        trace_event(name, category, "X", ts=start, dur=trace_clock() - start, **args)
+
+
+def instrumented(directive_class):
+    """
+    Class decorator that records the cost of each run of a directive in the build environment.
+    """
+    run = directive_class.run
+
+    @functools.wraps(run)
+    def timed_run(self):
+        env = self.state.document.settings.env
+        record = {
+            "directive": self.name,
+            "docname": env.docname,
+            "line": self.lineno,
+            "subprocesses": 0,
+            "peak_child_rss_kb": 0,
+            "cache": None,
+        }
+
+        rss_before = _children_maxrss()
+        times_before = os.times()
+        start = time.perf_counter()
+        _active.append(record)
+        try:
+            with trace_span(self.name, "directive", docname=env.docname, line=self.lineno):
+                return run(self)
+        finally:
+            _active.pop()
+            wall = time.perf_counter() - start
+            times_after = os.times()
+            record["wall"] = wall
+            record["cpu"] = (times_after.user - times_before.user) + (times_after.system - times_before.system)
+            record["child_cpu"] = (times_after.children_user - times_before.children_user) + (
+                times_after.children_system - times_before.children_system
+            )
+            # the peak over all children only tells us about this directive when it went up
+            rss_after = _children_maxrss()
+            if rss_after > rss_before:
+                record["peak_child_rss_kb"] = max(record["peak_child_rss_kb"], rss_after)
+
+            if not hasattr(env, "mdolab_directive_timings"):
+                env.mdolab_directive_timings = {}
+            env.mdolab_directive_timings.setdefault(env.docname, []).append(record)
+
+            # a budget given on the command line with -D is a string
+            budget = float(env.config.mdolab_directive_budget or 0)
+            if budget and wall > budget:
+                logger.warning(
+                    "%s directive took %.1f s, more than the budget of %.1f s",
+                    self.name,
+                    wall,
+                    budget,
+                    location=(env.docname, self.lineno),
+                )
+
+    directive_class.run = timed_run
+    return directive_class
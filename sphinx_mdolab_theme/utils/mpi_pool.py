@@ -0,0 +1,221 @@
+"""
+Persistent MPI jobs for running embedded code on several processes.
+
+Starting ``mpirun`` can take longer than running a snippet, so the snippets that need the same number of
+processes share one job. Its ranks connect back to a Unix socket and then loop over the snippets sent to
+them, with a barrier between snippets and a fresh copy of the module globals for each one. A job whose
+ranks stop responding, e.g. because one rank failed while the others wait in a collective operation, is
+killed and replaced by a new one for the next snippet.
+"""
+
+# Standard Python modules
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+
+# First party modules
+from .instrument import trace_span
+from .protocol import read_message, write_message
+from .run_sub import error_result
+
+# module run by each rank
+_rank_runner = __name__.rpartition(".")[0] + ".run_sub"
+
+_jobs = {}
+_persistent = True
+
+
+class MPIJob(object):
+    """
+    An mpirun job whose ranks run one snippet after the other.
+
+    Parameters
+    ----------
+    n_procs : int
+        The number of MPI processes.
+    grace : float
+        Seconds to wait for the other ranks once a rank has reported a failure or died.
+    """
+
+    def __init__(self, n_procs, grace=10.0):
+        self.n_procs = n_procs
+        self.grace = grace
+        self._pid = os.getpid()
+        self._proc = None
+        self._socks = []
+        self._channels = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        tmp_dir = tempfile.mkdtemp()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            address = os.path.join(tmp_dir, "run_sub.sock")
+            listener.bind(address)
+            listener.listen(self.n_procs)
+            listener.settimeout(1.0)
+
+            self._proc = subprocess.Popen(
+                ["mpirun", "-n", str(self.n_procs), sys.executable, "-m", _rank_runner, address]
+            )
+
+            while len(self._channels) < self.n_procs and self._proc.poll() is None:
+                try:
+                    conn, _ = listener.accept()
+                except socket.timeout:
+                    continue
+                conn.settimeout(None)
+                self._socks.append(conn)
+                self._channels.append(conn.makefile("rwb"))
+        finally:
+            # the socket file is only needed until the ranks are connected, so nothing is left behind by a
+            # job that is never closed, e.g. one started by a parallel Sphinx reader
+            listener.close()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        return len(self._channels) == self.n_procs
+
+    def _collect(self, channel, results):
+        try:
+            results.put(read_message(channel))
+        except (EOFError, OSError, ValueError):
+            results.put(None)
+
+    def run(self, request):
+        """
+        Run a chunk of code on all the ranks of the job, starting the job if needed.
+
+        Parameters
+        ----------
+        request : dict
+            The request, as built by run_sub.make_request.
+
+        Returns
+        -------
+        list of dict
+            The result of each rank, as described in the run_sub module.
+        """
+        with self._lock:
+            if self._proc is None or self._proc.poll() is not None:
+                self.close()
+                with trace_span("mpirun start", n_procs=self.n_procs):
+                    started = self._start()
+                if not started:
+                    self.close()
+                    return [error_result("MPI job failed to start.", rank) for rank in range(self.n_procs)]
+
+            # the ranks run the code together, so all of them need the request before any result is read
+            try:
+                for channel in self._channels:
+                    write_message(channel, request)
+            except OSError:
+                self.close()
+                return [error_result("MPI job died.", rank) for rank in range(self.n_procs)]
+
+            collected = queue.Queue()
+            for channel in self._channels:
+                threading.Thread(target=self._collect, args=(channel, collected), daemon=True).start()
+
+            results = [None] * self.n_procs
+            healthy = True
+            timeout = None
+            with trace_span("mpirun run", n_procs=self.n_procs, path=request["path"]):
+                for _ in range(self.n_procs):
+                    try:
+                        result = collected.get(timeout=timeout)
+                    except queue.Empty:
+                        healthy = False
+                        break
+                    if result is None:
+                        healthy = False
+                        timeout = self.grace
+                        continue
+                    results[result["rank"]] = result
+                    if result["error"] is not None:
+                        # the other ranks may be stuck waiting for this one
+                        timeout = self.grace
+
+            if not healthy:
+                self.close(kill=True)
+
+        return [
+            result if result is not None else error_result("Rank %d did not report a result." % rank, rank)
+            for rank, result in enumerate(results)
+        ]
+
+    def close(self, kill=False):
+        """
+        Shut down the job.
+
+        Parameters
+        ----------
+        kill : bool
+            Kill the job right away instead of letting the ranks exit.
+        """
+        if self._pid != os.getpid():
+            # the job belongs to the process this one was forked from
+            return
+
+        # the ranks exit once their connection is closed. Shutting the sockets down first also wakes up
+        # any thread still waiting for a result.
+        for sock, channel in zip(self._socks, self._channels):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                channel.close()
+            except OSError:
+                pass
+            sock.close()
+        self._socks = []
+        self._channels = []
+
+        if self._proc is not None:
+            if kill:
+                # mpirun passes this on to the ranks
+                self._proc.terminate()
+            try:
+                self._proc.wait(timeout=self.grace)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+                self._proc.wait()
+            self._proc = None
+
+
+def configure_mpi_jobs(persistent):
+    """
+    Choose whether MPI jobs are kept running between snippets.
+    """
+    global _persistent
+
+    close_mpi_jobs()
+    _persistent = persistent
+
+
+def get_mpi_job(n_procs):
+    """
+    Return the persistent MPI job of this process for the given number of processes, or None if
+    jobs are not kept running between snippets.
+    """
+    if not _persistent:
+        return None
+
+    job = _jobs.get(n_procs)
+    # a job inherited from a parent process can't share the parent's connections to the ranks
+    if job is None or job._pid != os.getpid():
+        job = _jobs[n_procs] = MPIJob(n_procs)
+
+    return job
+
+
+def close_mpi_jobs():
+    """Shut down the persistent MPI jobs of this process."""
+    for job in _jobs.values():
+        job.close()
+    _jobs.clear()
@@ -0,0 +1,255 @@
+"""
+A JSON manifest of the default options and informs of classes, so that the optionstable and optionslist
+directives can document them without importing the classes.
+
+The manifest is written by the ``sphinx-mdolab-options`` command, in an environment where the classes
+can be imported::
+
+    sphinx-mdolab-options dump adflow.ADFLOW idwarp.USMesh -o doc/options_manifest.json
+
+Dumping into an existing manifest replaces the entries of the given classes and keeps the others. The
+default value of each option is stored as JSON when that gives back an equal value, and otherwise as the
+text it is shown with. Types are stored by name, with tuples of types kept as lists of names.
+"""
+
+# Standard Python modules
+import argparse
+import builtins
+from importlib import import_module
+import json
+import os
+import sys
+
+# First party modules
+from .source_index import file_stamp
+
+MANIFEST_VERSION = 1
+
+_manifests = {}
+
+# stand-ins for the types that aren't builtins, by name
+_types = {}
+
+
+def _is_exact(value):
+    """Return True if a value comes back from JSON equal and with the same type."""
+    try:
+        loaded = json.loads(json.dumps(value))
+    except (TypeError, ValueError):
+        return False
+    return type(loaded) is type(value) and loaded == value
+
+
+def _type_names(value_type):
+    if isinstance(value_type, tuple):
+        return [t.__name__ for t in value_type]
+    return value_type.__name__
+
+
+def _type_from_names(names):
+    if isinstance(names, list):
+        return tuple(_type_from_names(name) for name in names)
+    value_type = getattr(builtins, names, None)
+    if isinstance(value_type, type) and value_type.__name__ == names:
+        return value_type
+    if names not in _types:
+        _types[names] = type(names, (), {})
+    return _types[names]
+
+
+def dump_options(options):
+    """
+    Convert a default options dictionary into its manifest form.
+
+    Parameters
+    ----------
+    options : dict
+        The default options, with [type or tuple of types, default value] for each option.
+
+    Returns
+    -------
+    dict
+        The manifest form of the options.
+    """
+    dumped = {}
+    for key, (value_type, default) in options.items():
+        entry = {"type": _type_names(value_type)}
+        if _is_exact(default):
+            entry["default"] = default
+        elif isinstance(default, list) and value_type is not list:
+            # the choices of the option, which the directives look up in the descriptions
+            entry["default"] = [choice if _is_exact(choice) else str(choice) for choice in default]
+        else:
+            entry["text"] = str(default)
+        dumped[key] = entry
+    return dumped
+
+
+def load_options(dumped):
+    """
+    Convert the manifest form of the default options back into a dictionary like the one of the class.
+
+    Types that aren't builtins are replaced with classes of the same name, and default values that couldn't
+    be stored as JSON with the text they are shown with.
+    """
+    options = {}
+    for key, entry in dumped.items():
+        default = entry["default"] if "default" in entry else entry["text"]
+        options[key] = [_type_from_names(entry["type"]), default]
+    return options
+
+
+def dump_class(class_path):
+    """
+    Import a class and return its manifest entry.
+
+    Parameters
+    ----------
+    class_path : str
+        The dotted path of the class.
+
+    Returns
+    -------
+    dict
+        The manifest form of the default options and the informs of the class, for the ones it has.
+    """
+    module_path, member_name = class_path.rsplit(".", 1)
+    cls = getattr(import_module(module_path), member_name)
+
+    entry = {}
+    if hasattr(cls, "_getDefaultOptions"):
+        entry["options"] = dump_options(cls._getDefaultOptions())
+    if hasattr(cls, "_getInforms"):
+        # as pairs, because the codes are usually integers
+        entry["informs"] = [[code, text] for code, text in cls._getInforms().items()]
+    return entry
+
+
+def load_manifest(filename):
+    """
+    Return the contents of a manifest, reading it only if it changed since the last call.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the manifest.
+
+    Returns
+    -------
+    dict
+        The manifest entry of each class, by dotted path.
+    """
+    filename = os.path.abspath(filename)
+    stamp = file_stamp(filename)
+    if stamp is None:
+        raise FileNotFoundError(f"The options manifest {filename} must exist!")
+
+    cached = _manifests.get(filename)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with open(filename) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"The options manifest {filename} has an unsupported version, it must be dumped again.")
+    _manifests[filename] = (stamp, manifest["classes"])
+    return manifest["classes"]
+
+
+def find_manifest(document, filename=None):
+    """
+    Return the manifest that a directive should read the options from, or None if it should import the class.
+
+    Parameters
+    ----------
+    document : nodes.document
+        The document of the directive.
+    filename : str or None
+        The manifest given to the directive, relative to the directory of the document. If None, the
+        ``mdolab_options_manifest`` config value is used, relative to the source directory.
+
+    Returns
+    -------
+    str or None
+        The absolute path of the manifest.
+    """
+    if filename:
+        return os.path.join(os.path.dirname(document.attributes["source"]), filename)
+
+    env = document.settings.env
+    if env.config.mdolab_options_manifest:
+        return os.path.join(env.srcdir, env.config.mdolab_options_manifest)
+    return None
+
+
+def get_class_entry(filename, class_path, kind):
+    """
+    Return the default options or the informs of a class from a manifest.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the manifest.
+    class_path : str
+        The dotted path of the class, as given to the directive.
+    kind : str
+        "options" or "informs".
+
+    Returns
+    -------
+    dict
+        The default options or the informs, as the class would return them.
+    """
+    classes = load_manifest(filename)
+    try:
+        entry = classes[class_path][kind]
+    except KeyError as e:
+        raise KeyError(f"The {kind} of {class_path} are missing from the options manifest {filename}") from e
+
+    if kind == "options":
+        return load_options(entry)
+    return {code: text for code, text in entry}
+
+
+def dump_manifest(filename, class_paths):
+    """
+    Write the entries of the given classes into a manifest, keeping the other entries of an existing one.
+    """
+    classes = {}
+    if os.path.isfile(filename):
+        classes = dict(load_manifest(filename))
+    for class_path in class_paths:
+        classes[class_path] = dump_class(class_path)
+
+    # the options keep the order of the class, which is the order of the rows
+    classes = dict(sorted(classes.items()))
+    tmp_name = filename + ".tmp"
+    with open(tmp_name, "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "classes": classes}, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_name, filename)
+
+
+def main(argv=None):
+    """Entry point of the sphinx-mdolab-options command."""
+    parser = argparse.ArgumentParser(
+        prog="sphinx-mdolab-options",
+        description="Write the default options and informs of classes to a manifest read by optionstable and "
+        "optionslist, so that building the docs doesn't need to import the classes.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    dump_parser = subparsers.add_parser("dump", help="import classes and write their options to the manifest")
+    dump_parser.add_argument("classes", nargs="+", metavar="pkg.Class", help="dotted path of a class")
+    dump_parser.add_argument(
+        "-o", "--output", default="options_manifest.json", help="the manifest (default: %(default)s)"
+    )
+    args = parser.parse_args(argv)
+
+    # like the docs, which usually put the repository root on the path in conf.py
+    sys.path.insert(0, os.getcwd())
+    dump_manifest(args.output, args.classes)
+    print(f"wrote the options of {len(args.classes)} classes to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
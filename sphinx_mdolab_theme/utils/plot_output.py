@@ -0,0 +1,247 @@
+"""
+Output files for the plots drawn by embedded code.
+
+Every figure left open by a snippet is saved, the first one to the base path of the plot and the
+following ones with ``_2``, ``_3``, ... appended. A figure is saved as PNG, SVG or WebP, at a chosen
+DPI and at several pixel densities that are offered to browsers through the ``srcset`` of its image.
+PNG files can also be optimized and quantized to a small palette with Pillow, which shrinks typical
+line plots several times over.
+"""
+
+# Standard Python modules
+import os
+import posixpath
+import urllib.parse
+
+# External modules
+from docutils import nodes
+
+try:
+    # External modules
+    from PIL import Image, features
+except ImportError:
+    Image = features = None
+
+FORMATS = ("png", "svg", "webp")
+
+_format = "png"
+_dpi = None
+_resolutions = (1,)
+_quantize = 0
+_optimize = False
+
+
+class plot_image(nodes.image):
+    """
+    An image with other resolutions of the same plot. The ``srcset`` attribute is a list of
+    (path, descriptor) pairs, e.g. ``("embed_code_plot_0123@2x.png", "2x")``.
+
+    Builders other than HTML treat it as a plain image.
+    """
+
+    pass
+
+
+def visit_plot_image(self, node):
+    start = len(self.body)
+    self.visit_image(node)
+
+    srcset = ", ".join(
+        "%s %s" % (posixpath.join(self.builder.imgpath, urllib.parse.quote(self.builder.images[path])), descriptor)
+        for path, descriptor in node.get("srcset", [])
+        if path in self.builder.images
+    )
+    if not srcset:
+        return
+
+    for i in range(start, len(self.body)):
+        if self.body[i].startswith("<img "):
+            self.body[i] = '<img srcset="%s" %s' % (self.attval(srcset), self.body[i][5:])
+            break
+
+
+def depart_plot_image(self, node):
+    self.depart_image(node)
+
+
+def webp_supported():
+    """Return True if matplotlib can save WebP files, which it does through Pillow."""
+    return features is not None and features.check("webp")
+
+
+def configure_plot_output(fmt="png", dpi=None, resolutions=(1,), quantize=0, optimize=False):
+    """
+    Set how plots are saved.
+
+    Parameters
+    ----------
+    fmt : str
+        The file format: "png", "svg" or "webp".
+    dpi : float or None
+        The resolution of the plot at a pixel density of 1. None uses the DPI of the figure.
+    resolutions : list of float
+        The pixel densities the plot is saved at. The first one is the image shown by default, and the
+        others are offered through the ``srcset`` of the image. Ignored for SVG.
+    quantize : int
+        If not 0, PNG files are reduced to a palette of this many colors.
+    optimize : bool
+        Compress PNG files as much as possible.
+    """
+    global _format, _dpi, _resolutions, _quantize, _optimize
+
+    if fmt not in FORMATS:
+        raise ValueError("Plot format must be one of %s, not %r." % (", ".join(FORMATS), fmt))
+
+    _format = fmt
+    _dpi = dpi
+    _resolutions = tuple(resolutions) or (1,)
+    _quantize = quantize
+    _optimize = optimize
+
+
+def get_plot_output():
+    """
+    Return the current plot settings as a tuple, e.g. to include them in the hash of a plot file.
+    """
+    return _format, _dpi, _resolutions, _quantize, _optimize
+
+
+def plot_files(base):
+    """
+    Return the files a plot is saved to.
+
+    Parameters
+    ----------
+    base : str
+        The path of the plot files, without extension.
+
+    Returns
+    -------
+    list of tuple
+        The path and the pixel density of each file, starting with the one shown by default.
+    """
+    if _format == "svg":
+        return [(base + ".svg", 1)]
+
+    files = [(base + "." + _format, _resolutions[0])]
+    for resolution in _resolutions[1:]:
+        files.append(("%s@%gx.%s" % (base, resolution, _format), resolution))
+    return files
+
+
+def figure_files(base, index):
+    """
+    Return the files a figure is saved to.
+
+    Parameters
+    ----------
+    base : str
+        The path of the plot files, without extension.
+    index : int
+        The position of the figure among the figures of the plot, starting at 0.
+
+    Returns
+    -------
+    list of tuple
+        The path and the pixel density of each file, as returned by plot_files.
+    """
+    return plot_files(base if index == 0 else "%s_%d" % (base, index + 1))
+
+
+def find_figures(base):
+    """
+    Return the files of the figures that were saved for a plot.
+
+    Parameters
+    ----------
+    base : str
+        The path of the plot files, without extension.
+
+    Returns
+    -------
+    list of list of tuple
+        The files of each figure, as returned by figure_files. Empty if the plot was not saved.
+    """
+    figures = []
+    while True:
+        files = figure_files(base, len(figures))
+        if not all(os.path.isfile(path) for path, _ in files):
+            return figures
+        figures.append(files)
+
+
+def savefig_code(base):
+    """
+    Return the code that saves all the open matplotlib figures of a snippet, with the current settings.
+
+    Parameters
+    ----------
+    base : str
+        The path of the plot files, without extension.
+
+    Returns
+    -------
+    str
+        The code, starting with a newline.
+    """
+    # avoid adding any names to the globals of the code
+    return "\n__import__('importlib').import_module(%r).save_figures(%r, %r)" % (__name__, base, get_plot_output())
+
+
+def save_figures(base, settings):
+    """
+    Save all the open matplotlib figures, in the order they were created.
+
+    Parameters
+    ----------
+    base : str
+        The path of the plot files, without extension.
+    settings : tuple
+        The plot settings, as returned by get_plot_output.
+    """
+    # External modules
+    import matplotlib.pyplot
+
+    configure_plot_output(*settings)
+
+    # like savefig, save an empty figure when there is none so that the plot is never missing
+    numbers = matplotlib.pyplot.get_fignums() or [matplotlib.pyplot.gcf().number]
+
+    pngs = []
+    for index, number in enumerate(numbers):
+        fig = matplotlib.pyplot.figure(number)
+        for path, resolution in figure_files(base, index):
+            if _dpi is None and resolution == 1:
+                fig.savefig(path)
+            elif _dpi is None:
+                fig.savefig(path, dpi=resolution * fig.dpi)
+            else:
+                fig.savefig(path, dpi=_dpi * resolution)
+            if path.endswith(".png"):
+                pngs.append(path)
+
+    if _quantize or _optimize:
+        optimize_png(pngs, _quantize)
+
+
+def optimize_png(paths, colors=0):
+    """
+    Compress PNG files in place, doing nothing if Pillow is not installed.
+
+    Parameters
+    ----------
+    paths : list of str
+        The PNG files.
+    colors : int
+        If not 0, reduce the images to a palette of this many colors.
+    """
+    if Image is None:
+        return
+
+    for path in paths:
+        with Image.open(path) as img:
+            img.load()
+        if colors:
+            # the only method that handles transparency
+            img = img.quantize(colors, method=Image.Quantize.FASTOCTREE)
+        img.save(path, optimize=True)
@@ -0,0 +1,62 @@
+"""
+A minimal length-prefixed message protocol used to talk to the processes that execute embedded code.
+
+Each message is a pickled Python object preceded by its length as an 8 byte big-endian integer.
+"""
+
+# Standard Python modules
+import pickle
+import struct
+
+_HEADER = struct.Struct("!Q")
+
+
+def write_message(stream, obj):
+    """
+    Write a single message to a binary stream.
+
+    Parameters
+    ----------
+    stream : file-like
+        A binary stream open for writing.
+    obj : object
+        The picklable object to send.
+    """
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(_HEADER.pack(len(data)))
+    stream.write(data)
+    stream.flush()
+
+
+def read_message(stream):
+    """
+    Read a single message from a binary stream.
+
+    Parameters
+    ----------
+    stream : file-like
+        A binary stream open for reading.
+
+    Returns
+    -------
+    object
+        The unpickled message.
+
+    Raises
+    ------
+    EOFError
+        If the stream is closed before a complete message has been read.
+    """
+    (size,) = _HEADER.unpack(_read_exact(stream, _HEADER.size))
+    return pickle.loads(_read_exact(stream, size))
+
+
+def _read_exact(stream, size):
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            raise EOFError("Stream closed in the middle of a message.")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
@@ -0,0 +1,174 @@
+"""
+Tracking of the files that embedded code reads while it runs, e.g. meshes and input files next to the
+test module, so that a cached result can be invalidated when one of them changes.
+
+An audit hook (see sys.addaudithook) records every file opened and every module imported while tracking
+is on. Audit hooks can't be removed, so the hook is installed the first time tracking is used in a
+process and then does nothing while tracking is off.
+
+The hook only sees the modules that are loaded while tracking is on. The modules of the project that
+were imported before, e.g. by the module of the code itself, in the Sphinx process or in a worker, are
+found from the source with dependency_reads instead.
+"""
+
+# Standard Python modules
+from contextlib import contextmanager
+import os
+import sys
+import sysconfig
+
+# First party modules
+from .source_index import build_realpath, find_local_dependencies
+
+# the ReadSet being recorded, or None
+_active = None
+_hook_installed = False
+
+# files in these directories belong to the interpreter, which is part of the cache key already
+_IGNORED_DIRS = None
+
+# the bits of os.open flags that say whether a file is opened for reading, writing or both
+_ACCESS_MODE = getattr(os, "O_ACCMODE", 3)
+
+
+class ReadSet(object):
+    """
+    The files opened and the modules imported while code runs.
+
+    Attributes
+    ----------
+    files : list of str
+        The real paths of the files the code read, sorted, once tracking has stopped.
+    outputs : list of str
+        The real paths of the files the code wrote before reading them, sorted, once tracking has stopped.
+    """
+
+    def __init__(self):
+        self.opened = set()
+        self.written = set()
+        self.modules = set()
+        self.files = []
+        self.outputs = []
+
+    def note_open(self, path, mode, flags):
+        if mode is None:
+            reading = flags & _ACCESS_MODE != os.O_WRONLY
+            writing = flags & _ACCESS_MODE != os.O_RDONLY
+        else:
+            reading = "r" in mode or "+" in mode
+            writing = mode.strip("rbtU") != ""
+
+        # files the code writes before it reads them are outputs, not inputs
+        if writing and path not in self.opened:
+            self.written.add(path)
+        elif reading and path not in self.written:
+            self.opened.add(path)
+
+    def resolve(self):
+        """
+        Return the real paths of the files read, leaving out the ones that belong to the interpreter.
+        """
+        paths = set(self.opened)
+        for name in self.modules:
+            filename = getattr(sys.modules.get(name), "__file__", None)
+            if filename:
+                paths.add(filename)
+
+        return _real_files(paths)
+
+    def resolve_outputs(self):
+        """
+        Return the real paths of the files written, leaving out the ones that belong to the interpreter.
+        """
+        return _real_files(self.written)
+
+
+def _real_files(paths):
+    files = set()
+    for path in paths:
+        path = os.path.realpath(path)
+        if not path.startswith(_ignored_dirs()) and not os.path.isdir(path):
+            files.add(path)
+    return sorted(files)
+
+
+def _ignored_dirs():
+    global _IGNORED_DIRS
+
+    if _IGNORED_DIRS is None:
+        paths = sysconfig.get_paths()
+        dirs = {os.path.realpath(paths[name]) + os.sep for name in ("stdlib", "platstdlib") if name in paths}
+        dirs.update(["/dev/", "/proc/", "/sys/"])
+        _IGNORED_DIRS = tuple(dirs)
+    return _IGNORED_DIRS
+
+
+def _audit_hook(event, args):
+    reads = _active
+    if reads is None:
+        return
+
+    try:
+        if event == "open":
+            path, mode, flags = args
+            if path is None or isinstance(path, int):
+                # an already open file descriptor
+                return
+            path = os.path.join(os.getcwd(), os.fsdecode(path))
+            # compiled bytecode is left out, since the source is recorded when the module is imported
+            if os.sep + "__pycache__" + os.sep not in path:
+                reads.note_open(path, mode, flags)
+        elif event == "import":
+            reads.modules.add(args[0])
+    except Exception:
+        # the hook must never make the code it watches fail
+        pass
+
+
+def dependency_reads(path):
+    """
+    Return the real paths of the source files of the project that the code at a path imports, directly or
+    not, whether or not their modules are already imported.
+
+    Parameters
+    ----------
+    path : str
+        Path to a file, or the dotted path to a module, function, class, or class method.
+
+    Returns
+    -------
+    list of str
+        The real paths of the files, including the file of the code itself.
+    """
+    return [build_realpath(filename) for filename in find_local_dependencies(path)]
+
+
+@contextmanager
+def track_reads():
+    """
+    Record the files read in the `with` block.
+
+    Yields
+    ------
+    ReadSet
+        The files read, available in its `files` attribute once the block exits.
+    """
+    global _active, _hook_installed
+
+    if not _hook_installed:
+        sys.addaudithook(_audit_hook)
+        _hook_installed = True
+
+    reads = ReadSet()
+    previous = _active
+    _active = reads
+    try:
+        yield reads
+    finally:
+        _active = previous
+        reads.files = reads.resolve()
+        reads.outputs = reads.resolve_outputs()
+        if previous is not None:
+            # code tracked by an enclosing block too
+            previous.opened.update(reads.files)
+            previous.written.update(reads.outputs)
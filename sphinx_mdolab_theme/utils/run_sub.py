@@ -1,41 +1,250 @@
 """
 This is used by our doc build system to execute a code chunk in a subprocess while giving that code chunk
 access to its containing module's globals.
+
+The request is read from stdin and the result is written to stdout using the messages of the protocol
+module. When given the address of a Unix socket, each MPI rank instead connects to that socket, and
+then receives requests and sends back its own results until the connection is closed.
+
+A request is a dict with the keys:
+
+- code: the code to run
+- module: name of the module whose globals the code runs in, or None to run it as a __main__ script
+- path: path to the script, used as __file__ when module is None
+- cwd: working directory for the code
+- sys_path: the module search path
+- output_limit: the (limit, tail) of the BoundedOutput the output is captured in
+
+A result is a dict with the keys:
+
+- output: everything written to stdout and stderr, including by compiled extensions, up to the limit
+- dropped: the number of bytes of output left out because of the limit
+- returncode: 0 if the code ran successfully, 1 otherwise
+- skip: the reason the code was skipped if it raised unittest.SkipTest, else None
+- error: the formatted traceback if the code raised any other exception, else None
+- rank: the MPI rank (0 when not running under MPI)
+- maxrss: the peak resident memory of the process that ran the code in kB, or 0 if unknown
+- reads: the files the code read while it ran, as recorded by read_set.track_reads
+- writes: the files the code wrote while it ran, as recorded by read_set.track_reads
 """
 
+# Standard Python modules
+from contextlib import contextmanager
+import importlib
 import os
+import socket
 import sys
-import importlib
+import threading
 import traceback
-from openmdao.utils.general_utils import printoptions
+import unittest
 
-if __name__ == "__main__":
-    import openmdao.utils.mpi  # noqa: F401  # this will activate use_proc_files
+try:
+    # Standard Python modules
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# First party modules
+from .bounded_output import BoundedOutput, get_output_limit
+from .general_utils import printoptions
+from .protocol import read_message, write_message
+from .read_set import track_reads
+
+
+def make_request(code, module_name=None, path=None, cwd=None):
+    """
+    Build a request to run a chunk of code.
+
+    Parameters
+    ----------
+    code : str
+        The code to run.
+    module_name : str or None
+        Name of the module whose globals the code runs in. If None, the code is run as
+        the __main__ script located at `path`.
+    path : str or None
+        Path to the script, used as __file__ when module_name is None.
+    cwd : str or None
+        Working directory for the code.
+
+    Returns
+    -------
+    dict
+        The request.
+    """
+    return {
+        "code": code,
+        "module": module_name,
+        "path": path,
+        "cwd": cwd or os.getcwd(),
+        "sys_path": list(sys.path),
+        "output_limit": get_output_limit(),
+    }
+
+
+def error_result(message, rank=0):
+    """
+    Build the result for code whose process died before it could report back.
+    """
+    return {
+        "output": message,
+        "dropped": 0,
+        "returncode": -1,
+        "skip": None,
+        "error": message,
+        "rank": rank,
+        "maxrss": 0,
+        "reads": [],
+        "writes": [],
+    }
 
+
+@contextmanager
+def capture_output(output):
+    """
+    Send everything written to the stdout and stderr file descriptors while in the `with` block to `output`.
+
+    Parameters
+    ----------
+    output : BoundedOutput
+        Where the output goes.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    read_fd, write_fd = os.pipe()
+    saved_fds = os.dup(1), os.dup(2)
+
+    def drain():
+        with os.fdopen(read_fd, "rb") as f:
+            for chunk in iter(lambda: f.read1(65536), b""):
+                output.feed(chunk)
+
+    # read from a thread so that a lot of output can't fill up the pipe and block the code
+    reader = threading.Thread(target=drain, daemon=True)
+    reader.start()
+
+    os.dup2(write_fd, 1)
+    os.dup2(write_fd, 2)
+    os.close(write_fd)
     try:
-        module_path = os.environ.get("OPENMDAO_CURRENT_MODULE", "").strip()
-        if module_path:
-            stdout_save = sys.stdout
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved_fds[0], 1)
+        os.dup2(saved_fds[1], 2)
+        for fd in saved_fds:
+            os.close(fd)
+        reader.join()
+
+
+def run_request(request, copy_globals=False):
+    """
+    Run a single request in the current process.
 
-            # send any output to dev/null during the import so it doesn't clutter our embedded code output
-            with open(os.devnull, "w") as f:
-                sys.stdout = f
+    Parameters
+    ----------
+    request : dict
+        The request.
+    copy_globals : bool
+        Run the code in a copy of the module globals, so that it can't affect later requests.
+    """
+    os.chdir(request["cwd"])
+    sys.path[:] = request["sys_path"]
 
-                mod = importlib.import_module(module_path)
+    if request["module"]:
+        # send any output to dev/null during the import so it doesn't clutter our embedded code output
+        stdout_save = sys.stdout
+        with open(os.devnull, "w") as f:
+            sys.stdout = f
+            try:
+                mod = importlib.import_module(request["module"])
+            finally:
+                sys.stdout = stdout_save
+        globals_dict = dict(mod.__dict__) if copy_globals else mod.__dict__
+        filename = "<string>"
+    else:
+        globals_dict = {
+            "__file__": request["path"],
+            "__name__": "__main__",
+            "__package__": None,
+            "__cached__": None,
+        }
+        filename = request["path"] or "<string>"
 
-            sys.stdout = stdout_save
-        else:
-            raise RuntimeError("OPENMDAO_CURRENT_MODULE was not specified.")
+    with printoptions(precision=8):
+        exec(compile(request["code"], filename, "exec"), globals_dict)
 
-        code_to_run = os.environ.get("OPENMDAO_CODE_TO_RUN", "").strip()
-        if not code_to_run:
-            raise RuntimeError("OPENMDAO_CODE_TO_RUN has not been set.")
 
-        with printoptions(precision=8):
-            exec(code_to_run, mod.__dict__)
+def execute(request, rank=0, copy_globals=False):
+    """
+    Run a request in the current process and collect its output.
 
-    except Exception:
-        traceback.print_exc()
-        sys.exit(-1)
+    Parameters
+    ----------
+    request : dict
+        The request.
+    rank : int
+        The MPI rank of this process.
+    copy_globals : bool
+        Run the code in a copy of the module globals.
 
-    sys.exit(0)
+    Returns
+    -------
+    dict
+        The result.
+    """
+    skip = error = None
+    output = BoundedOutput(*request["output_limit"])
+    with capture_output(output), track_reads() as reads:
+        try:
+            run_request(request, copy_globals)
+        except unittest.SkipTest as err:
+            skip = str(err)
+        except BaseException:
+            error = traceback.format_exc()
+            sys.stderr.write(error)
+
+    return {
+        "output": output.getvalue(),
+        "dropped": output.dropped,
+        "returncode": 0 if error is None else 1,
+        "skip": skip,
+        "error": error,
+        "rank": rank,
+        "maxrss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else 0,
+        "reads": reads.files,
+        "writes": reads.outputs,
+    }
+
+
+def main(argv):
+    """
+    Serve a single request over stdin and stdout, or all the requests sent to the Unix socket given in `argv`.
+    """
+    if argv:
+        # External modules
+        from mpi4py import MPI
+
+        comm = MPI.COMM_WORLD
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(argv[0])
+        with sock, sock.makefile("rwb") as channel:
+            # serve requests until the parent closes the connection
+            while True:
+                try:
+                    request = read_message(channel)
+                except EOFError:
+                    break
+                # keep the ranks of consecutive snippets from talking to each other
+                comm.Barrier()
+                write_message(channel, execute(request, comm.rank, copy_globals=True))
+    else:
+        # keep the real stdout for the result, since the code's output is captured separately
+        with os.fdopen(os.dup(1), "wb") as channel:
+            write_message(channel, execute(read_message(sys.stdin.buffer)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,774 @@
+"""
+A cache of the source files that embedded code is taken from.
+
+Each file is read and parsed once (and again only if its modification time or size changes) into an
+index of the line spans of every class and function it defines, so that looking up the source of many
+methods of the same test file costs a single parse instead of a rescan of the file per lookup.
+
+The index also records the base classes and the imports of each file, which is enough to locate the
+source of a dotted path and to tell whether a class is a TestCase without importing anything.
+"""
+
+# Standard Python modules
+import ast
+import builtins
+import inspect
+import os
+import site
+import sys
+import sysconfig
+import tokenize
+
+_indexes = {}
+
+_dependencies = {}
+
+# the modules of the project that each file imports directly, and the files that the code in each file depends
+# on transitively, see find_local_dependencies
+_local_imports = {}
+_local_dependencies = {}
+
+# the stamps and the real paths of the files seen during the current build, and the file that the code at each
+# path is read from, or None outside of a build, see begin_build
+_build_stamps = None
+_build_realpaths = None
+_build_roots = None
+
+# files in these directories belong to the interpreter and the installed packages, which are covered by the
+# fingerprint of the environment
+_ENVIRONMENT_DIRS = None
+
+# fully qualified names of the unittest base classes
+TESTCASE_CLASSES = {
+    "unittest.TestCase",
+    "unittest.case.TestCase",
+    "unittest.IsolatedAsyncioTestCase",
+    "unittest.async_case.IsolatedAsyncioTestCase",
+}
+
+# how many base classes and re-exports to follow before giving up
+_MAX_DEPTH = 20
+
+
+class SourceIndex(object):
+    """
+    The text of a source file and the line spans of the classes and functions it defines.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the Python source file.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with tokenize.open(filename) as f:
+            self.text = f.read()
+        self.lines = self.text.splitlines(True)
+
+        # (first line, last line) keyed by qualified name, and for functions also by name and first line,
+        # which is what the code object reports
+        self.by_qualname = {}
+        self.by_firstline = {}
+
+        # the dotted names of the bases of each class (None for a base that isn't a plain dotted name),
+        # and the (relative import level, dotted target) of each name imported at module level
+        self.bases = {}
+        self.imports = {}
+
+        # the (relative import level, dotted target) of every import in the file, including the ones in
+        # functions, where the target of "from a import b" is "a.b" whether b is a module or not
+        self.imported = set()
+
+        self._index(ast.parse(self.text), "")
+
+    def _index(self, node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.Import):
+                self.imported.update((0, alias.name) for alias in child.names)
+            elif isinstance(child, ast.ImportFrom):
+                self.imported.update(
+                    (child.level, "%s.%s" % (child.module, alias.name) if child.module else alias.name)
+                    for alias in child.names
+                )
+
+            if isinstance(child, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                qualname = prefix + child.name
+                first = child.decorator_list[0].lineno if child.decorator_list else child.lineno
+                span = (first, self._block_end(child))
+                self.by_qualname.setdefault(qualname, span)
+                if isinstance(child, ast.ClassDef):
+                    self.bases.setdefault(qualname, [_dotted_name(base) for base in child.bases])
+                    self._index(child, qualname + ".")
+                else:
+                    self.by_firstline[child.name, first] = span
+                    self._index(child, qualname + ".<locals>.")
+            elif isinstance(child, ast.Import) and not prefix:
+                for alias in child.names:
+                    if alias.asname:
+                        self.imports[alias.asname] = (0, alias.name)
+                    else:
+                        name = alias.name.split(".")[0]
+                        self.imports[name] = (0, name)
+            elif isinstance(child, ast.ImportFrom) and not prefix:
+                for alias in child.names:
+                    target = "%s.%s" % (child.module, alias.name) if child.module else alias.name
+                    self.imports[alias.asname or alias.name] = (child.level, target)
+            else:
+                self._index(child, prefix)
+
+    def _block_end(self, node):
+        # like inspect.getsource, include the comments after the last statement that are indented at
+        # least as much as the body
+        last = node.end_lineno
+        body = node.body[0]
+        body_line = self.lines[body.lineno - 1]
+        if body_line[: body.col_offset].strip():
+            # the body is on the same line as the header
+            return last
+
+        body_col = len(body_line) - len(body_line.lstrip())
+        for lineno in range(node.end_lineno + 1, len(self.lines) + 1):
+            line = self.lines[lineno - 1]
+            stripped = line.lstrip()
+            if not stripped.strip():
+                continue
+            if not stripped.startswith("#"):
+                break
+            if len(line) - len(stripped) >= body_col:
+                last = lineno
+        return last
+
+    def segment(self, span):
+        """
+        Return the source lines of a (first line, last line) span.
+        """
+        first, last = span
+        return "".join(self.lines[first - 1 : last])
+
+
+def file_stamp(filename):
+    """
+    Return the (modification time, size) of a file, or None if it doesn't exist.
+    """
+    try:
+        st = os.stat(filename)
+    except (OSError, TypeError):
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def begin_build():
+    """
+    Assume that the source files don't change until end_build is called, so that each one is only stat'ed
+    once during a build however many directives depend on it.
+    """
+    global _build_stamps, _build_realpaths, _build_roots
+
+    _build_stamps = {}
+    _build_realpaths = {}
+    _build_roots = {}
+
+
+def end_build():
+    """
+    Check the stamps of the source files again each time they are needed, as outside of a build.
+    """
+    global _build_stamps, _build_realpaths, _build_roots
+
+    _build_stamps = _build_realpaths = _build_roots = None
+
+
+def build_file_stamp(filename):
+    """
+    Return the file_stamp of a file, as it was the first time it was asked for during the current build.
+    """
+    if _build_stamps is None:
+        return file_stamp(filename)
+    try:
+        return _build_stamps[filename]
+    except KeyError:
+        stamp = _build_stamps[filename] = file_stamp(filename)
+        return stamp
+
+
+def build_realpath(filename):
+    """
+    Return the real path of a file, as it was the first time it was asked for during the current build.
+    """
+    if _build_realpaths is None:
+        return os.path.realpath(filename)
+    try:
+        return _build_realpaths[filename]
+    except KeyError:
+        path = _build_realpaths[filename] = os.path.realpath(filename)
+        return path
+
+
+def get_index(filename):
+    """
+    Return the SourceIndex of a file, parsing it only if it changed since the last call.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the Python source file.
+
+    Returns
+    -------
+    SourceIndex
+        The index of the file.
+    """
+    filename = os.path.abspath(filename)
+    stamp = file_stamp(filename)
+    if stamp is None:
+        raise OSError("Can't find file '%s'" % filename)
+
+    cached = _indexes.get(filename)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    index = SourceIndex(filename)
+    _indexes[filename] = (stamp, index)
+    return index
+
+
+def getsource(obj):
+    """
+    Return the source code of a module, class, method or function.
+
+    This is a drop-in replacement for inspect.getsource that uses the cached index of the object's
+    file, and falls back to inspect.getsource for anything the index can't find.
+
+    Parameters
+    ----------
+    obj : module, class, method or function
+        The object whose source is wanted.
+
+    Returns
+    -------
+    str
+        The source code.
+    """
+    if inspect.ismethod(obj):
+        obj = obj.__func__
+    if inspect.isfunction(obj):
+        obj = inspect.unwrap(obj)
+
+    try:
+        filename = inspect.getsourcefile(obj)
+        index = get_index(filename) if filename else None
+    except (OSError, TypeError, SyntaxError, UnicodeDecodeError):
+        index = None
+
+    if index is not None:
+        if inspect.ismodule(obj):
+            return index.text
+        if inspect.isfunction(obj):
+            span = index.by_firstline.get((obj.__name__, obj.__code__.co_firstlineno))
+        else:
+            span = index.by_qualname.get(getattr(obj, "__qualname__", None))
+        if span is not None:
+            return index.segment(span)
+
+    return inspect.getsource(obj)
+
+
+def _dotted_name(node):
+    """
+    Return the dotted name of a Name or Attribute chain, or None for any other expression.
+    """
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        value = _dotted_name(node.value)
+        return None if value is None else value + "." + node.attr
+    return None
+
+
+def find_spec_static(modname, path=None):
+    """
+    Find the spec of a module without importing it or any of its parent packages.
+
+    Parameters
+    ----------
+    modname : str
+        The dotted module name.
+    path : list of str or None
+        The directories to look for the top level package in, instead of sys.path.
+
+    Returns
+    -------
+    ModuleSpec or None
+        The spec, or None if the module can't be found.
+    """
+    module = sys.modules.get(modname) if path is None else None
+    if module is not None and getattr(module, "__spec__", None) is not None:
+        return module.__spec__
+
+    parent, _, _ = modname.rpartition(".")
+    if parent:
+        parent_spec = find_spec_static(parent, path)
+        if parent_spec is None or parent_spec.submodule_search_locations is None:
+            return None
+        search_path = list(parent_spec.submodule_search_locations)
+    else:
+        search_path = path
+
+    # this is what importlib does to find a module, minus executing the parent packages
+    for finder in sys.meta_path:
+        find_spec = getattr(finder, "find_spec", None)
+        if find_spec is None:
+            continue
+        try:
+            spec = find_spec(modname, search_path)
+        except (ImportError, ValueError, AttributeError):
+            continue
+        if spec is not None:
+            return spec
+
+    return None
+
+
+def _module_index(modname):
+    """
+    Return the SourceIndex of a module and whether it is a package, or None if it has no Python source.
+    """
+    try:
+        spec = find_spec_static(modname)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.has_location or not (spec.origin or "").endswith(".py"):
+        return None
+    try:
+        index = get_index(spec.origin)
+    except (OSError, SyntaxError, UnicodeDecodeError):
+        return None
+    return index, spec.submodule_search_locations is not None
+
+
+def _resolve_import(modname, is_package, level, target):
+    """
+    Return the absolute dotted name of an import made in a module.
+    """
+    if level == 0:
+        return target
+    package = modname if is_package else modname.rpartition(".")[0]
+    for _ in range(level - 1):
+        package = package.rpartition(".")[0]
+    return "%s.%s" % (package, target) if package else target
+
+
+def _find_class(fullname, depth):
+    """
+    Locate the definition of a class from its fully qualified name, following re-exports.
+
+    Returns
+    -------
+    tuple or None
+        The (module name, SourceIndex, is_package, class qualname) of the definition, or None.
+    """
+    if depth > _MAX_DEPTH:
+        return None
+
+    parts = fullname.split(".")
+    for i in range(len(parts) - 1, 0, -1):
+        modname = ".".join(parts[:i])
+        found = _module_index(modname)
+        if found is None:
+            continue
+        index, is_package = found
+        qualname = ".".join(parts[i:])
+        if qualname in index.bases:
+            return modname, index, is_package, qualname
+        if len(parts) - i == 1 and qualname in index.imports:
+            target = _resolve_import(modname, is_package, *index.imports[qualname])
+            return _find_class(target, depth + 1)
+        return None
+
+    return None
+
+
+def find_class_static(fullname):
+    """
+    Locate the definition of a class from its fully qualified name without importing it.
+
+    Returns
+    -------
+    tuple or None
+        The (module name, SourceIndex, is_package, class qualname) of the definition, or None if it
+        can't be found.
+    """
+    return _find_class(fullname, 0)
+
+
+def find_bases_static(modname, index, is_package, qualname):
+    """
+    Locate the definitions of the base classes of a class found by find_class_static.
+
+    Returns
+    -------
+    list or None
+        The definition of each base class, in the same form as find_class_static and leaving out
+        builtin bases, or None if a base class can't be traced back to its source.
+    """
+    found_bases = []
+    for base in index.bases[qualname]:
+        if base is None:
+            return None
+
+        head, _, tail = base.partition(".")
+        if head in index.bases and not tail:
+            found = (modname, index, is_package, head)
+        elif head in index.imports:
+            fullname = _resolve_import(modname, is_package, *index.imports[head])
+            found = _find_class(fullname + "." + tail if tail else fullname, 1)
+        elif not tail and hasattr(builtins, head):
+            continue
+        else:
+            found = None
+
+        if found is None:
+            return None
+        found_bases.append(found)
+
+    return found_bases
+
+
+def _is_testcase(modname, index, is_package, qualname, depth=0):
+    """
+    Decide from the source whether a class derives from unittest.TestCase.
+
+    Returns
+    -------
+    bool or None
+        True or False, or None if a base class can't be traced back to its source.
+    """
+    if depth > _MAX_DEPTH:
+        return None
+
+    result = False
+    for base in index.bases[qualname]:
+        if base is None:
+            return None
+
+        head, _, tail = base.partition(".")
+        if head in index.bases and not tail:
+            found = (modname, index, is_package, head)
+        elif head in index.imports:
+            fullname = _resolve_import(modname, is_package, *index.imports[head])
+            if tail:
+                fullname += "." + tail
+            if fullname in TESTCASE_CLASSES:
+                return True
+            found = _find_class(fullname, depth + 1)
+        elif not tail and hasattr(builtins, head):
+            # object, Exception, ...
+            continue
+        else:
+            found = None
+
+        base_is_test = None if found is None else _is_testcase(*found, depth=depth + 1)
+        if base_is_test:
+            return True
+        if base_is_test is None:
+            result = None
+
+    return result
+
+
+def getsource_static(path):
+    """
+    Find the source code of a module, class, function or method from its dotted path without importing it.
+
+    Parameters
+    ----------
+    path : str
+        Dotted path to a module, class, function, or class method.
+
+    Returns
+    -------
+    str
+        The source code.
+    int
+        Indentation level (number of path components after the module).
+    bool
+        Whether the path is a TestCase class or a method of one.
+
+    Returns None instead if the source can't be located statically, e.g. because a method is inherited
+    or a base class comes from a compiled module.
+    """
+    parts = path.split(".")
+
+    for n_rest in range(3):
+        if n_rest >= len(parts):
+            break
+        modname = ".".join(parts[: len(parts) - n_rest])
+        found = _module_index(modname)
+        if found is None:
+            continue
+
+        index, is_package = found
+        if n_rest == 0:
+            return index.text, 0, False
+
+        qualname = ".".join(parts[len(parts) - n_rest :])
+        span = index.by_qualname.get(qualname)
+        if span is None:
+            return None
+
+        class_qualname = parts[-2] if n_rest == 2 else parts[-1]
+        if class_qualname in index.bases:
+            is_test = _is_testcase(modname, index, is_package, class_qualname)
+            if is_test is None:
+                return None
+        else:
+            is_test = False
+
+        return index.segment(span), n_rest, is_test
+
+    return None
+
+
+def _source_file(modname, path=None):
+    """
+    Return the file a module is loaded from and whether it is a package, or None if it can't be found.
+    """
+    try:
+        spec = find_spec_static(modname, path)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.has_location or not spec.origin:
+        return None
+    return spec.origin, spec.submodule_search_locations is not None
+
+
+def _find_root(path):
+    """
+    Return the file that the code at a path is read from, with its module name and whether it is a
+    package, or None if it can't be found. The module name of a script is None.
+    """
+    if path.endswith(".py"):
+        return os.path.abspath(path), None, None
+
+    # a module, or a class or a method in one
+    parts = path.split(".")
+    for n_rest in range(min(3, len(parts))):
+        modname = ".".join(parts[: len(parts) - n_rest])
+        found = _source_file(modname)
+        if found is not None:
+            return found[0], modname, found[1]
+    return None
+
+
+def _find_dependencies(path):
+    root = _find_root(path)
+    if root is None:
+        return None, []
+    filename, modname, is_package = root
+
+    try:
+        index = get_index(filename) if filename.endswith(".py") else None
+    except (OSError, SyntaxError, UnicodeDecodeError):
+        index = None
+    if index is None:
+        return filename, []
+
+    imports = set()
+    for level, target in index.imported:
+        if modname is None:
+            # only what the script imports from its own directory
+            if level != 0:
+                continue
+            search_path = [os.path.dirname(filename)]
+        else:
+            # only what the module imports from its own top level package
+            target = _resolve_import(modname, is_package, level, target)
+            if target.split(".")[0] != modname.split(".")[0]:
+                continue
+            search_path = None
+
+        # "from a import b" imports either the module a.b or a name defined in a
+        found = _source_file(target, search_path) or _source_file(target.rpartition(".")[0], search_path)
+        if found is not None and found[0] != filename:
+            imports.add(found[0])
+
+    return filename, sorted(imports)
+
+
+def find_dependencies(path, imports=True):
+    """
+    Find the files that the code at a path is read from, without importing anything.
+
+    Parameters
+    ----------
+    path : str
+        Path to a file, or the dotted path to a module, function, class, or class method.
+    imports : bool
+        Also return the files of the modules imported by the file of the code, anywhere in it, from the
+        same top level package (or for a file, from the same directory).
+
+    Returns
+    -------
+    list of str
+        The absolute paths of the files that exist, or an empty list if the code can't be found.
+    """
+    cached = _dependencies.get(path)
+    if cached is None or cached[0] is None or file_stamp(cached[0]) != cached[1]:
+        filename, imported = _find_dependencies(path)
+        cached = (filename, file_stamp(filename), imported)
+        _dependencies[path] = cached
+
+    filename, stamp, imported = cached
+    if stamp is None:
+        return []
+    return [filename] + [f for f in imported if os.path.isfile(f)] if imports else [filename]
+
+
+def _environment_dirs():
+    global _ENVIRONMENT_DIRS
+
+    if _ENVIRONMENT_DIRS is None:
+        paths = sysconfig.get_paths()
+        dirs = [paths[name] for name in ("stdlib", "platstdlib", "purelib", "platlib") if name in paths]
+        dirs.extend(getattr(site, "getsitepackages", lambda: [])())
+        dirs.append(site.getusersitepackages())
+        _ENVIRONMENT_DIRS = tuple({os.path.realpath(d) + os.sep for d in dirs if d})
+    return _ENVIRONMENT_DIRS
+
+
+def _local_source_file(modname, path=None):
+    """
+    Return the file a module is loaded from and whether it is a package, or None if it can't be found or
+    belongs to the environment.
+    """
+    found = _source_file(modname, path)
+    if found is None or os.path.realpath(found[0]).startswith(_environment_dirs()):
+        return None
+    return found
+
+
+def is_local_module(modname):
+    """
+    Return True if a module can be found outside of the interpreter and the installed packages, i.e. it is
+    part of the project.
+    """
+    return _local_source_file(modname) is not None
+
+
+def _find_local_imports(module, script_dir):
+    """
+    Return the modules of the project that a module imports directly, as (file, module name, is package).
+    """
+    filename, modname, is_package = module
+    try:
+        index = get_index(filename) if filename.endswith(".py") else None
+    except (OSError, SyntaxError, UnicodeDecodeError):
+        index = None
+    if index is None:
+        return []
+
+    found = {}
+    for level, target in index.imported:
+        if modname is None:
+            if level != 0:
+                continue
+        else:
+            target = _resolve_import(modname, is_package, level, target)
+
+        # "from a import b" imports either the module a.b or a name defined in a, and importing a
+        # module runs its parent packages too
+        parts = target.split(".")
+        for name in (".".join(parts[:i]) for i in range(1, len(parts) + 1)):
+            imported = None
+            if script_dir is not None:
+                # a script can import the modules next to it first
+                imported = _local_source_file(name, [script_dir])
+            if imported is None:
+                imported = _local_source_file(name)
+            if imported is not None:
+                imported_file = os.path.abspath(imported[0])
+                if imported_file != filename:
+                    found.setdefault(imported_file, (imported_file, name, imported[1]))
+    return list(found.values())
+
+
+def _local_imports_of(module, script_dir):
+    """
+    Return _find_local_imports of a module, finding them again only if its file changed.
+    """
+    stamp = build_file_stamp(module[0])
+    cached = _local_imports.get((module, script_dir))
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    imports = _find_local_imports(module, script_dir)
+    _local_imports[(module, script_dir)] = (stamp, imports)
+    return imports
+
+
+def _find_local_dependencies(root, transitive):
+    filename, modname, is_package = root
+    root = (os.path.abspath(filename), modname, is_package)
+    script_dir = os.path.dirname(root[0]) if modname is None else None
+    found = {root[0]: root}
+
+    # importing the module of the code runs its parent packages too
+    if modname is not None:
+        parents = modname.split(".")[:-1]
+        for name in (".".join(parents[:i]) for i in range(1, len(parents) + 1)):
+            parent = _local_source_file(name)
+            if parent is not None:
+                filename = os.path.abspath(parent[0])
+                found.setdefault(filename, (filename, name, parent[1]))
+
+    pending = [root]
+    while pending:
+        for imported in _local_imports_of(pending.pop(), script_dir):
+            if imported[0] not in found:
+                found[imported[0]] = imported
+                if transitive:
+                    pending.append(imported)
+
+    return sorted(filename for filename in found if build_file_stamp(filename) is not None)
+
+
+def find_local_dependencies(path, transitive=True):
+    """
+    Find the source files that the code at a path depends on, following its imports transitively, without
+    importing anything.
+
+    Only the modules that aren't part of the interpreter or installed in the environment are followed, which
+    leaves the code of the project itself, e.g. the package the code exercises and its helper modules. The
+    result for a module is memoized, and only checked against the stamps of its files again once per build.
+
+    Parameters
+    ----------
+    path : str
+        Path to a file, or the dotted path to a module, function, class, or class method.
+    transitive : bool
+        Follow the imports of the imported modules too. Otherwise only the modules that the file of the code
+        imports itself are returned.
+
+    Returns
+    -------
+    list of str
+        The absolute paths of the files, including the file of the code itself, or an empty list if the
+        code can't be found.
+    """
+    if _build_roots is None:
+        root = _find_root(path)
+    elif path in _build_roots:
+        root = _build_roots[path]
+    else:
+        root = _build_roots[path] = _find_root(path)
+    if root is None:
+        return []
+
+    # the methods and classes of a module share its dependencies
+    cached = _local_dependencies.get((root, transitive))
+    if cached is not None and all(build_file_stamp(filename) == stamp for filename, stamp in cached):
+        return [filename for filename, _ in cached]
+
+    files = _find_local_dependencies(root, transitive)
+    _local_dependencies[(root, transitive)] = [(filename, build_file_stamp(filename)) for filename in files]
+    return files
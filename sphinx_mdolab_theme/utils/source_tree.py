@@ -0,0 +1,203 @@
+"""
+A lightweight concrete syntax tree for Python source, built only on the standard library.
+
+The tree combines the ``ast`` of the source with its ``tokenize`` token stream, which together give the
+exact extent of every node, including the parentheses, commas and whitespace around it. The source is
+modified by recording text replacements against absolute offsets, which are all applied at once when the
+new source is emitted. Everything that is not edited is reproduced exactly.
+"""
+
+# Standard Python modules
+import ast
+from io import StringIO
+import tokenize
+
+
+class SourceTree(object):
+    """
+    Parsed Python source that can be edited in place.
+
+    Parameters
+    ----------
+    source : str
+        The Python source code.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.tree = ast.parse(source)
+        self.tokens = list(tokenize.generate_tokens(StringIO(source).readline))
+
+        # absolute offset of the start of each line (line numbers start at 1)
+        self._line_starts = [0, 0]
+        self._lines = source.splitlines(True)
+        for line in self._lines:
+            self._line_starts.append(self._line_starts[-1] + len(line))
+
+        self._edits = []
+
+    def offset(self, lineno, col, utf8=False):
+        """
+        Convert a (line, column) position into an absolute offset in the source.
+
+        Parameters
+        ----------
+        lineno : int
+            Line number, starting at 1.
+        col : int
+            Column in characters, or in bytes of the UTF-8 encoded line if `utf8` is True
+            (which is how ``ast`` reports columns).
+        utf8 : bool
+            Whether `col` is a byte offset.
+
+        Returns
+        -------
+        int
+            The absolute character offset.
+        """
+        if utf8 and lineno <= len(self._lines):
+            line = self._lines[lineno - 1]
+            if not line.isascii():
+                col = len(line.encode("utf-8")[:col].decode("utf-8", "ignore"))
+        return self._line_starts[lineno] + col
+
+    def node_span(self, node):
+        """
+        Return the absolute (start, end) offsets of an ast node, not including any enclosing parentheses.
+        """
+        return (
+            self.offset(node.lineno, node.col_offset, utf8=True),
+            self.offset(node.end_lineno, node.end_col_offset, utf8=True),
+        )
+
+    def token_index(self, pos):
+        """
+        Return the index of the first token starting at or after an absolute offset.
+        """
+        lo, hi = 0, len(self.tokens)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.offset(*self.tokens[mid].start) < pos:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def call_arguments(self, call):
+        """
+        Find the extent of the parentheses and of each argument of a call.
+
+        Unlike the ast node spans, the argument spans include any parentheses around an argument.
+
+        Parameters
+        ----------
+        call : ast.Call
+            The call node.
+
+        Returns
+        -------
+        int
+            Offset of the opening parenthesis.
+        list of tuple
+            The (start, end) offsets of each argument, in source order.
+        int
+            Offset just past the closing parenthesis.
+        """
+        _, func_end = self.node_span(call.func)
+        i = self.token_index(func_end)
+        while self.tokens[i].string != "(":
+            i += 1
+        open_paren = self.offset(*self.tokens[i].start)
+
+        # split the text between the parentheses at the commas that are not nested any deeper
+        bounds = []
+        depth = 0
+        seg_start = self.offset(*self.tokens[i].end)
+        for tok in self.tokens[i + 1 :]:
+            if tok.type != tokenize.OP:
+                continue
+            if tok.string in "([{":
+                depth += 1
+            elif tok.string in ")]}":
+                if depth == 0:
+                    bounds.append((seg_start, self.offset(*tok.start)))
+                    close_paren = self.offset(*tok.end)
+                    break
+                depth -= 1
+            elif tok.string == "," and depth == 0:
+                bounds.append((seg_start, self.offset(*tok.start)))
+                seg_start = self.offset(*tok.end)
+
+        # strip the whitespace around each argument, dropping the empty segment after a trailing comma
+        args = []
+        for start, end in bounds:
+            text = self.source[start:end]
+            stripped = text.strip()
+            if stripped:
+                lead = len(text) - len(text.lstrip())
+                args.append((start + lead, start + lead + len(stripped)))
+
+        return open_paren, args, close_paren
+
+    def body_start(self, node):
+        """
+        Return the offset where the body of a compound statement (e.g. a function definition) starts.
+
+        This is the start of the line after the colon that ends the header, or the position right after
+        the colon if the body is on the same line.
+        """
+        start, _ = self.node_span(node)
+        i = self.token_index(start)
+        depth = 0
+        for tok in self.tokens[i:]:
+            if tok.type != tokenize.OP:
+                continue
+            if tok.string in "([{":
+                depth += 1
+            elif tok.string in ")]}":
+                depth -= 1
+            elif tok.string == ":" and depth == 0:
+                break
+
+        colon_line = tok.end[0]
+        if node.body[0].lineno == colon_line:
+            return self.offset(*tok.end)
+        return self.offset(colon_line + 1, 0)
+
+    def replace(self, start, end, text):
+        """
+        Record the replacement of the source between two absolute offsets.
+        """
+        self._edits.append((start, end, text))
+
+    def dumps(self, edits=None, start=0):
+        """
+        Return the source with replacements applied.
+
+        Replacements that overlap an earlier one, or that begin before `start`, are ignored.
+
+        Parameters
+        ----------
+        edits : list of tuple or None
+            The (start, end, text) replacements to apply. By default, the ones recorded with `replace`.
+        start : int
+            Offset in the source at which the returned text starts.
+
+        Returns
+        -------
+        str
+            The modified source.
+        """
+        if edits is None:
+            edits = self._edits
+
+        out = []
+        pos = start
+        for edit_start, edit_end, text in sorted(edits, key=lambda edit: edit[0]):
+            if edit_start < pos:
+                continue
+            out.append(self.source[pos:edit_start])
+            out.append(text)
+            pos = edit_end
+        out.append(self.source[pos:])
+        return "".join(out)
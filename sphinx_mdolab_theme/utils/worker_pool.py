@@ -0,0 +1,216 @@
+"""
+A pool of long-lived worker processes for running embedded code that has to be isolated from the
+Sphinx process, e.g. code that shows plots.
+
+Each worker imports the heavy modules (numpy, matplotlib, openmdao, ...) once when it starts. For every
+request it then forks a clean child that runs the code and sends the output back over a pipe, so a
+snippet only pays for a fork instead of a full interpreter start and the imports.
+
+When run as a script, this module is the worker itself.
+"""
+
+# Standard Python modules
+import importlib
+import os
+import queue
+import subprocess
+import sys
+import threading
+
+# First party modules
+from .instrument import trace_span
+from .protocol import read_message, write_message
+from .run_sub import error_result, execute
+
+# modules imported by each worker before it starts accepting requests
+DEFAULT_PRELOAD = ["numpy", "matplotlib", "matplotlib.pyplot", "openmdao.api"]
+
+_pool = None
+_pool_size = 0
+_pool_preload = DEFAULT_PRELOAD
+
+
+class WorkerPool(object):
+    """
+    A fixed size pool of worker processes, started on demand.
+
+    Parameters
+    ----------
+    size : int
+        The maximum number of worker processes.
+    preload : list of str
+        Modules each worker imports when it starts.
+    """
+
+    def __init__(self, size, preload=DEFAULT_PRELOAD):
+        self.size = size
+        self.preload = list(preload)
+        self._pid = os.getpid()
+        self._workers = []
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+
+    def _start_worker(self):
+        env = os.environ.copy()
+        env["MPLBACKEND"] = "Agg"
+        return subprocess.Popen(
+            [sys.executable, "-m", __name__] + self.preload,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+        )
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle.empty() and len(self._workers) < self.size:
+                worker = self._start_worker()
+                self._workers.append(worker)
+                return worker
+        return self._idle.get()
+
+    def _release(self, worker):
+        if worker.poll() is None:
+            self._idle.put(worker)
+        else:
+            # replace the dead worker lazily
+            with self._lock:
+                self._workers.remove(worker)
+
+    def run(self, request):
+        """
+        Run a chunk of code in a fresh child of one of the workers.
+
+        Parameters
+        ----------
+        request : dict
+            The request, as built by run_sub.make_request.
+
+        Returns
+        -------
+        dict
+            The result, as described in the run_sub module.
+        """
+        with trace_span("wait for worker"):
+            worker = self._acquire()
+        try:
+            with trace_span("worker run", worker=worker.pid, path=request["path"]):
+                write_message(worker.stdin, request)
+                result = read_message(worker.stdout)
+        except (EOFError, OSError):
+            worker.kill()
+            worker.wait()
+            result = error_result("Worker process died while running embedded code.")
+        finally:
+            self._release(worker)
+
+        return result
+
+    def close(self):
+        """Shut down all workers."""
+        if self._pid != os.getpid():
+            # the workers belong to the process this pool was forked from
+            return
+        with self._lock:
+            for worker in self._workers:
+                try:
+                    worker.stdin.close()
+                except OSError:
+                    pass
+            for worker in self._workers:
+                try:
+                    worker.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    worker.kill()
+            self._workers = []
+
+
+def configure_pool(size, preload=DEFAULT_PRELOAD):
+    """
+    Set the size and the preloaded modules of the worker pool. A size of 0 disables the pool.
+    """
+    global _pool_size, _pool_preload
+
+    close_pool()
+    _pool_size = size if hasattr(os, "fork") else 0
+    _pool_preload = list(preload)
+
+
+def get_pool():
+    """
+    Return the worker pool for this process, or None if the pool is disabled.
+    """
+    global _pool
+
+    if _pool_size < 1:
+        return None
+
+    # a pool inherited from a parent process (e.g. a parallel Sphinx reader) can't share the
+    # parent's pipes, so start a new one for this process
+    if _pool is None or _pool._pid != os.getpid():
+        _pool = WorkerPool(_pool_size, _pool_preload)
+
+    return _pool
+
+
+def close_pool():
+    """Shut down the worker pool of this process, if there is one."""
+    global _pool
+
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+def run_forked(request):
+    """
+    Run a request in a forked child and collect its result.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            with os.fdopen(write_fd, "wb") as f:
+                write_message(f, execute(request))
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as f:
+        try:
+            result = read_message(f)
+        except EOFError:
+            result = None
+    _, status = os.waitpid(pid, 0)
+
+    if result is None:
+        result = error_result("Embedded code process died with exit code %d." % os.waitstatus_to_exitcode(status))
+    return result
+
+
+def main(preload):
+    """
+    Worker main loop: import the heavy modules, then serve requests from stdin until it is closed.
+    """
+    # keep the real stdout for the protocol and send anything else printed by this process to stderr
+    channel_out = os.fdopen(os.dup(1), "wb")
+    channel_in = os.fdopen(os.dup(0), "rb")
+    os.dup2(2, 1)
+
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+    while True:
+        try:
+            request = read_message(channel_in)
+        except EOFError:
+            break
+        write_message(channel_out, run_forked(request))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,56 @@
+"""
+A cache of the YAML files that option descriptions are read from.
+
+The same descriptions file is typically used by several optionstable and optionslist directives,
+on several pages, so each file is parsed once per process (and again only if its modification time or
+size changes), with the libyaml based loader when it is available.
+"""
+
+# Standard Python modules
+import os
+
+# First party modules
+from .source_index import file_stamp
+
+try:
+    # External modules
+    from yaml import CSafeLoader as Loader
+except ImportError:
+    # External modules
+    from yaml import SafeLoader as Loader
+
+# External modules
+import yaml
+
+_documents = {}
+
+
+def load_yaml(filename):
+    """
+    Return the contents of a YAML file, parsing it only if it changed since the last call.
+
+    The same object is returned to every caller, so it must not be modified.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the YAML file.
+
+    Returns
+    -------
+    object
+        The contents of the file.
+    """
+    filename = os.path.abspath(filename)
+    stamp = file_stamp(filename)
+    if stamp is None:
+        raise FileNotFoundError("Can't find file '%s'" % filename)
+
+    cached = _documents.get(filename)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with open(filename) as f:
+        document = yaml.load(f, Loader=Loader)
+    _documents[filename] = (stamp, document)
+    return document
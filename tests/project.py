@@ -0,0 +1,78 @@
+"""
+A temporary project for the tests of the caches, with a package and its tests in separate top level packages.
+"""
+
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+
+from sphinx_mdolab_theme.utils.cache import ExecutionCache
+
+
+def write_file(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(textwrap.dedent(text))
+    # make sure the modification time changes even on file systems with a coarse clock
+    stamp = time.time_ns() + 1_000_000_000
+    os.utime(path, ns=(stamp, stamp))
+
+
+class ProjectTestCase(unittest.TestCase):
+    """
+    A temporary project on the path, with a package and a test module in a separate top level package.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        write_file(os.path.join(self.root, "mypkg", "__init__.py"), "")
+        write_file(
+            os.path.join(self.root, "mypkg", "core.py"),
+            """
+            from .helpers import scale
+
+            def value():
+                return scale(1)
+            """,
+        )
+        write_file(
+            os.path.join(self.root, "mypkg", "helpers.py"),
+            """
+            def scale(x):
+                return x
+            """,
+        )
+        write_file(os.path.join(self.root, "tests_mypkg", "__init__.py"), "")
+        write_file(
+            os.path.join(self.root, "tests_mypkg", "test_core.py"),
+            """
+            import unittest
+            from mypkg import core
+
+            class TestCore(unittest.TestCase):
+                def test_value(self):
+                    print("value is", core.value())
+            """,
+        )
+        sys.path.insert(0, self.root)
+        importlib.invalidate_caches()
+
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = ExecutionCache(self.cache_dir, 1024**2)
+
+    def tearDown(self):
+        sys.path.remove(self.root)
+        for name in list(sys.modules):
+            if name.split(".")[0] in ("mypkg", "tests_mypkg"):
+                del sys.modules[name]
+        importlib.invalidate_caches()
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.cache_dir)
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
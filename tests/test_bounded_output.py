@@ -0,0 +1,53 @@
+import unittest
+
+from sphinx_mdolab_theme.utils.bounded_output import BoundedOutput
+from sphinx_mdolab_theme.utils.docutil import extract_output_blocks
+
+
+class TestBoundedOutput(unittest.TestCase):
+    def capture(self, text, limit, tail, chunk=None):
+        output = BoundedOutput(limit, tail)
+        chunk = chunk or len(text)
+        for start in range(0, len(text), chunk):
+            output.write(text[start : start + chunk])
+        return output
+
+    def test_short_output_is_kept(self):
+        output = self.capture("hello\n>>>>>0\n", 100, 10)
+        self.assertEqual(output.getvalue(), "hello\n>>>>>0\n")
+        self.assertEqual(output.dropped, 0)
+
+    def test_long_output_is_elided(self):
+        output = self.capture("a" * 50 + "b" * 50, 30, 10)
+        self.assertEqual(output.getvalue(), "a" * 20 + "\n\n... [70 bytes of output omitted] ...\n\n" + "b" * 10)
+        self.assertEqual(output.dropped, 70)
+
+    def test_indicators_are_kept(self):
+        text = "".join("%s\n>>>>>%d\n" % (str(i) * 100, i) for i in range(5))
+        for chunk in (None, 1, 7, 64):
+            # the head and the tail both end inside an indicator
+            for limit, tail in ((155, 50), (105, 5), (40, 0)):
+                with self.subTest(chunk=chunk, limit=limit, tail=tail):
+                    output = self.capture(text, limit, tail, chunk)
+                    blocks = extract_output_blocks(output.getvalue())
+                    self.assertEqual(sorted(blocks), [">>>>>%d" % i for i in range(5)])
+                    for i in range(5):
+                        # every block keeps some of its own output, or says that it was omitted
+                        block = blocks[">>>>>%d" % i]
+                        self.assertTrue(block.startswith(str(i)) or block.startswith("... ["), block)
+                    self.assertLess(len(output.getvalue()), len(text))
+
+    def test_omitted_output_is_in_its_block(self):
+        text = "first\n>>>>>0\n" + "x" * 1000 + "\n>>>>>1\nlast\n>>>>>2\n"
+        blocks = extract_output_blocks(self.capture(text, 40, 20).getvalue())
+        self.assertEqual(blocks[">>>>>0"], "first")
+        self.assertEqual(blocks[">>>>>1"], "x" * 7 + "\n\n... [993 bytes of output omitted] ...")
+        self.assertEqual(blocks[">>>>>2"], "last")
+
+    def test_indicator_like_text_is_dropped(self):
+        output = self.capture("x" * 20 + ">>>>>0 " + "y" * 1000 + "\n", 30, 10)
+        self.assertNotIn(">>>>>", output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from unittest import mock
+
+from project import ProjectTestCase, write_file
+from sphinx_mdolab_theme.utils import source_index
+from sphinx_mdolab_theme.utils.cache import execution_key
+from sphinx_mdolab_theme.utils.source_index import begin_build, end_build, find_local_dependencies
+
+
+class TestLocalDependencies(ProjectTestCase):
+    def test_transitive_imports(self):
+        files = find_local_dependencies("tests_mypkg.test_core.TestCore.test_value")
+        self.assertEqual(
+            files,
+            sorted(
+                [
+                    self.path("mypkg", "__init__.py"),
+                    self.path("mypkg", "core.py"),
+                    self.path("mypkg", "helpers.py"),
+                    self.path("tests_mypkg", "__init__.py"),
+                    self.path("tests_mypkg", "test_core.py"),
+                ]
+            ),
+        )
+
+    def test_direct_imports(self):
+        files = find_local_dependencies("tests_mypkg.test_core.TestCore.test_value", transitive=False)
+        self.assertIn(self.path("mypkg", "core.py"), files)
+        self.assertNotIn(self.path("mypkg", "helpers.py"), files)
+
+    def test_environment_is_left_out(self):
+        for filename in find_local_dependencies("tests_mypkg.test_core"):
+            self.assertTrue(filename.startswith(self.root), filename)
+
+    def test_new_import(self):
+        write_file(self.path("mypkg", "extra.py"), "")
+        self.assertNotIn(self.path("mypkg", "extra.py"), find_local_dependencies("tests_mypkg.test_core"))
+
+        write_file(
+            self.path("mypkg", "helpers.py"),
+            """
+            from . import extra
+
+            def scale(x):
+                return x
+            """,
+        )
+        self.assertIn(self.path("mypkg", "extra.py"), find_local_dependencies("tests_mypkg.test_core"))
+
+    def test_stat_once_per_build(self):
+        begin_build()
+        try:
+            find_local_dependencies("tests_mypkg.test_core.TestCore.test_value")
+            with mock.patch.object(source_index, "file_stamp", wraps=source_index.file_stamp) as file_stamp:
+                execution_key("print(1)", "tests_mypkg.test_core.TestCore.test_other", ["output"])
+                find_local_dependencies("tests_mypkg.test_core")
+            self.assertEqual(file_stamp.call_count, 0)
+
+            # the files are assumed not to change during a build
+            write_file(self.path("mypkg", "extra.py"), "")
+            write_file(self.path("mypkg", "helpers.py"), "from . import extra\n")
+            self.assertNotIn(self.path("mypkg", "extra.py"), find_local_dependencies("tests_mypkg.test_core"))
+        finally:
+            end_build()
+        self.assertIn(self.path("mypkg", "extra.py"), find_local_dependencies("tests_mypkg.test_core"))
+
+    def test_script(self):
+        write_file(self.path("doc", "scriptlib.py"), "")
+        write_file(self.path("doc", "script.py"), "import scriptlib\nimport mypkg.core\n")
+        files = find_local_dependencies(self.path("doc", "script.py"))
+        self.assertIn(self.path("doc", "scriptlib.py"), files)
+        self.assertIn(self.path("mypkg", "helpers.py"), files)
+
+
+class TestExecutionKey(ProjectTestCase):
+    def key(self):
+        return execution_key("print(1)", "tests_mypkg.test_core.TestCore.test_value", ["output"])
+
+    def test_edited_helper_misses(self):
+        key = self.key()
+        self.cache.put(key, False, False, "value is 1\n")
+        self.assertEqual(self.cache.get(self.key()), (False, False, "value is 1\n"))
+
+        write_file(
+            self.path("mypkg", "helpers.py"),
+            """
+            def scale(x):
+                return 7 * x
+            """,
+        )
+        self.assertNotEqual(self.key(), key)
+        self.assertIsNone(self.cache.get(self.key()))
+
+    def test_untouched_project_hits(self):
+        key = self.key()
+        self.cache.put(key, False, False, "value is 1\n")
+        # touched but not changed
+        write_file(self.path("mypkg", "helpers.py"), "\ndef scale(x):\n    return x\n")
+        self.assertEqual(self.key(), key)
+        self.assertEqual(self.cache.get(key), (False, False, "value is 1\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
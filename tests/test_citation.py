@@ -0,0 +1,50 @@
+import unittest
+
+from project import ProjectTestCase, write_file
+from sphinx_mdolab_theme.utils.citation import find_cite_static, get_cite
+
+
+class TestCitation(ProjectTestCase):
+    def setUp(self):
+        super().setUp()
+        write_file(
+            self.path("mypkg", "base.py"),
+            """
+            CITATION = "@article{base, title={Base}}"
+
+            class Base(object):
+                cite = CITATION
+            """,
+        )
+        write_file(
+            self.path("mypkg", "solver.py"),
+            """
+            from .base import Base
+
+            class Solver(Base):
+                pass
+            """,
+        )
+
+    def test_static(self):
+        self.assertEqual(find_cite_static("mypkg.solver", "Solver"), "@article{base, title={Base}}")
+
+    def test_edited_base_class_misses(self):
+        self.assertEqual(get_cite("mypkg.solver", "Solver", self.cache), ("@article{base, title={Base}}", None))
+        # from the cache
+        self.assertEqual(get_cite("mypkg.solver", "Solver", self.cache), ("@article{base, title={Base}}", None))
+
+        write_file(
+            self.path("mypkg", "base.py"),
+            """
+            CITATION = "@article{base, title={Renamed}}"
+
+            class Base(object):
+                cite = CITATION
+            """,
+        )
+        self.assertEqual(get_cite("mypkg.solver", "Solver", self.cache), ("@article{base, title={Renamed}}", None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from project import write_file
+from sphinx.application import Sphinx
+
+
+class TestConfig(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_leftover_temp_file_is_excluded(self):
+        write_file(
+            os.path.join(self.root, "conf.py"),
+            """
+            from sphinx_mdolab_theme.config import *
+
+            extensions = []
+            nitpicky = False
+            """,
+        )
+        write_file(os.path.join(self.root, "index.rst"), "Index\n=====\n")
+        # left behind by the optionslist extension of earlier versions
+        write_file(os.path.join(self.root, "tmp.rst"), "Options\n=======\n")
+
+        app = Sphinx(
+            self.root,
+            self.root,
+            os.path.join(self.root, "_build", "html"),
+            os.path.join(self.root, "_build", "doctrees"),
+            "html",
+            status=None,
+            warning=None,
+            freshenv=True,
+            warningiserror=True,
+        )
+        app.build()
+        self.assertNotIn("tmp", app.env.found_docs)
+
+
+if __name__ == "__main__":
+    unittest.main()
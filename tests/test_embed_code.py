@@ -0,0 +1,42 @@
+import os
+import unittest
+
+from project import ProjectTestCase, write_file
+from sphinx.application import Sphinx
+
+
+class TestNotedDependencies(ProjectTestCase):
+    def test_direct_imports_are_noted(self):
+        write_file(self.path("doc", "conf.py"), 'extensions = ["sphinx_mdolab_theme.ext.embed_code"]\n')
+        write_file(
+            self.path("doc", "index.rst"),
+            """
+            Core
+            ====
+
+            .. embed-code::
+                tests_mypkg.test_core.TestCore.test_value
+                :layout: output
+            """,
+        )
+        app = Sphinx(
+            self.path("doc"),
+            self.path("doc"),
+            self.path("doc", "_build", "html"),
+            self.path("doc", "_build", "doctrees"),
+            "html",
+            status=None,
+            warning=None,
+            freshenv=True,
+        )
+        app.build()
+
+        noted = {os.path.normpath(os.path.join(app.srcdir, filename)) for filename in app.env.dependencies["index"]}
+        self.assertIn(self.path("tests_mypkg", "test_core.py"), noted)
+        self.assertIn(self.path("mypkg", "core.py"), noted)
+        # only imported by mypkg.core, and still part of the cache key
+        self.assertNotIn(self.path("mypkg", "helpers.py"), noted)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import glob
+import hashlib
+import os
+import unittest
+
+from project import ProjectTestCase, write_file
+from sphinx.application import Sphinx
+
+
+class TestPlotInputs(ProjectTestCase):
+    def setUp(self):
+        super().setUp()
+        write_file(self.path("tests_mypkg", "data.txt"), "3\n")
+        write_file(
+            self.path("tests_mypkg", "test_plot.py"),
+            """
+            import unittest
+
+            class TestPlot(unittest.TestCase):
+                def test_plot(self):
+                    import matplotlib.pyplot as plt
+
+                    with open("data.txt") as f:
+                        value = int(f.read())
+                    plt.plot([0, value])
+                    plt.show()
+            """,
+        )
+        write_file(
+            self.path("doc", "conf.py"),
+            'extensions = ["sphinx_mdolab_theme.ext.embed_code"]\nembed_code_cache = True\n',
+        )
+        write_file(
+            self.path("doc", "index.rst"),
+            """
+            Plot
+            ====
+
+            .. embed-code::
+                tests_mypkg.test_plot.TestPlot.test_plot
+                :layout: plot
+            """,
+        )
+
+    def build(self):
+        out_dir = self.path("doc", "_build", "html")
+        app = Sphinx(
+            self.path("doc"),
+            self.path("doc"),
+            out_dir,
+            self.path("doc", "_build", "doctrees"),
+            "html",
+            status=None,
+            warning=None,
+            freshenv=True,
+        )
+        app.build()
+
+        plots = sorted(glob.glob(os.path.join(out_dir, "_images", "embed_code_plot_*")))
+        self.assertTrue(plots)
+        digest = hashlib.sha256()
+        for plot in plots:
+            with open(plot, "rb") as f:
+                digest.update(f.read())
+        return digest.hexdigest()
+
+    def test_edited_data_redraws(self):
+        first = self.build()
+        self.assertEqual(self.build(), first)
+
+        write_file(self.path("tests_mypkg", "data.txt"), "7\n")
+        self.assertNotEqual(self.build(), first)
+
+
+if __name__ == "__main__":
+    unittest.main()
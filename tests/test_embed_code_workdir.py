@@ -0,0 +1,72 @@
+import os
+import re
+import unittest
+
+from project import ProjectTestCase, write_file
+from sphinx.application import Sphinx
+
+
+class TestChainedSnippets(ProjectTestCase):
+    def setUp(self):
+        super().setUp()
+        write_file(
+            self.path("tests_mypkg", "test_recorder.py"),
+            """
+            import unittest
+
+            class TestRecorder(unittest.TestCase):
+                def test_record(self):
+                    with open("cases.txt", "w") as f:
+                        f.write("3 cases")
+                    print("recorded")
+
+                def test_read(self):
+                    with open("cases.txt") as f:
+                        print("read", f.read())
+            """,
+        )
+        write_file(
+            self.path("doc", "conf.py"),
+            'extensions = ["sphinx_mdolab_theme.ext.embed_code"]\nembed_code_cache = True\n',
+        )
+        write_file(
+            self.path("doc", "index.rst"),
+            """
+            Recorder
+            ========
+
+            .. embed-code::
+                tests_mypkg.test_recorder.TestRecorder.test_record
+                :layout: output
+
+            .. embed-code::
+                tests_mypkg.test_recorder.TestRecorder.test_read
+                :layout: output
+            """,
+        )
+
+    def build(self):
+        out_dir = self.path("doc", "_build", "html")
+        app = Sphinx(
+            self.path("doc"),
+            self.path("doc"),
+            out_dir,
+            self.path("doc", "_build", "doctrees"),
+            "html",
+            status=None,
+            warning=None,
+            freshenv=True,
+        )
+        app.build()
+        with open(os.path.join(out_dir, "index.html")) as f:
+            return re.findall(r"recorded|read 3 cases|Running of embedded code", f.read())
+
+    def test_later_snippet_reads_earlier_file(self):
+        self.assertEqual(self.build(), ["recorded", "read 3 cases"])
+        # neither result can come from the cache, since the file only exists while the first snippet runs
+        self.assertEqual(self.build(), ["recorded", "read 3 cases"])
+        self.assertFalse(os.path.exists(self.path("tests_mypkg", "cases.txt")))
+
+
+if __name__ == "__main__":
+    unittest.main()
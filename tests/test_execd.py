@@ -0,0 +1,164 @@
+import os
+import shutil
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from project import write_file
+from sphinx_mdolab_theme.utils import execd
+from sphinx_mdolab_theme.utils.protocol import read_message, write_message
+from sphinx_mdolab_theme.utils.run_sub import make_request
+
+
+@unittest.skipUnless(hasattr(os, "fork") and execd.fcntl is not None, "the execution server needs fork")
+class TestExecd(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.chmod(self.root, 0o700)
+        self.socket_path = os.path.join(self.root, "execd.sock")
+        self.servers = []
+
+    def tearDown(self):
+        execd.configure_execd(False)
+        for server in self.servers:
+            if server.poll() is None:
+                server.kill()
+            server.wait()
+        shutil.rmtree(self.root)
+
+    def start_server(self, *args, env=None):
+        server = subprocess.Popen(
+            [sys.executable, "-m", "sphinx_mdolab_theme.utils.execd", "--socket", self.socket_path]
+            + ["--preload"]
+            + list(args),
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self.servers.append(server)
+        for _ in range(200):
+            if os.path.exists(self.socket_path) or server.poll() is not None:
+                break
+            time.sleep(0.05)
+        return server
+
+    def assertListening(self):
+        sock = execd._connect(self.socket_path)
+        self.assertIsNotNone(sock)
+        sock.close()
+
+    def request(self):
+        return make_request("print('hi')\n", path=os.path.join(self.root, "x.py"), cwd=self.root)
+
+    def send(self):
+        sock = execd._connect(self.socket_path)
+        self.assertIsNotNone(sock)
+        with sock, sock.makefile("rwb") as channel:
+            write_message(channel, self.request())
+            return read_message(channel)
+
+    def test_default_socket_dir(self):
+        with mock.patch.dict(os.environ, {"XDG_RUNTIME_DIR": self.root}):
+            socket_path = execd.default_socket_path()
+        self.assertEqual(os.path.dirname(os.path.dirname(socket_path)), self.root)
+
+        with mock.patch.dict(os.environ, {"XDG_RUNTIME_DIR": ""}):
+            socket_path = execd.default_socket_path()
+        self.assertTrue(execd._socket_dir_ready(socket_path))
+        st = os.lstat(os.path.dirname(socket_path))
+        self.assertEqual(st.st_uid, os.getuid())
+        self.assertEqual(stat.S_IMODE(st.st_mode) & 0o077, 0)
+
+    def test_shared_socket_dir_is_refused(self):
+        shared = os.path.join(self.root, "shared")
+        os.mkdir(shared)
+        os.chmod(shared, 0o777)
+        self.assertFalse(execd.configure_execd(True, os.path.join(shared, "execd.sock")))
+        self.assertIsNone(execd.run_in_execd(self.request()))
+
+        self.socket_path = os.path.join(shared, "execd.sock")
+        server = self.start_server()
+        self.assertNotEqual(server.wait(timeout=30), 0)
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_linked_socket_dir_is_refused(self):
+        target = os.path.join(self.root, "target")
+        os.mkdir(target, 0o700)
+        os.symlink(target, os.path.join(self.root, "link"))
+        self.assertFalse(execd.configure_execd(True, os.path.join(self.root, "link", "execd.sock")))
+
+    def test_linked_lock_is_not_followed(self):
+        victim = os.path.join(self.root, "victim.txt")
+        write_file(victim, "keep me\n")
+        os.symlink(victim, self.socket_path + ".lock")
+
+        server = self.start_server()
+        self.assertNotEqual(server.wait(timeout=30), 0)
+        with open(victim) as f:
+            self.assertEqual(f.read(), "keep me\n")
+
+    def test_only_sockets_are_connected_to(self):
+        write_file(self.socket_path, "")
+        self.assertIsNone(execd._connect(self.socket_path))
+
+    @unittest.skipUnless(hasattr(socket, "SO_PEERCRED"), "the platform doesn't report the user of a peer")
+    def test_peer_uid(self):
+        left, right = socket.socketpair(socket.AF_UNIX)
+        with left, right:
+            self.assertEqual(execd._peer_uid(left), os.getuid())
+            with mock.patch.object(os, "getuid", return_value=os.getuid() + 1):
+                self.assertFalse(execd._trusted_peer(left))
+
+    def test_run_and_stop(self):
+        server = self.start_server()
+        self.assertTrue(execd.configure_execd(True, self.socket_path))
+        result = execd.run_in_execd(self.request())
+        self.assertEqual(result["output"], "hi\n")
+        self.assertIsNone(result["error"])
+
+        self.assertTrue(execd.stop_execd(self.socket_path))
+        server.wait(timeout=30)
+        self.assertFalse(os.path.exists(self.socket_path))
+        self.assertFalse(os.path.exists(self.socket_path + ".lock"))
+        self.assertIsNone(execd.run_in_execd(self.request()))
+
+    def test_changed_module_stops_server(self):
+        module_dir = os.path.join(self.root, "modules")
+        write_file(os.path.join(module_dir, "preloaded.py"), "X = 1\n")
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([module_dir] + sys.path))
+        server = self.start_server("preloaded", env=env)
+        self.assertEqual(self.send()["output"], "hi\n")
+
+        # noticed when the next request arrives, which is then run the usual way
+        write_file(os.path.join(module_dir, "preloaded.py"), "X = 2\n")
+        with self.assertRaises((EOFError, OSError)):
+            self.send()
+        server.wait(timeout=30)
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_idle_server_checks_nothing(self):
+        server = execd.ExecServer(self.socket_path, idle_timeout=1.5, preload=[])
+        with mock.patch.object(execd, "file_stamp", wraps=execd.file_stamp) as file_stamp:
+            thread = threading.Thread(target=server.serve)
+            thread.start()
+            thread.join(timeout=30)
+        self.assertFalse(thread.is_alive())
+        # only when the modules were imported
+        self.assertEqual(file_stamp.call_count, len(server._stamps))
+        self.assertFalse(os.path.exists(self.socket_path + ".lock"))
+
+    def test_second_server_exits(self):
+        self.start_server()
+        second = self.start_server()
+        self.assertEqual(second.wait(timeout=30), 0)
+        self.assertListening()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import importlib
+import unittest
+from unittest import mock
+
+from project import ProjectTestCase
+from sphinx_mdolab_theme.utils import cache
+from sphinx_mdolab_theme.utils.docutil import failed_on_missing_dependency, run_code
+
+PATH = "tests_mypkg.test_core.TestCore.test_value"
+
+
+class TestMissingDependency(ProjectTestCase):
+    def run_snippet(self, code):
+        module = importlib.import_module("tests_mypkg.test_core")
+        skipped, failed, output = run_code(code, PATH, module=module)
+        self.assertTrue(failed)
+        return output
+
+    def test_missing_module(self):
+        output = self.run_snippet("import not_installed_pkg\n")
+        self.assertTrue(failed_on_missing_dependency(output, PATH))
+
+    def test_missing_name(self):
+        output = self.run_snippet("from mypkg.core import renamed\n")
+        self.assertFalse(failed_on_missing_dependency(output, PATH))
+
+    def test_missing_project_module(self):
+        output = self.run_snippet("import mypkg.renamed\n")
+        self.assertFalse(failed_on_missing_dependency(output, PATH))
+
+    def test_missing_module_of_the_snippet_package(self):
+        output = self.run_snippet("import tests_mypkg.renamed\n")
+        self.assertFalse(failed_on_missing_dependency(output, PATH))
+
+    def test_other_error(self):
+        output = self.run_snippet("raise ValueError('ModuleNotFoundError: No module named x')\n")
+        self.assertFalse(failed_on_missing_dependency(output, PATH))
+
+    def test_handled_then_other_error(self):
+        code = "try:\n    import not_installed_pkg\nexcept ImportError:\n    raise RuntimeError('bug')\n"
+        output = self.run_snippet(code)
+        self.assertFalse(failed_on_missing_dependency(output, PATH))
+
+
+class TestEnvironmentFingerprint(ProjectTestCase):
+    def test_environment_change_misses(self):
+        self.cache.put("skipped", True, False, "pyoptsparse is not installed", depends_on_environment=True)
+        self.cache.put("ran", False, False, "value is 1\n")
+        self.assertIsNotNone(self.cache.get("skipped"))
+
+        with mock.patch.object(cache, "environment_fingerprint", return_value="changed"):
+            self.assertIsNone(self.cache.get("skipped"))
+            self.assertEqual(self.cache.get("ran"), (False, False, "value is 1\n"))
+
+    def test_fingerprint_is_stable(self):
+        self.assertEqual(cache.environment_fingerprint(), cache.environment_fingerprint.__wrapped__())
+
+
+if __name__ == "__main__":
+    unittest.main()
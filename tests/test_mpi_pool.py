@@ -0,0 +1,36 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from sphinx_mdolab_theme.utils.mpi_pool import MPIJob
+from sphinx_mdolab_theme.utils.run_sub import make_request
+
+
+@unittest.skipUnless(
+    shutil.which("mpirun") and importlib.util.find_spec("mpi4py"), "running MPI jobs needs mpirun and mpi4py"
+)
+class TestMPIJob(unittest.TestCase):
+    def test_job_dir_is_removed(self):
+        tmp_dirs = []
+        real_mkdtemp = tempfile.mkdtemp
+
+        def mkdtemp(*args, **kwargs):
+            tmp_dirs.append(real_mkdtemp(*args, **kwargs))
+            return tmp_dirs[-1]
+
+        job = MPIJob(2)
+        try:
+            with mock.patch.object(tempfile, "mkdtemp", mkdtemp):
+                job.run(make_request("print('hi')\n", cwd=os.getcwd()))
+            # the directory is removed once the job is started, or failed to start, without closing it
+            self.assertEqual(len(tmp_dirs), 1)
+            self.assertFalse(os.path.exists(tmp_dirs[0]))
+        finally:
+            job.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from project import write_file
+from sphinx_mdolab_theme.utils.general_utils import (
+    build_workdir,
+    close_build_workdirs,
+    configure_build_workdirs,
+    in_build_workdir,
+    private_workdir,
+)
+
+
+class TestPrivateWorkdir(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        write_file(os.path.join(self.root, "mesh.dat"), "top\n")
+        write_file(os.path.join(self.root, "inputs", "grid.dat"), "nested\n")
+        os.mkdir(os.path.join(self.root, "outputs"))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_reads_through_mirror(self):
+        with private_workdir(self.root) as workdir:
+            self.assertNotEqual(workdir, self.root)
+            with open(os.path.join(workdir, "mesh.dat")) as f:
+                self.assertEqual(f.read(), "top\n")
+            with open(os.path.join(workdir, "inputs", "grid.dat")) as f:
+                self.assertEqual(f.read(), "nested\n")
+        self.assertFalse(os.path.exists(workdir))
+
+    def test_writes_stay_private(self):
+        with private_workdir(self.root) as first, private_workdir(self.root) as second:
+            for workdir, text in ((first, "first"), (second, "second")):
+                write_file(os.path.join(workdir, "result.txt"), text)
+                write_file(os.path.join(workdir, "outputs", "result.txt"), text)
+                write_file(os.path.join(workdir, "inputs", "new.txt"), text)
+
+            for workdir, text in ((first, "first"), (second, "second")):
+                for name in ("result.txt", os.path.join("outputs", "result.txt"), os.path.join("inputs", "new.txt")):
+                    with open(os.path.join(workdir, name)) as f:
+                        self.assertEqual(f.read(), text)
+
+        self.assertFalse(os.path.exists(os.path.join(self.root, "result.txt")))
+        self.assertEqual(os.listdir(os.path.join(self.root, "outputs")), [])
+        self.assertEqual(os.listdir(os.path.join(self.root, "inputs")), ["grid.dat"])
+
+    def test_linked_dirs(self):
+        with private_workdir(self.root, linked=[os.path.join(self.root, "inputs")]) as workdir:
+            self.assertTrue(os.path.islink(os.path.join(workdir, "inputs")))
+            self.assertFalse(os.path.islink(os.path.join(workdir, "outputs")))
+        self.assertTrue(os.path.isfile(os.path.join(self.root, "inputs", "grid.dat")))
+
+
+class TestBuildWorkdir(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        write_file(os.path.join(self.root, "tests", "mesh.dat"), "top\n")
+        write_file(os.path.join(self.root, "tests", "_build", "index.html"), "")
+        self.test_dir = os.path.join(self.root, "tests")
+        self.build_root = tempfile.mkdtemp()
+        configure_build_workdirs(self.build_root, linked=[os.path.join(self.test_dir, "_build")])
+
+    def tearDown(self):
+        close_build_workdirs()
+        shutil.rmtree(self.root)
+
+    def test_kept_per_key(self):
+        first = build_workdir(self.test_dir, "test_a.py")
+        write_file(os.path.join(first, "cases.sql"), "recorded\n")
+        self.assertEqual(build_workdir(self.test_dir, "test_a.py"), first)
+        self.assertTrue(os.path.isfile(os.path.join(first, "cases.sql")))
+        self.assertTrue(in_build_workdir(os.path.realpath(os.path.join(first, "cases.sql"))))
+
+        second = build_workdir(self.test_dir, "test_b.py")
+        self.assertNotEqual(second, first)
+        self.assertFalse(os.path.exists(os.path.join(second, "cases.sql")))
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "cases.sql")))
+
+    def test_linked_dirs(self):
+        workdir = build_workdir(self.test_dir, "test_a.py")
+        self.assertTrue(os.path.islink(os.path.join(workdir, "_build")))
+        self.assertTrue(os.path.islink(os.path.join(workdir, "mesh.dat")))
+        self.assertFalse(in_build_workdir(os.path.realpath(os.path.join(workdir, "mesh.dat"))))
+
+    def test_closed(self):
+        build_workdir(self.test_dir, "test_a.py")
+        close_build_workdirs()
+        self.assertFalse(os.path.exists(self.build_root))
+        self.assertIsNone(build_workdir(self.test_dir, "test_a.py"))
+        self.assertTrue(os.path.isfile(os.path.join(self.test_dir, "mesh.dat")))
+
+
+if __name__ == "__main__":
+    unittest.main()
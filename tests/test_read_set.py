@@ -0,0 +1,63 @@
+import importlib
+import os
+import unittest
+
+from project import ProjectTestCase, write_file
+from sphinx_mdolab_theme.utils.docutil import run_code
+from sphinx_mdolab_theme.utils.read_set import dependency_reads, track_reads
+
+PATH = "tests_mypkg.test_core.TestCore.test_value"
+CODE = "from mypkg import core\nprint('value is', core.value())\n"
+
+
+class TestReadSet(ProjectTestCase):
+    def run_snippet(self):
+        module = importlib.import_module("tests_mypkg.test_core")
+        reads = []
+        skipped, failed, output = run_code(CODE, PATH, module=module, reads=reads)
+        self.assertFalse(failed, output)
+        return output, reads
+
+    def test_data_file(self):
+        write_file(self.path("data.txt"), "3\n")
+        with track_reads() as reads:
+            with open(self.path("data.txt")) as f:
+                f.read()
+        self.assertIn(os.path.realpath(self.path("data.txt")), reads.files)
+
+    def test_written_files_are_left_out(self):
+        with track_reads() as reads:
+            with open(self.path("out.txt"), "w") as f:
+                f.write("1")
+            with open(self.path("out.txt")) as f:
+                f.read()
+        self.assertNotIn(os.path.realpath(self.path("out.txt")), reads.files)
+        self.assertEqual(reads.outputs, [os.path.realpath(self.path("out.txt"))])
+
+    def test_already_imported_modules(self):
+        # imported before tracking, so the audit hook never sees the helper being loaded
+        importlib.import_module("mypkg.core")
+        self.assertIn(os.path.realpath(self.path("mypkg", "helpers.py")), dependency_reads(PATH))
+
+        output, reads = self.run_snippet()
+        self.assertEqual(output, "value is 1\n")
+        self.assertIn(os.path.realpath(self.path("mypkg", "helpers.py")), reads)
+
+    def test_edited_helper_misses(self):
+        output, reads = self.run_snippet()
+        # the same key, so that only the read set can tell the entry is stale
+        self.cache.put("key", False, False, output, reads=reads)
+        self.assertEqual(self.cache.get("key"), (False, False, "value is 1\n"))
+
+        write_file(
+            self.path("mypkg", "helpers.py"),
+            """
+            def scale(x):
+                return 7 * x
+            """,
+        )
+        self.assertIsNone(self.cache.get("key"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from sphinx_mdolab_theme.ext.timings import write_report
+
+
+class TestReport(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_top_given_as_string(self):
+        record = {
+            "wall": 1.0,
+            "cpu": 1.0,
+            "child_cpu": 0.0,
+            "subprocesses": 0,
+            "peak_child_rss_kb": 0,
+            "cache": None,
+            "docname": "index",
+            "line": 1,
+            "directive": "embed-code",
+        }
+        app = SimpleNamespace(
+            env=SimpleNamespace(mdolab_directive_timings={"index": [record, dict(record, line=2)]}),
+            config=SimpleNamespace(mdolab_directive_report="", mdolab_directive_top="1"),
+            doctreedir=self.root,
+            confdir=self.root,
+        )
+        write_report(app, None)
+        with open(os.path.join(self.root, "directive_timings.json")) as f:
+            self.assertEqual(len(json.load(f)["directives"]), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()